@@ -0,0 +1,110 @@
+"""
+Claim lookup latency against table size.
+
+Compares the old ``ILIKE`` scan over ``user_queries`` with the claim index
+backends. Run from the backend directory:
+
+    python benchmarks/bench_claim_index.py 1000 10000 100000
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from src.database import Base
+from src.models.fact_checking_models import (
+    UserQuery, VerifiedFact, ContentType, VerificationStatus
+)
+from src.services.claim_index import MemoryClaimIndex, SQLiteClaimIndex
+
+VOCABULARY = [f"term{i}" for i in range(5000)]
+LOOKUPS = 50
+
+
+def populate(session, rows: int, rng: random.Random) -> None:
+    queries = []
+    facts = []
+    for i in range(1, rows + 1):
+        words = rng.sample(VOCABULARY, 12)
+        queries.append({"id": i, "content": " ".join(words), "content_type": ContentType.TEXT})
+        facts.append({
+            "id": i,
+            "query_id": i,
+            "status": VerificationStatus.FALSE,
+            "summary": "",
+            "confidence_score": rng.random(),
+        })
+    session.execute(insert(UserQuery), queries)
+    session.execute(insert(VerifiedFact), facts)
+    session.commit()
+
+
+def ilike_lookup(session, keywords):
+    return (
+        session.query(VerifiedFact)
+        .join(UserQuery)
+        .filter(UserQuery.content.ilike(f"%{'%'.join(keywords)}%"))
+        .order_by(VerifiedFact.confidence_score.desc())
+        .limit(1)
+        .all()
+    )
+
+
+def measure(lookup, samples):
+    timings = []
+    for keywords in samples:
+        start = time.perf_counter()
+        lookup(keywords)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(rows: int) -> None:
+    rng = random.Random(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        populate(session, rows, rng)
+
+        # Look up claims that exist so every backend does real ranking work
+        samples = []
+        for _ in range(LOOKUPS):
+            content = session.get(UserQuery, rng.randint(1, rows)).content.split()
+            samples.append(content[:3])
+
+        fts = SQLiteClaimIndex()
+        start = time.perf_counter()
+        fts.rebuild(session)
+        session.commit()
+        fts_build = time.perf_counter() - start
+
+        memory = MemoryClaimIndex()
+        start = time.perf_counter()
+        memory.rebuild(session)
+        memory_build = time.perf_counter() - start
+
+        results = {
+            "ilike scan": measure(lambda kw: ilike_lookup(session, kw), samples),
+            "sqlite fts5": measure(lambda kw: fts.search(session, kw), samples),
+            "memory bm25": measure(lambda kw: memory.search(session, kw), samples),
+        }
+        print(
+            f"{rows:>10} rows | "
+            + " | ".join(f"{name}: {ms:8.3f} ms" for name, ms in results.items())
+            + f" | build fts5 {fts_build:.2f}s, memory {memory_build:.2f}s"
+        )
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,99 @@
+"""
+WEB_SCRIPT text extraction: BeautifulSoup tree vs the streaming extractor.
+
+Pages are generated to look like large news pages: a navigation bar,
+multi-kilobyte inline scripts and JSON, the article, a sidebar and a long
+comment section. Run from the backend directory:
+
+    python benchmarks/bench_html_extract.py 0.5 2 8
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from src.utils.html_extract import extract_main_text
+
+WORDS = (
+    "the vaccine study found no link between the shot and the reported symptoms while "
+    "officials said data from several countries confirmed earlier results published in"
+).split()
+RUNS = 5
+
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25))).capitalize() + "."
+
+
+def make_page(megabytes: float, rng: random.Random) -> str:
+    nav = "".join(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(150))
+    state = json.dumps({"items": [{"id": i, "title": sentence(rng)} for i in range(300)]})
+    parts = [
+        "<!DOCTYPE html><html><head><title>Claim review</title>",
+        f"<script>window.__STATE__ = {state};</script>",
+        "<style>" + ".c{margin:0}" * 2000 + "</style></head>",
+        f'<body class="article-page has-sidebar"><header class="masthead"><nav><ul>{nav}</ul></nav></header>',
+        '<main><article><h1>Claim review</h1>',
+    ]
+    parts += [f"<p>{sentence(rng)} {sentence(rng)}</p>" for _ in range(60)]
+    parts.append('</article></main><aside class="sidebar">')
+    parts += [f'<a href="/popular/{i}">{sentence(rng)}</a>' for i in range(100)]
+    parts.append('</aside><section class="comments">')
+    size = sum(len(part) for part in parts)
+    target = int(megabytes * 2**20)
+    while size < target:
+        comment = f'<div class="comment"><p>{sentence(rng)}</p><script>track({rng.random()})</script></div>'
+        parts.append(comment)
+        size += len(comment)
+    parts.append("</section><footer>(c) Athena</footer></body></html>")
+    return "".join(parts)
+
+
+def soup_text(script: str) -> str:
+    """The previous extract_from_web_script implementation."""
+    soup = BeautifulSoup(script, "html.parser")
+    for element in soup(["script", "style"]):
+        element.decompose()
+    text = soup.get_text(separator=" ", strip=True)
+    return " ".join(text.split())
+
+
+def measure(extract, page: str):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        text = extract(page)
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    extract(page)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak / 2**20, len(text)
+
+
+def run(megabytes: float) -> None:
+    page = make_page(megabytes, random.Random(int(megabytes * 10)))
+    results = {
+        "beautifulsoup": measure(soup_text, page),
+        "streaming": measure(extract_main_text, page),
+        "streaming 10k chars": measure(lambda html: extract_main_text(html, max_chars=10_000), page),
+    }
+    print(
+        f"{len(page) / 2**20:6.1f} MB page | "
+        + " | ".join(
+            f"{name}: {ms:8.1f} ms, peak {mb:6.1f} MB, {chars} chars"
+            for name, (ms, mb, chars) in results.items()
+        )
+    )
+
+
+if __name__ == "__main__":
+    sizes = [float(arg) for arg in sys.argv[1:]] or [0.5, 2, 8]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,67 @@
+"""
+Keyword extraction throughput: per-document loop vs ``nlp.pipe``.
+
+Needs the spaCy model and NLTK's punkt and stopwords data. Run from the
+backend directory:
+
+    python benchmarks/bench_keywords.py 2000
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.nlp_models import models
+from src.services.text_processor import TextProcessor, keyword_cache
+
+SUBJECTS = ["The WHO", "NASA", "The European Union", "Pfizer", "The city of Chicago", "Elon Musk"]
+CLAIMS = [
+    "confirmed that 5G towers spread the virus",
+    "announced a ban on cash payments from January",
+    "said tap water in London contains fluoride at unsafe levels",
+    "admitted the moon landing footage was filmed in Nevada",
+    "reported that vaccines alter human DNA",
+]
+
+
+def make_texts(count: int, rng: random.Random):
+    return [
+        f"{rng.choice(SUBJECTS)} {rng.choice(CLAIMS)}, according to a post shared {rng.randint(2, 90)} thousand times."
+        for _ in range(count)
+    ]
+
+
+async def loop(processor: TextProcessor, texts):
+    return [await processor.extract_keywords(text) for text in texts]
+
+
+def run(count: int) -> None:
+    texts = make_texts(count, random.Random(count))
+    models.warmup()
+    processor = TextProcessor()
+
+    # Every run starts cold; otherwise later ones would only measure cache hits
+    keyword_cache.clear()
+    start = time.perf_counter()
+    expected = asyncio.run(loop(processor, texts))
+    results = {"per-document": count / (time.perf_counter() - start)}
+
+    for batch_size, n_process in [(64, 1), (256, 1), (256, 2), (256, 4)]:
+        keyword_cache.clear()
+        start = time.perf_counter()
+        batched = asyncio.run(processor.extract_keywords_batch(
+            texts, batch_size=batch_size, n_process=n_process
+        ))
+        results[f"pipe b={batch_size} p={n_process}"] = count / (time.perf_counter() - start)
+        assert batched == expected, "batched keywords differ from the per-document loop"
+
+    print(f"{count:>8} docs | " + " | ".join(f"{name}: {rate:8.0f} docs/s" for name, rate in results.items()))
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [500, 5_000]
+    for size in sizes:
+        run(size)
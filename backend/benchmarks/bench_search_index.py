@@ -0,0 +1,87 @@
+"""
+Local BM25 search: indexing throughput, merging and top-k query latency.
+
+Documents are synthetic pages over a Zipf-distributed vocabulary, so a few
+terms have very long postings as in real text. Queries mix common and rare
+terms like claim texts do. Run from the backend directory:
+
+    python benchmarks/bench_search_index.py 100000 1000000
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from src.services.search_index import BM25Index
+
+VOCABULARY_SIZE = 50000
+QUERIES = 200
+
+
+def vocabulary():
+    return [f"w{i}" for i in range(VOCABULARY_SIZE)]
+
+
+def documents(count: int, words, rng: np.random.Generator):
+    # Zipf ranks, clipped to the vocabulary
+    for i in range(count):
+        ranks = np.minimum(rng.zipf(1.2, size=int(rng.integers(50, 400))), VOCABULARY_SIZE) - 1
+        yield {
+            "url": f"https://news.example/{i}",
+            "title": f"Article {i}",
+            "content": " ".join(words[rank] for rank in ranks),
+            "domain": "news.example",
+        }
+
+
+def run(count: int) -> None:
+    words = vocabulary()
+    rng = np.random.default_rng(count)
+    with tempfile.TemporaryDirectory() as path:
+        index = BM25Index(path)
+        start = time.perf_counter()
+        index.add_documents(documents(count, words, rng))
+        index.commit()
+        build = time.perf_counter() - start
+        segments = index.stats()["segments"]
+
+        queries = [
+            " ".join(words[min(int(rank), VOCABULARY_SIZE) - 1] for rank in rng.zipf(1.3, size=random.randint(3, 8)))
+            for _ in range(QUERIES)
+        ]
+
+        def latencies():
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query, k=10)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            return statistics.median(timings), timings[int(len(timings) * 0.95)]
+
+        before = latencies()
+        start = time.perf_counter()
+        index.merge()
+        merge = time.perf_counter() - start
+        after = latencies()
+        size = sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+        )
+        print(
+            f"{count:9d} docs | build {count / build:7.0f} docs/s, {segments} segments, "
+            f"{size / 2**20:7.1f} MB | query p50 {before[0]:6.1f} ms p95 {before[1]:6.1f} ms | "
+            f"merge {merge:6.1f} s | merged query p50 {after[0]:6.1f} ms p95 {after[1]:6.1f} ms"
+        )
+        index.close()
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    counts = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    for count in counts:
+        run(count)
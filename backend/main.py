@@ -1,8 +1,20 @@
+import asyncio
+import logging
+import os
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from src.api.misinformation import router as misinformation_router
 from src.api.education import router as education_router
+from src.database import engine
+from src.services.nlp_models import models
+from src.services.text_processor import warm_worker
+from src.utils.executors import executors
+from src.services.write_behind import start_query_log, stop_query_log
+from src.services.domain_reputation import start_domain_reputation, stop_domain_reputation
+from src.services.search_index import close_default_search_backend
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Athena API", version="1.0.0")
 
@@ -19,6 +31,30 @@ app.add_middleware(
 app.include_router(misinformation_router, prefix="/api/misinformation", tags=["misinformation"])
 app.include_router(education_router, prefix="/api/education", tags=["education"])
 
+@app.on_event("startup")
+async def startup():
+    # Batch UserQuery inserts off the request path
+    await start_query_log(engine)
+    # Source credibility from credible_sources, refreshed in the background
+    await start_domain_reputation(engine)
+    # CPU-bound NLP and parsing run in worker processes that load the models once
+    executors.start(initializer=warm_worker if os.getenv("NLP_WARMUP", "1") == "1" else None)
+    if executors.process_workers == 0 and os.getenv("NLP_WARMUP", "1") == "1":
+        # No worker processes, so the shared spaCy pipeline lives in this one
+        try:
+            await asyncio.to_thread(models.warmup)
+        except OSError as e:
+            logger.error(f"NLP warmup failed: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Flush (or spill) queued rows before the worker exits
+    await stop_query_log()
+    await stop_domain_reputation()
+    # Pages still waiting for the background search index commit
+    await close_default_search_backend()
+    executors.shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Athena API"}
@@ -1,6 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
+import json
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Optional
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..models.fact_checking_models import ContentType
+from ..services.fact_checking_service import AsyncFactCheckingService
 
 router = APIRouter()
 
@@ -28,3 +34,39 @@ async def analyze_text(request: AnalysisRequest):
             {"title": "Source 1", "url": "https://example.com/source1"}
         ]
     }
+
+def _encode_event(event: Dict, ndjson: bool) -> str:
+    """One NDJSON line, or one SSE message named after the event."""
+    if ndjson:
+        return json.dumps(event, default=str) + "\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+@router.post("/analyze/stream")
+async def analyze_text_stream(
+    request: AnalysisRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Analyze text, sending each pipeline stage as soon as it finishes
+
+    Responds with Server-Sent Events, or newline-delimited JSON when the
+    client accepts ``application/x-ndjson``.
+    """
+    ndjson = "application/x-ndjson" in http_request.headers.get("accept", "")
+    service = AsyncFactCheckingService(db)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in service.stream_query(request.text, ContentType.TEXT):
+                yield _encode_event(event, ndjson)
+        except Exception:
+            # Headers are already sent, so the failure has to travel in-band
+            yield _encode_event({"event": "error", "data": {"detail": "Analysis failed"}}, ndjson)
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
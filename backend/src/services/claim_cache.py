@@ -0,0 +1,170 @@
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+FINGERPRINT_BITS = 64
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_claim(text: str) -> List[str]:
+    """Lowercase the claim and reduce it to its word tokens."""
+    return _WORD_RE.findall(text.lower()) if text else []
+
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of a claim over its words and word bigrams.
+
+    Claims that differ by a few words end up a small Hamming distance apart.
+    """
+    words = normalize_claim(text)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+    weights = [0] * FINGERPRINT_BITS
+    for feature in features:
+        value = _feature_hash(feature)
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def similarity(a: int, b: int) -> float:
+    """Share of fingerprint bits two SimHashes agree on."""
+    return 1 - bin(a ^ b).count("1") / FINGERPRINT_BITS
+
+
+@dataclass
+class _Entry:
+    fingerprint: int
+    verdict: Dict
+    stored_at: float
+
+
+class NearDuplicateCache:
+    """Bounded LRU cache of verdicts keyed by SimHash fingerprints.
+
+    Fingerprints are split into bands (LSH) so candidates are found without
+    comparing against every entry. With ``max_distance + 1`` bands, any two
+    fingerprints within ``max_distance`` bits share at least one band exactly.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        max_entries: int = 10000,
+        ttl: Optional[float] = 3600.0
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = int(FINGERPRINT_BITS * (1 - threshold) + 1e-9)
+        band_count = min(self.max_distance + 1, FINGERPRINT_BITS)
+        width = FINGERPRINT_BITS / band_count
+        self._bands: List[Tuple[int, int]] = []
+        for band in range(band_count):
+            start = round(band * width)
+            end = round((band + 1) * width)
+            self._bands.append((start, (1 << (end - start)) - 1))
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, int], Set[int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, fingerprint: int):
+        for index, (shift, mask) in enumerate(self._bands):
+            yield index, fingerprint >> shift & mask
+
+    def get(self, text: str) -> Optional[Dict]:
+        """Return a copy of the verdict stored for a near-duplicate claim."""
+        fingerprint = simhash(text)
+        now = time.monotonic()
+        with self._lock:
+            best = None
+            best_distance = self.max_distance + 1
+            candidates = set()
+            for key in self._band_keys(fingerprint):
+                candidates.update(self._buckets.get(key, ()))
+            for candidate in candidates:
+                distance = bin(candidate ^ fingerprint).count("1")
+                if distance < best_distance:
+                    best, best_distance = candidate, distance
+            entry = self._entries.get(best) if best is not None else None
+            if entry is not None and self.ttl is not None and now - entry.stored_at > self.ttl:
+                self._remove(entry.fingerprint)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry.fingerprint)
+            self.hits += 1
+            return copy.deepcopy(entry.verdict)
+
+    def put(self, text: str, verdict: Dict) -> None:
+        """Store the verdict for a claim, evicting the least recently used entries."""
+        fingerprint = simhash(text)
+        with self._lock:
+            if fingerprint in self._entries:
+                self._remove(fingerprint)
+            self._entries[fingerprint] = _Entry(fingerprint, copy.deepcopy(verdict), time.monotonic())
+            for key in self._band_keys(fingerprint):
+                self._buckets.setdefault(key, set()).add(fingerprint)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, fingerprint: int) -> None:
+        self._entries.pop(fingerprint, None)
+        for key in self._band_keys(fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del self._buckets[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict:
+        """Counters for tuning the similarity threshold."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+claim_cache = NearDuplicateCache(
+    threshold=float(os.getenv("CLAIM_CACHE_THRESHOLD", "0.9")),
+    max_entries=int(os.getenv("CLAIM_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CLAIM_CACHE_TTL", "3600")) or None,
+)
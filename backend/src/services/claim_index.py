@@ -0,0 +1,492 @@
+import logging
+import math
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from weakref import WeakKeyDictionary
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from ..utils.nlp_resources import stemmer
+
+logger = logging.getLogger(__name__)
+
+_TERM_RE = re.compile(r"[a-z0-9]+")
+
+# Rows joined the same way the old ILIKE lookup matched them: a verified fact is
+# found through the text of the query it answers, plus its own summary.
+_INDEXABLE_FACTS = text(
+    "SELECT vf.id, uq.content, vf.summary "
+    "FROM verified_facts vf JOIN user_queries uq ON uq.id = vf.query_id"
+)
+_INDEXABLE_COUNT = text(
+    "SELECT count(*) "
+    "FROM verified_facts vf JOIN user_queries uq ON uq.id = vf.query_id"
+)
+
+
+def index_terms(text: str) -> List[str]:
+    """Split text into the lowercase alphanumeric terms used by the indexes."""
+    return _TERM_RE.findall(text.lower()) if text else []
+
+
+@lru_cache(maxsize=100000)
+def _stem(term: str) -> str:
+    return stemmer().stem(term)
+
+
+def claim_terms(text: str) -> List[str]:
+    """``index_terms`` reduced to their Porter stems, so "vaccines" finds "vaccine"."""
+    return [_stem(term) for term in index_terms(text)]
+
+
+def claim_body(query_content: Optional[str], summary: Optional[str]) -> str:
+    """Build the indexed body for a verified fact."""
+    return " ".join(part for part in (query_content, summary) if part)
+
+
+def _engine(db: Session) -> Engine:
+    engine = db.get_bind()
+    return getattr(engine, "engine", engine)
+
+
+class ClaimIndex(ABC):
+    """Relevance-ranked lookup of verified facts by claim text.
+
+    Implementations map a verified fact id to the text of the claim it answers
+    and return candidate fact ids, best match first. All methods take the
+    caller's session so index writes share the transaction of the rows they
+    describe.
+    """
+
+    def terms(self, text: str) -> List[str]:
+        """The terms a body or keyword is indexed and looked up under."""
+        return claim_terms(text)
+
+    def _unique_terms(self, keywords: Iterable[str]) -> List[str]:
+        terms = []
+        for keyword in keywords:
+            for term in self.terms(keyword):
+                if term not in terms:
+                    terms.append(term)
+        return terms
+
+    def add(self, db: Session, fact_id: int, body: str) -> None:
+        """Index (or re-index) a single verified fact."""
+        self.add_many(db, [(fact_id, body)])
+
+    @abstractmethod
+    def add_many(self, db: Session, entries: Iterable[Tuple[int, str]]) -> None:
+        """Index (or re-index) ``(fact_id, body)`` pairs."""
+
+    def search(
+        self,
+        db: Session,
+        keywords: Sequence[str],
+        limit: int = 10,
+        match_all: bool = True
+    ) -> List[Tuple[int, float]]:
+        """Return ``(fact_id, score)`` pairs ordered by descending relevance.
+
+        With ``match_all`` every keyword term has to occur in the claim, which
+        keeps the old all-keywords match semantics; otherwise any term matches.
+        """
+        return self.search_many(db, [keywords], limit, match_all)[0]
+
+    def search_many(
+        self,
+        db: Session,
+        keyword_lists: Sequence[Sequence[str]],
+        limit: int = 10,
+        match_all: bool = True
+    ) -> List[List[Tuple[int, float]]]:
+        """Run one lookup per keyword list, returning the results in order."""
+        pending = []
+        for position, keywords in enumerate(keyword_lists):
+            terms = self._unique_terms(keywords)
+            if terms:
+                pending.append((position, terms))
+        found = self._search_many(db, pending, limit, match_all) if pending else {}
+        return [found.get(position, []) for position in range(len(keyword_lists))]
+
+    @abstractmethod
+    def _search_many(
+        self,
+        db: Session,
+        pending: List[Tuple[int, List[str]]],
+        limit: int,
+        match_all: bool
+    ) -> Dict[int, List[Tuple[int, float]]]:
+        """Ranked results for each ``(position, terms)`` lookup, keyed by position."""
+
+    def rebuild(self, db: Session) -> int:
+        """Re-index every verified fact and return the number of rows indexed."""
+        rows = db.execute(_INDEXABLE_FACTS).all()
+        self.clear(db)
+        self.add_many(db, ((row[0], claim_body(row[1], row[2])) for row in rows))
+        return len(rows)
+
+    @abstractmethod
+    def clear(self, db: Session) -> None:
+        """Remove every entry."""
+
+
+class MemoryClaimIndex(ClaimIndex):
+    """In-process inverted term index ranked with BM25.
+
+    Used for databases without a native full-text engine. The index is built
+    from the database on first use and then kept up to date incrementally.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add_many(self, db: Session, entries: Iterable[Tuple[int, str]]) -> None:
+        self._ensure_loaded(db)
+        with self._lock:
+            for fact_id, body in entries:
+                self._remove(fact_id)
+                terms = self.terms(body)
+                counts: Dict[str, int] = defaultdict(int)
+                for term in terms:
+                    counts[term] += 1
+                for term, count in counts.items():
+                    self._postings[term][fact_id] = count
+                self._doc_terms[fact_id] = tuple(counts)
+                self._lengths[fact_id] = len(terms)
+                self._total_length += len(terms)
+
+    def _remove(self, fact_id: int) -> None:
+        length = self._lengths.pop(fact_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._doc_terms.pop(fact_id, ()):
+            postings = self._postings[term]
+            postings.pop(fact_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def clear(self, db: Session) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._lengths.clear()
+            self._total_length = 0
+
+    def rebuild(self, db: Session) -> int:
+        with self._lock:
+            self._loaded = True
+            return super().rebuild(db)
+
+    def _ensure_loaded(self, db: Session) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                count = self.rebuild(db)
+                logger.info(f"Loaded {count} verified facts into the claim index")
+
+    def _search_many(
+        self,
+        db: Session,
+        pending: List[Tuple[int, List[str]]],
+        limit: int,
+        match_all: bool
+    ) -> Dict[int, List[Tuple[int, float]]]:
+        self._ensure_loaded(db)
+        return {
+            position: self._search(terms, limit, match_all)
+            for position, terms in pending
+        }
+
+    def _search(self, terms: List[str], limit: int, match_all: bool) -> List[Tuple[int, float]]:
+        with self._lock:
+            postings = [self._postings.get(term, {}) for term in terms]
+            if match_all:
+                if not all(postings):
+                    return []
+                # Intersect starting from the rarest term
+                candidates = set(min(postings, key=len))
+                for plist in postings:
+                    candidates.intersection_update(plist)
+            else:
+                candidates = set()
+                for plist in postings:
+                    candidates.update(plist)
+            if not candidates:
+                return []
+
+            doc_count = len(self._lengths)
+            avg_length = self._total_length / doc_count if doc_count else 0.0
+            scores = dict.fromkeys(candidates, 0.0)
+            for plist in postings:
+                if not plist:
+                    continue
+                idf = math.log(1 + (doc_count - len(plist) + 0.5) / (len(plist) + 0.5))
+                for fact_id in candidates:
+                    tf = plist.get(fact_id)
+                    if tf:
+                        norm = 1 - self.b + self.b * self._lengths[fact_id] / (avg_length or 1)
+                        scores[fact_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:limit]
+
+
+class _SQLClaimIndex(ClaimIndex, ABC):
+    """Shared plumbing for the database-native full-text backends."""
+
+    table = ""
+    # Lookups per statement; SQLite caps compound SELECTs at 500 terms
+    batch_size = 200
+
+    def __init__(self):
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _create_table(self, conn: Connection) -> None:
+        """Create the table if it is missing; safe to run concurrently."""
+
+    @abstractmethod
+    def _write(self, db: Union[Session, Connection], rows: List[Dict]) -> None:
+        """Index ``{"id", "body"}`` rows, replacing earlier entries for their ids."""
+
+    def _ensure_table(self, db: Session) -> None:
+        """Create and backfill the table once per process.
+
+        When the caller's session has no transaction open, the work runs
+        and commits on a connection of its own. Otherwise it joins that
+        transaction: a second connection would wait on the locks the session
+        holds (SQLite's write lock, for one). The index is marked ready only
+        once the work is committed, so a rolled back setup is redone. A
+        table holding fewer rows than there are verified facts (e.g. one
+        whose backfill was lost) is backfilled again.
+        """
+        if self._ready:
+            return
+        with self._lock:
+            if self._ready:
+                return
+            if db.in_transaction():
+                if db.info.get(self):
+                    # Already set up in this transaction
+                    return
+                self._set_up(db.connection())
+                db.info[self] = True
+                if not event.contains(db, "after_commit", self._mark_ready):
+                    event.listen(db, "after_commit", self._mark_ready)
+                    event.listen(db, "after_rollback", self._forget_setup)
+                return
+            with _engine(db).begin() as conn:
+                self._set_up(conn)
+            self._ready = True
+
+    def _mark_ready(self, session: Session) -> None:
+        if session.info.pop(self, False):
+            self._ready = True
+
+    def _forget_setup(self, session: Session) -> None:
+        session.info.pop(self, None)
+
+    def _set_up(self, conn: Connection) -> None:
+        self._create_table(conn)
+        indexed = conn.execute(text(f"SELECT count(*) FROM {self.table}")).scalar()
+        if indexed < conn.execute(_INDEXABLE_COUNT).scalar():
+            rows = conn.execute(_INDEXABLE_FACTS).all()
+            conn.execute(text(f"DELETE FROM {self.table}"))
+            self._write(conn, [
+                {"id": row[0], "body": claim_body(row[1], row[2])} for row in rows
+            ])
+            logger.info(f"Indexed {len(rows)} verified facts in {self.table}")
+
+    def add_many(self, db: Session, entries: Iterable[Tuple[int, str]]) -> None:
+        self._ensure_table(db)
+        rows = [{"id": fact_id, "body": body} for fact_id, body in entries]
+        if rows:
+            self._write(db, rows)
+
+    def search_many(
+        self,
+        db: Session,
+        keyword_lists: Sequence[Sequence[str]],
+        limit: int = 10,
+        match_all: bool = True
+    ) -> List[List[Tuple[int, float]]]:
+        self._ensure_table(db)
+        return super().search_many(db, keyword_lists, limit, match_all)
+
+    def clear(self, db: Session) -> None:
+        self._ensure_table(db)
+        db.execute(text(f"DELETE FROM {self.table}"))
+
+    @abstractmethod
+    def _match(self, terms: List[str], match_all: bool) -> str:
+        """The full-text query matching ``terms``."""
+
+    @abstractmethod
+    def _select(self, position: int) -> str:
+        """SELECT of ``(claim, fact_id, score)`` for the ``:match<position>`` parameter."""
+
+    def _search_many(
+        self,
+        db: Session,
+        pending: List[Tuple[int, List[str]]],
+        limit: int,
+        match_all: bool
+    ) -> Dict[int, List[Tuple[int, float]]]:
+        self._ensure_table(db)
+        found: Dict[int, List[Tuple[int, float]]] = {}
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            statement = " UNION ALL ".join(
+                f"SELECT * FROM ({self._select(position)}) AS c{position}"
+                for position, _ in chunk
+            )
+            params = {"limit": limit}
+            for position, terms in chunk:
+                params[f"match{position}"] = self._match(terms, match_all)
+            for claim, fact_id, score in db.execute(text(statement), params):
+                found.setdefault(claim, []).append((fact_id, float(score)))
+        for ranked in found.values():
+            ranked.sort(key=lambda item: item[1], reverse=True)
+        return found
+
+
+class SQLiteClaimIndex(_SQLClaimIndex):
+    """Claim index backed by an SQLite FTS5 virtual table.
+
+    Bodies are stored as their ``claim_terms``, so FTS5 matches exactly the
+    terms MemoryClaimIndex would.
+    """
+
+    table = "verified_fact_terms"
+
+    def _create_table(self, conn: Connection) -> None:
+        # The earlier table stemmed with FTS5's own porter tokenizer
+        conn.execute(text("DROP TABLE IF EXISTS verified_fact_fts"))
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            "USING fts5(body, tokenize='unicode61')"
+        ))
+
+    def _write(self, db: Union[Session, Connection], rows: List[Dict]) -> None:
+        if rows:
+            rows = [{"id": row["id"], "body": " ".join(self.terms(row["body"]))} for row in rows]
+            db.execute(text(f"DELETE FROM {self.table} WHERE rowid = :id"), rows)
+            db.execute(
+                text(f"INSERT INTO {self.table} (rowid, body) VALUES (:id, :body)"),
+                rows
+            )
+
+    def _match(self, terms: List[str], match_all: bool) -> str:
+        operator = " AND " if match_all else " OR "
+        return operator.join(f'"{term}"' for term in terms)
+
+    def _select(self, position: int) -> str:
+        # bm25() is negative with lower meaning better, so flip the sign
+        return (
+            f"SELECT {position} AS claim, rowid AS fact_id, -bm25({self.table}) AS score "
+            f"FROM {self.table} WHERE {self.table} MATCH :match{position} "
+            "ORDER BY score DESC LIMIT :limit"
+        )
+
+
+class PostgresClaimIndex(_SQLClaimIndex):
+    """Claim index backed by a GIN-indexed ``tsvector`` column."""
+
+    table = "verified_fact_search"
+
+    def __init__(self, config: str = "english"):
+        super().__init__()
+        self.config = config
+
+    def terms(self, text: str) -> List[str]:
+        # to_tsvector and to_tsquery stem with the text search config
+        return index_terms(text)
+
+    def _create_table(self, conn: Connection) -> None:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "fact_id INTEGER PRIMARY KEY, body TSVECTOR NOT NULL)"
+        ))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{self.table}_body "
+            f"ON {self.table} USING GIN (body)"
+        ))
+
+    def _write(self, db: Union[Session, Connection], rows: List[Dict]) -> None:
+        if rows:
+            db.execute(
+                text(
+                    f"INSERT INTO {self.table} (fact_id, body) "
+                    f"VALUES (:id, to_tsvector('{self.config}', :body)) "
+                    "ON CONFLICT (fact_id) DO UPDATE SET body = EXCLUDED.body"
+                ),
+                rows
+            )
+
+    def _match(self, terms: List[str], match_all: bool) -> str:
+        return (" & " if match_all else " | ").join(terms)
+
+    def _select(self, position: int) -> str:
+        query = f"to_tsquery('{self.config}', :match{position})"
+        return (
+            f"SELECT {position} AS claim, fact_id, ts_rank(body, {query}) AS score "
+            f"FROM {self.table} WHERE body @@ {query} "
+            "ORDER BY score DESC LIMIT :limit"
+        )
+
+
+_indexes: "WeakKeyDictionary[Engine, ClaimIndex]" = WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def _sqlite_has_fts5() -> bool:
+    # Probe on a scratch connection so the caller's transaction is untouched
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE fts5_probe USING fts5(body)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+def get_claim_index(db: Session) -> ClaimIndex:
+    """Return the process-wide claim index for the session's database.
+
+    SQLite uses FTS5 and PostgreSQL uses ``tsvector`` when available; any
+    other database falls back to the in-memory inverted index.
+    """
+    engine = _engine(db)
+    index = _indexes.get(engine)
+    if index is not None:
+        return index
+    with _indexes_lock:
+        index = _indexes.get(engine)
+        if index is None:
+            dialect = engine.dialect.name
+            if dialect == "sqlite" and _sqlite_has_fts5():
+                index = SQLiteClaimIndex()
+            elif dialect == "postgresql":
+                index = PostgresClaimIndex()
+            else:
+                index = MemoryClaimIndex()
+            _indexes[engine] = index
+    return index
@@ -0,0 +1,23 @@
+import logging
+from typing import Dict, Optional
+from .domain_reputation import DomainReputationIndex, get_domain_reputation
+
+logger = logging.getLogger(__name__)
+
+class CredibilityScorer:
+    def __init__(self, default_score: float = 0.5, reputation: Optional[DomainReputationIndex] = None):
+        self.default_score = default_score
+        self.reputation = reputation if reputation is not None else get_domain_reputation()
+
+    def score_result(self, result: Dict) -> Dict:
+        """Attach a credibility score to a web search result.
+
+        Scores already set by the search backend are kept; anything else is
+        scored by its domain's reputation.
+        """
+        scored = dict(result)
+        score = result.get("credibility_score")
+        if score is None:
+            score = self.reputation.score(result.get("domain") or result.get("url", ""), self.default_score)
+        scored["credibility_score"] = float(score)
+        return scored
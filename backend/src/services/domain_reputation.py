@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+from sqlalchemy import Integer, cast, func, select
+from sqlalchemy.engine import Connection, Engine
+from ..models.fact_checking_models import CredibleSource, ExternalSource
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCORE = 0.5
+# Sources at or above this score are reported as trusted
+TRUSTED_SCORE = float(os.getenv("TRUSTED_SOURCE_SCORE", "0.7"))
+
+# Built-in reputations; rows in credible_sources override them
+SEED_REPUTATIONS: Dict[str, float] = {
+    "reuters.com": 0.9,
+    "apnews.com": 0.9,
+    "ap.org": 0.9,
+    "bbc.com": 0.9,
+    "npr.org": 0.85,
+    "nytimes.com": 0.85,
+    "washingtonpost.com": 0.85,
+    "theguardian.com": 0.85,
+    "factcheck.org": 0.95,
+    "snopes.com": 0.95,
+    "politifact.com": 0.95,
+}
+
+# Multi-label public suffixes for when tldextract is not installed: the
+# common country second-level domains and hosting platforms whose
+# subdomains belong to different owners
+_FALLBACK_SUFFIXES = frozenset({
+    "co.uk", "org.uk", "ac.uk", "gov.uk", "ltd.uk", "me.uk", "net.uk", "nhs.uk",
+    "com.au", "net.au", "org.au", "edu.au", "gov.au", "co.nz", "org.nz", "govt.nz",
+    "co.jp", "ne.jp", "or.jp", "ac.jp", "go.jp", "co.kr", "co.in", "gov.in",
+    "co.za", "com.br", "com.cn", "com.hk", "com.sg", "com.tw", "com.mx", "com.ar",
+    "com.tr", "blogspot.com", "github.io", "herokuapp.com", "appspot.com",
+    "netlify.app", "pages.dev", "azurewebsites.net", "cloudfront.net",
+})
+
+# Trie key of a node's entry; hostnames never have empty labels
+_ENTRY = ""
+
+
+@dataclass(frozen=True)
+class DomainReputation:
+    domain: str
+    score: float
+    # "credible_source", "whitelisted" or "seed"
+    origin: str
+    name: Optional[str] = None
+
+
+def normalize_host(url_or_host: str) -> str:
+    """Lowercase hostname of a URL or bare host, without port, credentials or trailing dot."""
+    if not url_or_host:
+        return ""
+    text = url_or_host.strip()
+    if "//" not in text:
+        text = "//" + text
+    try:
+        host = (urlsplit(text).hostname or "").rstrip(".")
+    except ValueError:
+        return ""
+    if not host.isascii():
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            pass
+    return "" if ".." in host else host
+
+
+@lru_cache(maxsize=1)
+def _extractor():
+    try:
+        import tldextract
+    except ImportError:
+        logger.info("tldextract is not installed; using the built-in public suffix list")
+        return None
+    # The Public Suffix List snapshot bundled with tldextract; never fetched at runtime
+    return tldextract.TLDExtract(cache_dir=None, suffix_list_urls=(), include_psl_private_domains=True)
+
+
+@lru_cache(maxsize=65536)
+def registrable_domain(host: str) -> str:
+    """The public suffix plus one label: ``news.bbc.co.uk`` -> ``bbc.co.uk``.
+
+    IP addresses, single-label hosts and bare suffixes are returned as is.
+    """
+    extractor = _extractor()
+    if extractor is not None:
+        parts = extractor(host)
+        if parts.suffix:
+            return f"{parts.domain}.{parts.suffix}" if parts.domain else host
+        # Not a listed suffix: the list's default rule is the last label
+    labels = host.split(".")
+    if len(labels) < 2 or host.replace(".", "").isdigit():
+        return host
+    suffix_labels = 1
+    for n in (3, 2):
+        if len(labels) > n and ".".join(labels[-n:]) in _FALLBACK_SUFFIXES:
+            suffix_labels = n
+            break
+    return ".".join(labels[-suffix_labels - 1:])
+
+
+def _build_trie(entries: Iterable[DomainReputation]) -> Tuple[Dict, int]:
+    """Reversed-label trie of entries; later entries for a domain win."""
+    trie: Dict = {}
+    size = 0
+    for entry in entries:
+        domain = normalize_host(entry.domain)
+        if not domain:
+            continue
+        node = trie
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        if _ENTRY not in node:
+            size += 1
+        node[_ENTRY] = DomainReputation(domain, float(entry.score), entry.origin, entry.name)
+    return trie, size
+
+
+class DomainReputationIndex:
+    """Credibility of a host, resolved through its parent domains.
+
+    Domains are stored in a trie keyed by labels from the right
+    (``com`` -> ``reuters``), so ``www.uk.reuters.com`` resolves to the
+    deepest stored entry in one walk over its labels. An entry never crosses
+    a registrable-domain boundary: a score for ``blogspot.com`` or ``co.uk``
+    does not apply to ``someone.blogspot.com`` or ``bbc.co.uk``, which belong
+    to other owners.
+
+    The table is built from the seed list, whitelisted ExternalSource domains
+    and active CredibleSource rows (highest precedence last) and replaced as
+    a whole, so lookups take no lock. ``start`` polls a cheap fingerprint of
+    those tables and rebuilds only when it changes.
+    """
+
+    def __init__(
+        self,
+        entries: Optional[Iterable[DomainReputation]] = None,
+        default_score: float = DEFAULT_SCORE,
+        refresh_interval: float = 60.0
+    ):
+        self.default_score = default_score
+        self.refresh_interval = refresh_interval
+        self._trie, self._size = _build_trie(seed_entries() if entries is None else entries)
+        self._fingerprint: Optional[Tuple] = None
+        self._task: Optional[asyncio.Task] = None
+        self.loaded_at: Optional[float] = None
+        self.refreshes = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def lookup(self, url_or_host: str) -> Optional[DomainReputation]:
+        """The entry covering a URL or host, if any."""
+        host = normalize_host(url_or_host)
+        if not host:
+            return None
+        labels = host.split(".")
+        node = self._trie
+        found = None
+        depth = 0
+        for label in reversed(labels):
+            node = node.get(label)
+            if node is None:
+                break
+            depth += 1
+            entry = node.get(_ENTRY)
+            if entry is not None:
+                found = entry, depth
+        if found is None:
+            return None
+        entry, depth = found
+        if depth < len(labels) and depth <= registrable_domain(host).count("."):
+            # A public suffix (or a platform) vouching for its tenants
+            return None
+        return entry
+
+    def score(self, url_or_host: str, default: Optional[float] = None) -> float:
+        entry = self.lookup(url_or_host)
+        if entry is not None:
+            return entry.score
+        return self.default_score if default is None else default
+
+    def replace(self, entries: Iterable[DomainReputation]) -> None:
+        trie, size = _build_trie(entries)
+        self._trie, self._size = trie, size
+
+    def load(self, engine: Engine) -> bool:
+        """Rebuild from the database if its sources changed; returns whether it did."""
+        with engine.connect() as conn:
+            fingerprint = _fingerprint(conn)
+            if fingerprint == self._fingerprint:
+                return False
+            entries = list(seed_entries()) + list(database_entries(conn))
+        self.replace(entries)
+        self._fingerprint = fingerprint
+        self.loaded_at = time.time()
+        self.refreshes += 1
+        logger.info(f"Loaded {self._size} domain reputations")
+        return True
+
+    async def start(self, engine: Engine) -> None:
+        """Load now, then keep refreshing in the background."""
+        if self._task is not None:
+            return
+        await self._refresh(engine)
+        self._task = asyncio.create_task(self._run(engine))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, engine: Engine) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self._refresh(engine)
+
+    async def _refresh(self, engine: Engine) -> None:
+        try:
+            await asyncio.to_thread(self.load, engine)
+        except Exception as e:
+            # Keep serving the last table
+            self.errors += 1
+            logger.error(f"Domain reputation refresh failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {
+            "domains": self._size,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "age": None if self.loaded_at is None else time.time() - self.loaded_at,
+        }
+
+
+def seed_entries() -> Iterator[DomainReputation]:
+    for domain, score in SEED_REPUTATIONS.items():
+        yield DomainReputation(domain, score, "seed")
+
+
+def database_entries(conn: Connection) -> Iterator[DomainReputation]:
+    """Whitelisted external domains (best score per domain), then active credible sources."""
+    whitelisted = (
+        select(ExternalSource.domain, func.max(ExternalSource.credibility_score))
+        .where(ExternalSource.is_whitelisted.is_(True))
+        .group_by(ExternalSource.domain)
+    )
+    for domain, score in conn.execute(whitelisted):
+        if domain and score is not None:
+            yield DomainReputation(domain, score, "whitelisted")
+    credible = (
+        select(CredibleSource.domain, CredibleSource.credibility_score, CredibleSource.name)
+        .where(CredibleSource.is_active.is_(True))
+    )
+    for domain, score, name in conn.execute(credible):
+        if domain:
+            yield DomainReputation(domain, 1.0 if score is None else score, "credible_source", name)
+
+
+def _fingerprint(conn: Connection) -> Tuple:
+    """Aggregates that change whenever a row feeding the index is added, edited or removed."""
+    credible = conn.execute(select(
+        func.count(),
+        func.max(CredibleSource.id),
+        func.max(CredibleSource.last_verified),
+        func.sum(CredibleSource.credibility_score),
+        func.sum(cast(CredibleSource.is_active, Integer)),
+    )).one()
+    whitelisted = conn.execute(
+        select(
+            func.count(),
+            func.max(ExternalSource.id),
+            func.max(ExternalSource.last_checked),
+            func.sum(ExternalSource.credibility_score),
+        ).where(ExternalSource.is_whitelisted.is_(True))
+    ).one()
+    return tuple(credible) + tuple(whitelisted)
+
+
+_reputation: Optional[DomainReputationIndex] = None
+
+
+def get_domain_reputation() -> DomainReputationIndex:
+    """The process-wide index (seed entries only until ``start_domain_reputation``)."""
+    global _reputation
+    if _reputation is None:
+        _reputation = DomainReputationIndex(
+            refresh_interval=float(os.getenv("DOMAIN_REPUTATION_REFRESH", "60"))
+        )
+    return _reputation
+
+
+async def start_domain_reputation(engine: Engine) -> DomainReputationIndex:
+    index = get_domain_reputation()
+    await index.start(engine)
+    return index
+
+
+async def stop_domain_reputation() -> None:
+    if _reputation is not None:
+        await _reputation.stop()
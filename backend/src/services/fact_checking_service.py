@@ -1,23 +1,58 @@
+import asyncio
+import copy
+import hashlib
 import logging
-from typing import Dict, List, Optional, Union
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, TypeVar, Union
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from ..models.fact_checking_models import (
     UserQuery, VerifiedFact, CredibleSource, ExternalSource,
     ContentType, VerificationStatus, SourceType
 )
 from .text_processor import TextProcessor
-from .web_searcher import WebSearcher
+from .web_searcher import PAGE_MAX_CHARS, WebSearcher
 from .credibility_scorer import CredibilityScorer
+from .claim_index import claim_body, get_claim_index
+from .claim_cache import NearDuplicateCache, claim_cache as default_claim_cache, normalize_claim
+from .write_behind import WriteBehindQueue, get_query_log
+from ..utils.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Shared by every service instance in the process so identical in-flight claims coalesce
+query_flight = SingleFlight()
+
+def coalescing_key(content: str, content_type: ContentType) -> str:
+    """Hash of the normalized claim used to coalesce identical requests."""
+    # Media inputs are file paths, which must match exactly
+    normalized = " ".join(normalize_claim(content)) if content_type == ContentType.TEXT else content
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{content_type.value}:{digest}"
+
+def _event(name: str, data: Dict) -> Dict:
+    return {"event": name, "data": data}
+
 class FactCheckingService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Session,
+        claim_cache: Optional[NearDuplicateCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        query_log: Optional[WriteBehindQueue] = None
+    ):
         self.db = db
         self.text_processor = TextProcessor()
         self.web_searcher = WebSearcher()
         self.credibility_scorer = CredibilityScorer()
+        self.claim_index = get_claim_index(db)
+        self.claim_cache = default_claim_cache if claim_cache is None else claim_cache
+        self.single_flight = query_flight if single_flight is None else single_flight
+        self.query_log = get_query_log() if query_log is None else query_log
     
     async def process_query(
         self,
@@ -28,55 +63,268 @@ class FactCheckingService:
     ) -> Dict:
         """
         Main method to process a user query through the fact-checking pipeline.
+        
+        Every submission is recorded under its own query id. Identical claims
+        submitted while one is already being processed then wait for that
+        run's pipeline and get a copy of its verdict instead of starting their
+        own web search and database writes; stored facts reference the query
+        that ran it, as in ``process_queries``. The shared run has a session
+        of its own, since it can outlive the request that started it.
         """
+        # 1. Record the user query
+        query_id = await self._log_query(content, content_type, original_format, user_id)
+        key = coalescing_key(content, content_type)
+        response = copy.deepcopy(await self.single_flight.do(
+            key,
+            lambda: self._process_query(query_id, content, content_type)
+        ))
+        response["query_id"] = query_id
+        return response
+    
+    async def _process_query(self, query_id: int, content: str, content_type: ContentType) -> Dict:
+        """Run a recorded query through the pipeline on a new session."""
+        service = copy.copy(self)
+        service.db = self._new_session()
+        try:
+            response = None
+            async for event in service._run_pipeline(query_id, content, content_type):
+                response = event["data"]
+        finally:
+            await service._close_session()
+        # The last event is always the verdict
+        return response
+    
+    async def stream_query(
+        self,
+        content: str,
+        content_type: ContentType,
+        original_format: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Run a query through the pipeline, yielding an event as each stage finishes.
+        
+        Events are ``{"event": name, "data": payload}`` dicts: ``query`` once
+        the query is recorded, ``db_match`` for a verified fact, one ``source``
+        per ranked web source, and finally ``verdict`` with the response
+        ``process_query`` would return. Streams are not coalesced.
+        """
+        # 1. Record the user query
+        query_id = await self._log_query(content, content_type, original_format, user_id)
+        yield _event("query", {"query_id": query_id})
+        async for event in self._run_pipeline(query_id, content, content_type):
+            yield event
+    
+    async def _run_pipeline(
+        self,
+        query_id: int,
+        content: str,
+        content_type: ContentType
+    ) -> AsyncIterator[Dict]:
+        """Steps 2-8 of the pipeline for a recorded query, as ``stream_query`` events."""
         try:
-            # 1. Create and store the user query
-            query = UserQuery(
-                content=content,
-                content_type=content_type,
-                original_format=original_format,
-                user_id=user_id
-            )
-            self.db.add(query)
-            self.db.commit()
-            
             # 2. Process the content based on its type
             processed_text = await self._process_content(content, content_type)
             
+            # Reuse the verdict of a near-duplicate claim if we have one
+            cached = self.claim_cache.get(processed_text)
+            if cached is not None:
+                cached["query_id"] = query_id
+                yield _event("verdict", cached)
+                return
+            
             # 3. Check against our database of verified facts
-            db_result = self._check_database(processed_text)
+            db_result = await self._check_database(processed_text)
             
             if db_result and db_result["status"] != VerificationStatus.UNVERIFIED:
                 # If we found a match in our database, return it
-                return self._format_response(query.id, db_result)
+                response = self._format_response(query_id, db_result)
+                yield _event("db_match", copy.deepcopy(response))
+                self.claim_cache.put(processed_text, response)
+                yield _event("verdict", response)
+                return
             
-            # 4. If not found in DB, search the web
-            web_results = await self.web_searcher.search(processed_text)
-            
-            # 5. Score and rank the web results
-            scored_results = [
-                self.credibility_scorer.score_result(result) 
-                for result in web_results
-            ]
-            
-            # 6. Get the most credible results
-            top_results = sorted(
-                scored_results, 
-                key=lambda x: x["credibility_score"], 
-                reverse=True
-            )[:5]  # Get top 5 results
+            # 4-6. If not found in DB, search the web and keep the most credible results
+            top_results = await self._search_web(processed_text)
+            for result in top_results:
+                yield _event("source", self._format_source(result))
             
             # 7. Store the results in our database for future reference
-            self._store_external_sources(top_results, query.id)
+            await self._store_external_sources(top_results, query_id, processed_text)
             
             # 8. Format and return the response
-            return self._format_web_response(query.id, top_results)
+            response = self._format_web_response(query_id, top_results)
+            self.claim_cache.put(processed_text, response)
+            yield _event("verdict", response)
             
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}", exc_info=True)
-            self.db.rollback()
+            await self._run_db(Session.rollback)
+            raise
+    
+    async def process_queries(self, batch: List[Dict]) -> List[Dict]:
+        """
+        Process a batch of user queries, e.g. a backfill or a moderation queue.
+        
+        Each item takes the keyword arguments of ``process_query``. Identical
+        claims go through the pipeline once, the database is checked with one
+        bulk lookup, and every row for the batch is written in a single
+        transaction. Responses are returned in input order.
+        """
+        try:
+            # 1. Record every submission with one bulk insert
+            ids = None
+            if self.query_log is not None:
+                ids = [await self.query_log.ids.anext_id(UserQuery.__table__) for _ in batch]
+            query_ids = await self._run_db(self._record_queries, batch, ids)
+            
+            # 2. Deduplicate claims; the first query of each group owns the stored facts
+            keys = [(item["content_type"], item["content"]) for item in batch]
+            first_query: Dict[Tuple[ContentType, str], int] = {}
+            for key, query_id in zip(keys, query_ids):
+                first_query.setdefault(key, query_id)
+            claims = list(first_query)
+            owners = [first_query[claim] for claim in claims]
+            processed = await asyncio.gather(*(
+                self._process_content(content, content_type)
+                for content_type, content in claims
+            ))
+            
+            responses: Dict[int, Dict] = {}
+            unresolved = []
+            for position, text in enumerate(processed):
+                cached = self.claim_cache.get(text)
+                if cached is not None:
+                    responses[position] = cached
+                else:
+                    unresolved.append(position)
+            
+            # 3. One bulk lookup against our verified facts
+            db_results = await self._check_database_many([processed[p] for p in unresolved])
+            to_search = []
+            for position, db_result in zip(unresolved, db_results):
+                if db_result and db_result["status"] != VerificationStatus.UNVERIFIED:
+                    responses[position] = self._format_response(owners[position], db_result)
+                else:
+                    to_search.append(position)
+            
+            # 4-6. Search the web for the remaining claims concurrently
+            web_results = await asyncio.gather(*(
+                self._search_web(processed[position]) for position in to_search
+            ))
+            for position, top_results in zip(to_search, web_results):
+                responses[position] = self._format_web_response(owners[position], top_results)
+            
+            # 7. Store every source and fact, then commit the batch once
+            await self._run_db(self._write_external_sources, [
+                (owners[position], top_results, processed[position])
+                for position, top_results in zip(to_search, web_results)
+            ])
+            await self.web_searcher.index_pages([
+                result for top_results in web_results for result in top_results
+            ])
+            
+            for position in unresolved:
+                self.claim_cache.put(processed[position], responses[position])
+            
+            # 8. Fan the responses back out to every submission
+            position_of = {claim: position for position, claim in enumerate(claims)}
+            results = []
+            for key, query_id in zip(keys, query_ids):
+                response = dict(responses[position_of[key]])
+                response["query_id"] = query_id
+                results.append(response)
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error processing query batch: {str(e)}", exc_info=True)
+            await self._run_db(Session.rollback)
             raise
     
+    async def _run_db(self, fn: Callable[..., T], *args) -> T:
+        """Run a unit of database work, ``fn(session, *args)``, on this service's session."""
+        return fn(self.db, *args)
+    
+    def _new_session(self) -> Session:
+        """A session on the same database as this service's, for work that outlives a request."""
+        return Session(bind=self.db.get_bind(), autoflush=False)
+    
+    async def _close_session(self) -> None:
+        self.db.close()
+    
+    async def _log_query(
+        self,
+        content: str,
+        content_type: ContentType,
+        original_format: Optional[str],
+        user_id: Optional[str]
+    ) -> int:
+        """Record a UserQuery and return its id.
+        
+        With a write-behind query log the id is allocated up front and the
+        insert is batched in the background, so no commit is waited on here.
+        """
+        if self.query_log is None:
+            return await self._run_db(
+                self._record_query, content, content_type, original_format, user_id
+            )
+        query_id = await self.query_log.ids.anext_id(UserQuery.__table__)
+        self.query_log.enqueue(UserQuery.__table__, {
+            "id": query_id,
+            "content": content,
+            "content_type": content_type,
+            "original_format": original_format,
+            "user_id": user_id,
+            "submitted_at": datetime.utcnow(),
+        })
+        return query_id
+    
+    def _record_query(
+        self,
+        db: Session,
+        content: str,
+        content_type: ContentType,
+        original_format: Optional[str],
+        user_id: Optional[str]
+    ) -> int:
+        """Insert and commit a UserQuery, returning its id."""
+        query = UserQuery(
+            content=content,
+            content_type=content_type,
+            original_format=original_format,
+            user_id=user_id
+        )
+        try:
+            db.add(query)
+            db.flush()
+            query_id = query.id
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return query_id
+    
+    def _record_queries(
+        self,
+        db: Session,
+        batch: List[Dict],
+        ids: Optional[List[int]] = None
+    ) -> List[int]:
+        """Insert UserQuery rows for a batch without committing, returning their ids."""
+        queries = [
+            UserQuery(
+                id=ids[position] if ids else None,
+                content=item["content"],
+                content_type=item["content_type"],
+                original_format=item.get("original_format"),
+                user_id=item.get("user_id")
+            )
+            for position, item in enumerate(batch)
+        ]
+        db.add_all(queries)
+        db.flush()
+        return [query.id for query in queries]
+    
     async def _process_content(
         self, 
         content: str, 
@@ -94,27 +342,68 @@ class FactCheckingService:
         else:
             raise ValueError(f"Unsupported content type: {content_type}")
     
-    def _check_database(self, text: str) -> Optional[Dict]:
+    async def _search_web(self, text: str) -> List[Dict]:
+        """Search the web and return the most credible results."""
+        web_results = await self.web_searcher.search(text)
+        
+        # Score and rank the web results
+        scored_results = [
+            self.credibility_scorer.score_result(result) 
+            for result in web_results
+        ]
+        
+        # Get the most credible results
+        return sorted(
+            scored_results, 
+            key=lambda x: x["credibility_score"], 
+            reverse=True
+        )[:5]  # Get top 5 results
+    
+    async def _extract_keywords_batch(self, texts: List[str]) -> List[List[str]]:
+        """Extract keywords for several texts in one ``nlp.pipe`` pass."""
+        return await self.text_processor.extract_keywords_batch(texts)
+    
+    async def _check_database(self, text: str) -> Optional[Dict]:
         """Check if the text matches any known facts in our database."""
-        # Simple keyword matching - in a real system, you'd use more sophisticated NLP
-        keywords = self.text_processor.extract_keywords(text)
+        return (await self._check_database_many([text]))[0]
+    
+    async def _check_database_many(self, texts: List[str]) -> List[Optional[Dict]]:
+        """Check several texts against known facts with one bulk lookup."""
+        if not texts:
+            return []
+        keyword_lists = await self._extract_keywords_batch(texts)
+        return await self._run_db(self._lookup_facts, keyword_lists)
+    
+    def _lookup_facts(self, db: Session, keyword_lists: List[List[str]]) -> List[Optional[Dict]]:
+        """Find the best matching verified fact for each keyword list."""
+        # Rank candidate facts through the claim index instead of scanning
+        # user_queries; every keyword has to occur in the indexed claim.
+        ranked = self.claim_index.search_many(db, keyword_lists, limit=10)
+        fact_ids = {fact_id for candidates in ranked for fact_id, _ in candidates}
+        if not fact_ids:
+            return [None] * len(keyword_lists)
         
-        # Search for matching facts in the database
-        # This is a simplified example - you'd want to implement more sophisticated search
-        matching_facts = (
-            self.db.query(VerifiedFact)
-            .join(UserQuery)
-            .filter(
-                UserQuery.content.ilike(f"%{'%'.join(keywords)}%")
+        facts = {
+            fact.id: fact
+            for fact in (
+                db.query(VerifiedFact)
+                .options(selectinload(VerifiedFact.source))
+                .filter(VerifiedFact.id.in_(fact_ids))
             )
-            .order_by(VerifiedFact.confidence_score.desc())
-            .limit(1)
-            .all()
-        )
+        }
         
-        if matching_facts:
-            fact = matching_facts[0]
-            return {
+        results = []
+        for candidates in ranked:
+            scores = dict(candidates)
+            matching_facts = [facts[fact_id] for fact_id in scores if fact_id in facts]
+            if not matching_facts:
+                results.append(None)
+                continue
+            fact = max(
+                matching_facts,
+                key=lambda f: (scores[f.id], f.confidence_score or 0.0)
+            )
+            results.append({
                 "status": fact.status,
                 "summary": fact.summary,
                 "details": fact.details,
@@ -122,48 +411,153 @@ class FactCheckingService:
                 "source": fact.source.name if fact.source else None,
                 "source_type": fact.source.source_type if fact.source else None,
                 "verified_at": fact.verified_at
-            }
-        return None
+            })
+        return results
     
-    def _store_external_sources(
+    async def _store_external_sources(
         self, 
         results: List[Dict], 
-        query_id: int
+        query_id: int,
+        claim_text: Optional[str] = None
     ) -> None:
         """Store external sources in the database for future reference."""
-        for result in results:
-            # Check if source already exists
-            source = (
-                self.db.query(ExternalSource)
-                .filter_by(url=result["url"])
-                .first()
+        if not results:
+            return
+        # The facts reference the query, so write it now if it is still queued
+        query_rows = []
+        if self.query_log is not None:
+            pending = await self.query_log.take(UserQuery.__table__, query_id)
+            if pending is not None:
+                query_rows.append(pending)
+        try:
+            await self._run_db(
+                self._write_external_sources, [(query_id, results, claim_text)], query_rows
             )
-            
-            if not source:
-                source = ExternalSource(
-                    url=result["url"],
-                    domain=result.get("domain"),
-                    title=result.get("title"),
-                    content=result.get("content", "")[:4000],  # Truncate if too long
-                    content_type=result.get("content_type"),
-                    credibility_score=result["credibility_score"],
-                    last_checked=datetime.utcnow()
+        except Exception:
+            # The query was only taken for this transaction; queue it again
+            for row in query_rows:
+                self.query_log.restore(UserQuery.__table__, row)
+            raise
+        # Stored sources become searchable offline; unchanged pages are skipped
+        await self.web_searcher.index_pages(results)
+    
+    def _write_external_sources(
+        self,
+        db: Session,
+        entries: List[Tuple[int, List[Dict], Optional[str]]],
+        query_rows: Optional[List[Dict]] = None
+    ) -> None:
+        """Persist sources and facts for the entries and commit."""
+        if query_rows:
+            db.execute(insert(UserQuery), query_rows)
+        self._persist_external_sources(db, entries)
+        db.commit()
+    
+    def _persist_external_sources(
+        self,
+        db: Session,
+        entries: List[Tuple[int, List[Dict], Optional[str]]]
+    ) -> None:
+        """Write sources and facts for ``(query_id, results, claim_text)`` entries without committing.
+        
+        Issues a fixed number of statements however many results there are: one
+        ``IN`` prefetch, one bulk upsert of the unknown sources and one bulk
+        insert of the facts (plus the claim index update). Databases without
+        multi-row RETURNING get one INSERT per new row instead.
+        """
+        urls = {result["url"] for _, results, _ in entries for result in results}
+        if not urls:
+            return
+        
+        # Fetch every already known source in one query
+        source_ids = dict(
+            db.query(ExternalSource.url, ExternalSource.id)
+            .filter(ExternalSource.url.in_(urls))
+            .all()
+        )
+        
+        now = datetime.utcnow()
+        new_sources = {}
+        for _, results, _ in entries:
+            for result in results:
+                if result["url"] in source_ids or result["url"] in new_sources:
+                    continue
+                new_sources[result["url"]] = {
+                    "url": result["url"],
+                    "domain": result.get("domain"),
+                    "title": result.get("title"),
+                    "content": result.get("content", "")[:PAGE_MAX_CHARS],  # Truncate if too long
+                    "content_type": result.get("content_type"),
+                    "credibility_score": result["credibility_score"],
+                    "last_checked": now,
+                }
+        if new_sources:
+            # A concurrent writer may have added the same URL since the prefetch
+            stmt = self._upsert(db, ExternalSource)
+            if stmt is not None:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ExternalSource.url],
+                    set_={"last_checked": stmt.excluded.last_checked}
                 )
-                self.db.add(source)
-                self.db.flush()  # Get the source ID
-            
-            # Create a verified fact entry (with lower confidence since it's from the web)
-            verified_fact = VerifiedFact(
-                query_id=query_id,
-                source_id=source.id,
-                status=VerificationStatus.UNVERIFIED,  # Needs human review
-                summary=result.get("snippet", "")[:500],
-                confidence_score=result["credibility_score"] * 0.8,  # Reduce confidence for web sources
-                verified_at=datetime.utcnow()
+            else:
+                stmt = insert(ExternalSource)
+            rows = self._insert_many(
+                db, stmt, list(new_sources.values()), ExternalSource.url, ExternalSource.id
             )
-            self.db.add(verified_fact)
+            source_ids.update((url, source_id) for url, source_id in rows)
+        
+        fact_rows = []
+        for query_id, results, _ in entries:
+            for result in results:
+                # Create a verified fact entry (with lower confidence since it's from the web)
+                fact_rows.append({
+                    "query_id": query_id,
+                    "source_id": source_ids[result["url"]],
+                    "status": VerificationStatus.UNVERIFIED,  # Needs human review
+                    "summary": result.get("snippet", "")[:500],
+                    "confidence_score": result["credibility_score"] * 0.8,  # Reduce confidence for web sources
+                    "verified_at": now,
+                })
+        # RETURNING enough to index each fact keeps this a single multi-row INSERT
+        facts = self._insert_many(
+            db, insert(VerifiedFact), fact_rows,
+            VerifiedFact.id, VerifiedFact.query_id, VerifiedFact.summary
+        )
         
-        self.db.commit()
+        # Keep the claim index in step with the new rows, in the same transaction
+        claim_texts = {query_id: claim_text for query_id, _, claim_text in entries}
+        self.claim_index.add_many(
+            db,
+            [
+                (fact_id, claim_body(claim_texts[query_id], summary))
+                for fact_id, query_id, summary in facts
+            ]
+        )
+    
+    def _insert_many(self, db: Session, stmt, rows: List[Dict], *columns) -> List[Tuple]:
+        """Run a multi-row INSERT and return ``columns`` of every inserted row.
+        
+        Uses one INSERT ... RETURNING where the dialect supports it. Elsewhere
+        (e.g. MySQL) each row is inserted on its own and its generated ``id``
+        read from the cursor; other columns then have to be in ``rows``.
+        """
+        if db.get_bind().dialect.insert_executemany_returning:
+            return db.execute(stmt.returning(*columns), rows).all()
+        inserted = []
+        for row in rows:
+            (row_id,) = db.connection().execute(stmt, row).inserted_primary_key
+            values = {**row, "id": row_id}
+            inserted.append(tuple(values[column.key] for column in columns))
+        return inserted
+    
+    def _upsert(self, db: Session, model):
+        """Return a dialect-specific INSERT supporting ON CONFLICT, if there is one."""
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            return postgresql.insert(model)
+        if dialect == "sqlite":
+            return sqlite.insert(model)
+        return None
     
     def _format_response(
         self, 
@@ -185,6 +579,17 @@ class FactCheckingService:
             "is_from_database": True
         }
     
+    def _format_source(self, result: Dict) -> Dict:
+        """Format one scored web result."""
+        return {
+            "title": result.get("title"),
+            "url": result["url"],
+            "snippet": result.get("snippet", "")[:200] + "...",
+            "domain": result.get("domain"),
+            "credibility_score": result["credibility_score"],
+            "content_type": result.get("content_type")
+        }
+    
     def _format_web_response(
         self, 
         query_id: int, 
@@ -195,15 +600,36 @@ class FactCheckingService:
             "query_id": query_id,
             "verification_status": "unverified",
             "summary": "No exact match found in our database. Here are some relevant sources:",
-            "sources": [{
-                "title": r.get("title"),
-                "url": r["url"],
-                "snippet": r.get("snippet", "")[:200] + "...",
-                "domain": r.get("domain"),
-                "credibility_score": r["credibility_score"],
-                "content_type": r.get("content_type")
-            } for r in results],
+            "sources": [self._format_source(r) for r in results],
             "confidence_score": max(r["credibility_score"] for r in results) if results else 0,
             "is_from_database": False,
             "needs_human_review": True
         }
+
+
+class AsyncFactCheckingService(FactCheckingService):
+    """FactCheckingService running on an AsyncSession.
+    
+    Database work goes through ``AsyncSession.run_sync``, so every round-trip
+    awaits the async driver instead of blocking the event loop, and concurrent
+    requests overlap their I/O.
+    """
+    
+    def __init__(
+        self,
+        db: AsyncSession,
+        claim_cache: Optional[NearDuplicateCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        query_log: Optional[WriteBehindQueue] = None
+    ):
+        super().__init__(db.sync_session, claim_cache, single_flight, query_log)
+        self.db = db
+    
+    async def _run_db(self, fn: Callable[..., T], *args) -> T:
+        return await self.db.run_sync(fn, *args)
+    
+    def _new_session(self) -> AsyncSession:
+        return AsyncSession(bind=self.db.bind, autoflush=False, expire_on_commit=False)
+    
+    async def _close_session(self) -> None:
+        await self.db.close()
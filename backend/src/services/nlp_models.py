@@ -0,0 +1,118 @@
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+
+# Keyword extraction only reads doc.ents, so everything but the tokenizer and
+# NER can stay on disk. The lemmatizer needs the tagger and attribute ruler,
+# so they go together.
+NER_EXCLUDE: Tuple[str, ...] = ("parser", "tagger", "attribute_ruler", "lemmatizer", "senter")
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in KiB on Linux and bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def model_version(name: str = SPACY_MODEL) -> str:
+    """Installed version of a spaCy model package, without loading it."""
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return "not-installed"
+
+
+def install_model(name: str = SPACY_MODEL) -> bool:
+    """Install a spaCy model package (build time only); False if it is already installed."""
+    if model_version(name) != "not-installed":
+        return False
+    from spacy.cli import download
+    download(name)
+    return True
+
+
+class ModelRegistry:
+    """Loads each spaCy pipeline once per process and shares it.
+
+    Every TextProcessor in a worker uses the same instance instead of
+    loading its own copy. A missing model is never downloaded on the request
+    path; install it at build time instead.
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, Tuple[str, ...]], object] = {}
+        self._stats: Dict[Tuple[str, Tuple[str, ...]], Dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str = SPACY_MODEL, exclude: Iterable[str] = NER_EXCLUDE):
+        """Return the pipeline for ``name`` without the ``exclude`` components."""
+        key = (name, tuple(sorted(exclude)))
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = self._models[key] = self._load(key)
+        return model
+
+    def _load(self, key: Tuple[str, Tuple[str, ...]]):
+        import spacy
+        name, exclude = key
+        before = rss_bytes()
+        started = time.perf_counter()
+        try:
+            model = spacy.load(name, exclude=list(exclude))
+        except OSError as e:
+            raise OSError(
+                f"spaCy model '{name}' is not installed; run `python -m spacy download {name}`"
+            ) from e
+        stats = {
+            "name": name,
+            "components": list(model.pipe_names),
+            "load_seconds": time.perf_counter() - started,
+            "rss_delta_bytes": rss_bytes() - before,
+        }
+        self._stats[key] = stats
+        logger.info(
+            f"Loaded spaCy model {name} {stats['components']} in {stats['load_seconds']:.2f}s, "
+            f"+{stats['rss_delta_bytes'] / 2**20:.1f} MiB RSS (pid {os.getpid()})"
+        )
+        return model
+
+    def warmup(self, name: str = SPACY_MODEL, exclude: Iterable[str] = NER_EXCLUDE) -> None:
+        """Load the pipeline and run it once, so the first request doesn't pay for it."""
+        self.get(name, exclude)("Warm up the pipeline before the first request.")
+        logger.info(f"NLP models warm, worker pid {os.getpid()} at {rss_bytes() / 2**20:.1f} MiB RSS")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._stats.clear()
+
+    def stats(self, name: Optional[str] = None) -> Dict:
+        """Per-model load time and memory, plus this worker's current RSS."""
+        return {
+            "pid": os.getpid(),
+            "rss_bytes": rss_bytes(),
+            "models": [
+                stats for (model_name, _), stats in self._stats.items()
+                if name is None or model_name == name
+            ],
+        }
+
+
+models = ModelRegistry()
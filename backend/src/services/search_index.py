@@ -0,0 +1,741 @@
+import asyncio
+import copy
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import shutil
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from ..models.fact_checking_models import ExternalSource
+from ..utils.executors import executors
+from .claim_index import index_terms
+
+try:
+    import fcntl
+except ImportError:  # Windows: one writer process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH") or None
+# Seconds pages added at runtime wait in memory before being committed as a segment
+SEARCH_COMMIT_INTERVAL = float(os.getenv("SEARCH_COMMIT_INTERVAL", "30"))
+
+# Bump when the segment layout changes; older indexes have to be rebuilt
+INDEX_FORMAT = 1
+
+MANIFEST = "index.json"
+
+# Characters of page text kept per document for result snippets
+SNIPPET_CHARS = 500
+
+
+class SearchBackend:
+    """Finds pages related to a claim for the web stage.
+
+    ``search`` returns result dicts with ``url``, ``title``, ``snippet``,
+    ``content``, ``domain`` and ``content_type``; WebSearcher adds the
+    credibility score. Results read back from the backend's own index are
+    marked ``indexed`` so they are not added to it again.
+    """
+
+    async def search(self, query: str, max_results: int = 10) -> List[Dict]:
+        raise NotImplementedError
+
+    async def add_documents(self, documents: Iterable[Dict]) -> int:
+        """Make pages searchable; returns how many were new or changed."""
+        return 0
+
+    async def close(self) -> None:
+        pass
+
+
+class NullSearchBackend(SearchBackend):
+    """No search configured; the web stage finds nothing."""
+
+    async def search(self, query: str, max_results: int = 10) -> List[Dict]:
+        return []
+
+
+class _Segment:
+    """An immutable slice of the index, opened read-only except for its deletions.
+
+    Postings are two parallel arrays (doc ids and term frequencies) read
+    through memory maps, so a segment costs almost no memory until queried
+    and the OS page cache is shared between workers. The term dictionary and
+    stored fields live in SQLite.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._db = sqlite3.connect(
+            os.path.join(path, "segment.db"), check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        self.doc_ids = _memmap(os.path.join(path, "doc_ids.u32"), np.uint32)
+        self.tfs = _memmap(os.path.join(path, "tfs.u16"), np.uint16)
+        self.lengths = _memmap(os.path.join(path, "lengths.u32"), np.uint32)
+        # Deletions flip bytes in place; MAP_SHARED makes them visible to other workers
+        self.size = len(self.lengths)
+        live = os.path.join(path, "live.u8")
+        self.live = np.memmap(live, dtype=np.uint8, mode="r+") if self.size else np.zeros(0, dtype=np.uint8)
+
+    def postings(self, terms: Sequence[str]) -> Dict[str, Tuple[int, int]]:
+        """``term -> (offset, df)`` for the terms present in this segment."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(terms), 500):
+                chunk = terms[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT term, offset, df FROM terms WHERE term IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                found.update((term, (offset, df)) for term, offset, df in rows)
+        return found
+
+    def documents(self, ids: Sequence[int]) -> Dict[int, Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, url, title, domain, content_type, snippet FROM docs "
+                f"WHERE id IN ({','.join('?' * len(ids))})",
+                [int(doc) for doc in ids]
+            ).fetchall()
+        return {
+            row[0]: {"url": row[1], "title": row[2], "domain": row[3], "content_type": row[4], "snippet": row[5]}
+            for row in rows
+        }
+
+    def find_urls(self, urls: Sequence[str]) -> Dict[str, Tuple[int, str]]:
+        """``url -> (doc id, content hash)`` for live documents with those URLs."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT url, id, hash FROM docs WHERE url IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                found.update((url, (doc, digest)) for url, doc, digest in rows if self.live[doc])
+        return found
+
+    def terms(self) -> Iterator[Tuple[str, int, int]]:
+        """Every ``(term, offset, df)`` in term order."""
+        cursor = sqlite3.connect(os.path.join(self.path, "segment.db"))
+        try:
+            yield from cursor.execute("SELECT term, offset, df FROM terms ORDER BY term")
+        finally:
+            cursor.close()
+
+    def rows(self) -> Iterator[Tuple]:
+        cursor = sqlite3.connect(os.path.join(self.path, "segment.db"))
+        try:
+            yield from cursor.execute(
+                "SELECT id, url, title, domain, content_type, snippet, hash FROM docs ORDER BY id"
+            )
+        finally:
+            cursor.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _memmap(path: str, dtype) -> np.ndarray:
+    # np.memmap refuses empty files
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def _write_segment(path: str, docs: List[Tuple], lengths: np.ndarray, postings: Iterator[Tuple[str, np.ndarray, np.ndarray]]) -> None:
+    """Write a segment directory from docs and ``(term, doc_ids, tfs)`` in term order."""
+    os.makedirs(path)
+    db = sqlite3.connect(os.path.join(path, "segment.db"))
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    db.execute(
+        "CREATE TABLE docs (id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE, title TEXT, "
+        "domain TEXT, content_type TEXT, snippet TEXT, hash TEXT NOT NULL)"
+    )
+    db.execute("CREATE TABLE terms (term TEXT PRIMARY KEY, offset INTEGER NOT NULL, df INTEGER NOT NULL) WITHOUT ROWID")
+    db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?, ?)", docs)
+    offset = 0
+    batch = []
+    with open(os.path.join(path, "doc_ids.u32"), "wb") as ids_file, \
+            open(os.path.join(path, "tfs.u16"), "wb") as tfs_file:
+        for term, doc_ids, tfs in postings:
+            doc_ids.astype(np.uint32).tofile(ids_file)
+            np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16).tofile(tfs_file)
+            batch.append((term, offset, len(doc_ids)))
+            offset += len(doc_ids)
+            if len(batch) >= 10000:
+                db.executemany("INSERT INTO terms VALUES (?, ?, ?)", batch)
+                batch = []
+    db.executemany("INSERT INTO terms VALUES (?, ?, ?)", batch)
+    db.commit()
+    db.close()
+    lengths.astype(np.uint32).tofile(os.path.join(path, "lengths.u32"))
+    np.ones(len(lengths), dtype=np.uint8).tofile(os.path.join(path, "live.u8"))
+
+
+def _tagged_terms(segment: _Segment, position: int) -> Iterator[Tuple[str, int, int, int]]:
+    for term, offset, df in segment.terms():
+        yield term, position, offset, df
+
+
+def _document_hash(title: str, content: str) -> str:
+    return hashlib.blake2b(f"{title}\0{content}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+class BM25Index:
+    """Segmented on-disk inverted index ranked with BM25.
+
+    Added documents collect in a memory buffer that ``commit`` writes out as
+    a new immutable segment; as part of each commit, small segments are merged
+    ``merge_factor`` at a time, so a query touches O(log n)
+    segments. Re-adding a URL replaces its old version, and re-adding an
+    unchanged page is a no-op. Queries score every segment with vectorized
+    numpy over memory-mapped postings and keep the top k.
+
+    The index directory holds one subdirectory per segment plus a manifest
+    swapped in atomically on every commit, so readers in other worker
+    processes pick up new segments on their next query. Writers take a
+    file lock.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        k1: float = 1.2,
+        b: float = 0.75,
+        buffer_docs: int = 10000,
+        merge_factor: int = 8,
+        max_df_ratio: float = 0.5,
+        prune_min_df: int = 10000
+    ):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.buffer_docs = buffer_docs
+        self.merge_factor = merge_factor
+        # Terms in more than this share of documents (and at least
+        # prune_min_df of them) are dropped from multi-term queries: their
+        # postings are the longest and their idf adds next to nothing
+        self.max_df_ratio = max_df_ratio
+        self.prune_min_df = prune_min_df
+        # What readers see, swapped as a whole: (segments, manifest)
+        self._view: Tuple[List[_Segment], Dict] = ([], {"format": INDEX_FORMAT, "generation": 0, "segments": []})
+        self._manifest_mtime: Optional[int] = None
+        # The writer's working copy of the manifest, inside _writing()
+        self._manifest: Dict = {}
+        self._buffer: Dict[str, Tuple] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    # Reading
+
+    def _refresh(self) -> Tuple[List[_Segment], Dict]:
+        """Pick up segments committed by this or another process."""
+        manifest_path = os.path.join(self.path, MANIFEST)
+        try:
+            mtime = os.stat(manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._view
+        if mtime == self._manifest_mtime:
+            return self._view
+        with self._lock:
+            for attempt in range(3):
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+                if manifest.get("format") != INDEX_FORMAT:
+                    raise RuntimeError(
+                        f"Search index at {self.path} has format {manifest.get('format')}, "
+                        f"expected {INDEX_FORMAT}; rebuild it with scripts/athena-index"
+                    )
+                opened = {segment.name: segment for segment in self._view[0]}
+                try:
+                    segments = [
+                        opened.get(entry["name"]) or _Segment(os.path.join(self.path, entry["name"]))
+                        for entry in manifest["segments"]
+                    ]
+                    break
+                except (OSError, sqlite3.Error):
+                    # A merge in another process replaced a segment since we read the manifest
+                    if attempt == 2:
+                        raise
+            self._view = (segments, manifest)
+            self._manifest_mtime = mtime
+        return self._view
+
+    def __len__(self) -> int:
+        return sum(entry["live"] for entry in self._refresh()[1]["segments"])
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[float, Dict]]:
+        """The ``k`` best ``(score, document)`` pairs for the query's terms (any may match)."""
+        segments, manifest = self._refresh()
+        entries = manifest["segments"]
+        terms = list(dict.fromkeys(index_terms(query)))
+        if not terms or not segments or k <= 0:
+            return []
+        doc_count = sum(entry["live"] for entry in entries)
+        total_length = sum(entry["total_length"] for entry in entries)
+        if not doc_count:
+            return []
+        avg_length = total_length / doc_count
+
+        found = [segment.postings(terms) for segment in segments]
+        df = defaultdict(int)
+        for postings in found:
+            for term, (_, count) in postings.items():
+                df[term] += count
+        present = [term for term in terms if df[term]]
+        cutoff = max(self.max_df_ratio * doc_count, self.prune_min_df)
+        common = [term for term in present if df[term] > cutoff]
+        if len(common) < len(present):
+            present = [term for term in present if term not in common]
+        idf = {
+            term: math.log(1 + (doc_count - df[term] + 0.5) / (df[term] + 0.5))
+            for term in present
+        }
+
+        best: List[Tuple[float, int, int]] = []
+        for position, (segment, postings) in enumerate(zip(segments, found)):
+            best.extend(
+                (score, position, doc)
+                for score, doc in self._score_segment(segment, postings, idf, avg_length, k)
+            )
+        top = heapq.nlargest(k, best)
+
+        by_segment: Dict[int, List[int]] = defaultdict(list)
+        for _, position, doc in top:
+            by_segment[position].append(doc)
+        stored = {
+            position: segments[position].documents(docs) for position, docs in by_segment.items()
+        }
+        return [(score, stored[position][doc]) for score, position, doc in top]
+
+    def _score_segment(
+        self,
+        segment: _Segment,
+        postings: Dict[str, Tuple[int, int]],
+        idf: Dict[str, float],
+        avg_length: float,
+        k: int
+    ) -> List[Tuple[float, int]]:
+        ids_parts = []
+        score_parts = []
+        for term, weight in idf.items():
+            if term not in postings:
+                continue
+            offset, count = postings[term]
+            ids = segment.doc_ids[offset:offset + count]
+            tf = segment.tfs[offset:offset + count].astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * segment.lengths[ids] / avg_length)
+            ids_parts.append(ids)
+            score_parts.append(weight * tf * (self.k1 + 1) / (tf + norm))
+        if not ids_parts:
+            return []
+        total = sum(len(ids) for ids in ids_parts)
+        if total * 16 < segment.size:
+            # Few postings: accumulate over the matching docs only
+            docs, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+        else:
+            docs = None
+            scores = np.zeros(segment.size, dtype=np.float32)
+            for ids, partial in zip(ids_parts, score_parts):
+                scores[ids] += partial
+        live = segment.live[docs] if docs is not None else segment.live
+        scores = np.where(live != 0, scores, 0)
+        if len(scores) > k:
+            candidates = np.argpartition(-scores, k)[:k]
+        else:
+            candidates = np.arange(len(scores))
+        return [
+            (float(scores[i]), int(docs[i] if docs is not None else i))
+            for i in candidates if scores[i] > 0
+        ]
+
+    # Writing
+
+    @property
+    def _segments(self) -> List[_Segment]:
+        return self._view[0]
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        os.makedirs(self.path, exist_ok=True)
+        with self._write_lock, open(os.path.join(self.path, "write.lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Another process may have committed since our last look
+                self._manifest_mtime = None
+                self._manifest = copy.deepcopy(self._refresh()[1])
+                self._remove_orphans()
+                self._apply_deletions()
+                yield
+            finally:
+                self._manifest = {}
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remove_orphans(self) -> None:
+        """Delete segments a crash left unfinished or a merge left behind."""
+        current = {entry["name"] for entry in self._manifest["segments"]}
+        for name in os.listdir(self.path):
+            if name.startswith("seg_") and name not in current:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def add_documents(self, documents: Iterable[Dict]) -> int:
+        """Buffer pages for the next commit; returns how many were new or changed.
+
+        Each document needs a ``url``; ``title``, ``content``, ``domain`` and
+        ``content_type`` are optional. Pages identical to their indexed
+        version are skipped. The buffer is committed on its own once it
+        holds ``buffer_docs`` pages.
+        """
+        added = 0
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, 500))
+            if not batch:
+                return added
+            entries: Dict[str, Tuple] = {}
+            for document in batch:
+                url = document.get("url")
+                if not url:
+                    continue
+                title = document.get("title") or ""
+                content = document.get("content") or ""
+                entries[url] = (
+                    url, title, document.get("domain"), document.get("content_type") or "webpage",
+                    content[:SNIPPET_CHARS], index_terms(f"{title} {content}"), _document_hash(title, content)
+                )
+            indexed: Dict[str, Tuple[int, str]] = {}
+            for segment in self._refresh()[0]:
+                indexed.update(segment.find_urls(list(entries)))
+            for url, entry in entries.items():
+                digest = entry[-1]
+                with self._lock:
+                    if url in indexed and indexed[url][1] == digest:
+                        # Back to the indexed version; drop a buffered edit
+                        self._buffer.pop(url, None)
+                        continue
+                    buffered = self._buffer.get(url)
+                    if buffered is not None and buffered[-1] == digest:
+                        continue
+                    self._buffer[url] = entry
+                    full = len(self._buffer) >= self.buffer_docs
+                added += 1
+                if full:
+                    added -= self.commit()
+
+    def commit(self) -> int:
+        """Write buffered pages as a new segment and merge small segments.
+
+        Returns how many buffered pages turned out to be unchanged copies of
+        indexed ones and were skipped. If the segment cannot be written the
+        pages go back to the buffer and their old versions stay searchable.
+        """
+        with self._writing():
+            with self._lock:
+                buffer, self._buffer = self._buffer, {}
+            if not buffer:
+                return 0
+            try:
+                unchanged, deletions = self._find_replacements(buffer)
+                if buffer:
+                    self._flush(list(buffer.values()), deletions)
+            except BaseException:
+                with self._lock:
+                    # Pages added since are newer than the ones being put back
+                    self._buffer = {**buffer, **self._buffer}
+                raise
+            self._maybe_merge()
+            return unchanged
+
+    def _find_replacements(self, buffer: Dict[str, Tuple]) -> Tuple[int, Dict[str, List[int]]]:
+        """Drop unchanged pages from the buffer; returns their count and the older versions of changed ones."""
+        urls = list(buffer)
+        unchanged = 0
+        deletions: Dict[str, List[int]] = defaultdict(list)
+        for segment in self._segments:
+            for url, (doc, digest) in segment.find_urls(urls).items():
+                if url not in buffer:
+                    continue
+                if buffer[url][-1] == digest:
+                    del buffer[url]
+                    unchanged += 1
+                    continue
+                deletions[segment.name].append(int(doc))
+        return unchanged, dict(deletions)
+
+    def _apply_deletions(self) -> None:
+        """Clear the live flags of the documents the manifest says were replaced.
+
+        Deletions are recorded in the manifest that publishes their
+        replacements and flipped after it is swapped in, so a crash in
+        between leaves a duplicate rather than a lost page. Flipping again
+        is harmless, so every writer re-applies them first.
+        """
+        segments = {segment.name: segment for segment in self._segments}
+        for name, docs in self._manifest.get("deletions", {}).items():
+            segment = segments.get(name)
+            if segment is not None and docs:
+                segment.live[docs] = 0
+                segment.live.flush()
+
+    def _flush(self, docs: List[Tuple], deletions: Optional[Dict[str, List[int]]] = None) -> None:
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = np.zeros(len(docs), dtype=np.uint32)
+        rows = []
+        for doc, (url, title, domain, content_type, snippet, terms, digest) in enumerate(docs):
+            counts: Dict[str, int] = defaultdict(int)
+            for term in terms:
+                counts[term] += 1
+            for term, count in counts.items():
+                postings[term].append((doc, count))
+            lengths[doc] = len(terms)
+            rows.append((doc, url, title, domain, content_type, snippet, digest))
+
+        def ordered():
+            for term in sorted(postings):
+                pairs = np.array(postings[term], dtype=np.uint32)
+                yield term, pairs[:, 0], pairs[:, 1]
+
+        self._add_segment(rows, lengths, ordered(), deletions=deletions)
+
+    def _add_segment(
+        self,
+        rows: List[Tuple],
+        lengths: np.ndarray,
+        postings,
+        replaces: Sequence[str] = (),
+        deletions: Optional[Dict[str, List[int]]] = None
+    ) -> None:
+        """Write a segment, then publish it, its ``deletions`` and the removal of ``replaces`` in one manifest."""
+        self._manifest["generation"] += 1
+        name = f"seg_{self._manifest['generation']:08d}"
+        _write_segment(os.path.join(self.path, name), rows, lengths, postings)
+        deletions = deletions or {}
+        existing = {segment.name: segment for segment in self._segments}
+        segments = [entry for entry in self._manifest["segments"] if entry["name"] not in replaces]
+        for entry in segments:
+            docs = deletions.get(entry["name"])
+            if docs:
+                entry["live"] -= len(docs)
+                entry["total_length"] -= int(existing[entry["name"]].lengths[docs].sum())
+        segments.append({"name": name, "docs": len(rows), "live": len(rows), "total_length": int(lengths.sum())})
+        self._manifest["segments"] = segments
+        self._manifest["deletions"] = deletions
+        self._write_manifest()
+        self._apply_deletions()
+        for old in replaces:
+            shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+
+    def _write_manifest(self) -> None:
+        path = os.path.join(self.path, MANIFEST)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._manifest_mtime = None
+        self._refresh()
+
+    def _maybe_merge(self) -> None:
+        """Merge ``merge_factor`` segments of the same size tier until no tier is full."""
+        while True:
+            tiers: Dict[int, List[Dict]] = defaultdict(list)
+            for entry in self._manifest["segments"]:
+                tier = int(math.log(max(entry["live"], 1), self.merge_factor))
+                tiers[tier].append(entry)
+            full = [entries for entries in tiers.values() if len(entries) >= self.merge_factor]
+            if not full:
+                return
+            self._merge([entry["name"] for entry in min(full, key=lambda e: e[0]["live"])[:self.merge_factor]])
+
+    def merge(self, max_segments: int = 1) -> None:
+        """Merge the smallest segments until at most ``max_segments`` remain."""
+        with self._writing():
+            while len(self._manifest["segments"]) > max_segments:
+                smallest = sorted(self._manifest["segments"], key=lambda entry: entry["live"])
+                count = min(len(smallest), max(2, len(smallest) - max_segments + 1))
+                self._merge([entry["name"] for entry in smallest[:count]])
+
+    def _merge(self, names: List[str]) -> None:
+        """Rewrite the named segments as one, dropping deleted documents."""
+        segments = [segment for segment in self._segments if segment.name in names]
+        remaps = []
+        rows = []
+        lengths = []
+        base = 0
+        for segment in segments:
+            live = np.asarray(segment.live, dtype=bool)
+            remap = np.cumsum(live, dtype=np.int64) - 1 + base
+            remaps.append((live, remap))
+            lengths.append(np.asarray(segment.lengths)[live])
+            rows.extend(
+                (int(remap[row[0]]),) + tuple(row[1:])
+                for row in segment.rows() if live[row[0]]
+            )
+            base += int(live.sum())
+
+        def merged_postings():
+            streams = [_tagged_terms(segment, position) for position, segment in enumerate(segments)]
+            current = None
+            parts_ids: List[np.ndarray] = []
+            parts_tfs: List[np.ndarray] = []
+            for term, position, offset, df in heapq.merge(*streams):
+                if term != current:
+                    if parts_ids and sum(len(ids) for ids in parts_ids):
+                        yield current, np.concatenate(parts_ids), np.concatenate(parts_tfs)
+                    current, parts_ids, parts_tfs = term, [], []
+                segment = segments[position]
+                live, remap = remaps[position]
+                ids = np.asarray(segment.doc_ids[offset:offset + df])
+                keep = live[ids]
+                parts_ids.append(remap[ids[keep]])
+                parts_tfs.append(np.asarray(segment.tfs[offset:offset + df])[keep])
+            if parts_ids and sum(len(ids) for ids in parts_ids):
+                yield current, np.concatenate(parts_ids), np.concatenate(parts_tfs)
+
+        if not rows:
+            # Nothing live left; just drop the segments
+            self._manifest["segments"] = [
+                entry for entry in self._manifest["segments"] if entry["name"] not in names
+            ]
+            self._write_manifest()
+            for name in names:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+            return
+        self._add_segment(rows, np.concatenate(lengths), merged_postings(), replaces=names)
+        logger.info(f"Merged {len(names)} search index segments into {len(rows)} documents")
+
+    def stats(self) -> Dict:
+        entries = self._refresh()[1]["segments"]
+        return {
+            "path": self.path,
+            "segments": len(entries),
+            "documents": sum(entry["live"] for entry in entries),
+            "deleted": sum(entry["docs"] - entry["live"] for entry in entries),
+            "buffered": len(self._buffer),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._view[0]:
+                segment.close()
+            self._view = ([], {"format": INDEX_FORMAT, "generation": 0, "segments": []})
+            self._manifest_mtime = None
+
+
+def external_source_documents(db: Session, batch_size: int = 1000) -> Iterator[Dict]:
+    """Stored ExternalSource pages, as index documents."""
+    query = (
+        db.query(
+            ExternalSource.url, ExternalSource.title, ExternalSource.content,
+            ExternalSource.domain, ExternalSource.content_type
+        )
+        .filter(ExternalSource.content.isnot(None))
+        .yield_per(batch_size)
+    )
+    for url, title, content, domain, content_type in query:
+        yield {"url": url, "title": title, "content": content, "domain": domain, "content_type": content_type}
+
+
+class LocalSearchBackend(SearchBackend):
+    """Offline search over a BM25Index of crawled pages and stored sources.
+
+    Pages added at runtime are buffered and committed as one segment in the
+    background, ``commit_interval`` seconds after the first of them (and on
+    close), so requests never wait on segment writes or merges. They become
+    searchable once committed.
+    """
+
+    def __init__(self, index: BM25Index, commit_interval: float = SEARCH_COMMIT_INTERVAL):
+        self.index = index
+        self.commit_interval = commit_interval
+        self._commit_task: Optional[asyncio.Task] = None
+
+    async def search(self, query: str, max_results: int = 10) -> List[Dict]:
+        hits = await executors.run_thread(self.index.search, query, max_results)
+        return [
+            {
+                "title": document["title"],
+                "url": document["url"],
+                "snippet": document["snippet"] or "",
+                "content": document["snippet"] or "",
+                "domain": document["domain"],
+                "content_type": document["content_type"],
+                "relevance": score,
+                "indexed": True,
+            }
+            for score, document in hits
+        ]
+
+    async def add_documents(self, documents: Iterable[Dict]) -> int:
+        added = await executors.run_thread(self.index.add_documents, list(documents))
+        if added and self._commit_task is None:
+            self._commit_task = asyncio.ensure_future(self._commit_later())
+        return added
+
+    async def _commit_later(self) -> None:
+        try:
+            await asyncio.sleep(self.commit_interval)
+        finally:
+            self._commit_task = None
+        try:
+            await self.commit()
+        except Exception as e:
+            logger.error(f"Search index commit failed: {str(e)}", exc_info=True)
+
+    async def commit(self) -> None:
+        """Write buffered pages out now."""
+        await executors.run_thread(self.index.commit)
+
+    async def close(self) -> None:
+        if self._commit_task is not None:
+            self._commit_task.cancel()
+            self._commit_task = None
+        await self.commit()
+        self.index.close()
+
+
+_default_backend: Optional[SearchBackend] = None
+_default_lock = threading.Lock()
+
+
+def default_search_backend() -> SearchBackend:
+    """The process-wide backend: a local index at SEARCH_INDEX_PATH, else none."""
+    global _default_backend
+    if _default_backend is None:
+        with _default_lock:
+            if _default_backend is None:
+                if SEARCH_INDEX_PATH:
+                    _default_backend = LocalSearchBackend(BM25Index(SEARCH_INDEX_PATH))
+                else:
+                    logger.info("SEARCH_INDEX_PATH is not set; web search is disabled")
+                    _default_backend = NullSearchBackend()
+    return _default_backend
+
+
+async def close_default_search_backend() -> None:
+    """Commit pages buffered by the process-wide backend; call on shutdown."""
+    global _default_backend
+    backend, _default_backend = _default_backend, None
+    if backend is not None:
+        await backend.close()
@@ -1,70 +1,132 @@
 import logging
-from typing import List
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-import spacy
-
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('punkt')
-    nltk.download('stopwords')
+from typing import AsyncIterator, List, Optional
+from collections import Counter
+from .nlp_models import SPACY_MODEL, model_version, models
+from .transcription import PartialTranscript, StreamingTranscriber
+from ..utils.executors import executors
+from ..utils.html_extract import extract_main_text
+from ..utils.nlp_resources import nltk_version, require_nltk, stopword_set, word_tokenize
+from ..utils.result_cache import result_cache
 
 logger = logging.getLogger(__name__)
 
+# Bump when keyword extraction changes so cached results are not reused
+KEYWORDS_VERSION = 1
+
+keyword_cache = result_cache(
+    "keywords", f"{KEYWORDS_VERSION}:{SPACY_MODEL}-{model_version()}:nltk-{nltk_version()}"
+)
+
+def warm_worker() -> None:
+    """Process pool initializer: load spaCy and NLTK data before the first task."""
+    try:
+        models.warmup()
+        stopword_set('english')
+        require_nltk('punkt')
+    except (OSError, LookupError) as e:
+        logger.error(f"Worker warmup failed: {str(e)}")
+
 class TextProcessor:
-    def __init__(self):
-        self.stop_words = set(stopwords.words('english'))
-        try:
-            self.nlp = spacy.load('en_core_web_sm')
-        except OSError:
-            import subprocess, sys
-            subprocess.check_call([sys.executable, "-m", "spacy", "download", "en_core_web_sm"])
-            self.nlp = spacy.load('en_core_web_sm')
+    def __init__(self, transcriber: Optional[StreamingTranscriber] = None):
+        self.transcriber = transcriber or StreamingTranscriber()
+    
+    @property
+    def stop_words(self):
+        """NLTK's English stopwords, loaded on first use."""
+        return stopword_set('english')
+    
+    @property
+    def nlp(self):
+        """The process-wide NER pipeline, loaded on first use."""
+        return models.get()
     
     async def extract_keywords(self, text: str, top_n: int = 10) -> List[str]:
         """Extract the most important keywords from the text."""
         try:
-            words = word_tokenize(text.lower())
-            words = [word for word in words if word.isalnum() and word not in self.stop_words]
-            doc = self.nlp(text)
-            entities = [ent.text.lower() for ent in doc.ents]
-            word_freq = nltk.FreqDist(words + entities)
-            return [word for word, _ in word_freq.most_common(top_n)]
+            return (await self.extract_keywords_batch([text], top_n, batch_size=1))[0]
         except Exception as e:
             logger.error(f"Error extracting keywords: {str(e)}", exc_info=True)
             return []
     
+    async def extract_keywords_batch(
+        self,
+        texts: List[str],
+        top_n: int = 10,
+        batch_size: int = 64,
+        n_process: int = 1
+    ) -> List[List[str]]:
+        """Extract keywords for many texts, streaming them through ``nlp.pipe``.
+        
+        Returns the same keywords as ``extract_keywords`` for each text, in
+        input order. The batch runs in the CPU process pool; ``n_process > 1``
+        instead runs it from a thread and lets spaCy start its own worker
+        processes, which only pays off for very large batches. Results are
+        memoized by content hash in ``keyword_cache``.
+        """
+        if not texts:
+            return []
+        results = await keyword_cache.aget_many([keyword_cache.key(top_n, text) for text in texts])
+        # Each distinct uncached text is parsed once
+        missing = list(dict.fromkeys(
+            text for text, result in zip(texts, results) if result is None
+        ))
+        if not missing:
+            return results
+        try:
+            if n_process > 1:
+                computed = await executors.run_thread(
+                    self._keywords_batch, missing, top_n, batch_size, n_process
+                )
+            else:
+                computed = await executors.run_cpu(self._keywords_batch, missing, top_n, batch_size, 1)
+        except Exception as e:
+            logger.error(f"Error extracting keywords: {str(e)}", exc_info=True)
+            return [result or [] for result in results]
+        by_text = dict(zip(missing, computed))
+        for position, text in enumerate(texts):
+            if results[position] is None:
+                results[position] = by_text[text]
+        await keyword_cache.aput_many(
+            (keyword_cache.key(top_n, text), result) for text, result in by_text.items()
+        )
+        return results
+    
+    def _keywords_batch(
+        self,
+        texts: List[str],
+        top_n: int,
+        batch_size: int,
+        n_process: int
+    ) -> List[List[str]]:
+        docs = self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+        return [self._keywords(text, doc, top_n) for text, doc in zip(texts, docs)]
+    
+    def _keywords(self, text: str, doc, top_n: int) -> List[str]:
+        """Most frequent non-stopword tokens and named entities of a parsed text."""
+        words = word_tokenize(text.lower())
+        words = [word for word in words if word.isalnum() and word not in self.stop_words]
+        entities = [ent.text.lower() for ent in doc.ents]
+        word_freq = Counter(words + entities)
+        return [word for word, _ in word_freq.most_common(top_n)]
+    
     async def transcribe_audio(self, audio_path: str) -> str:
         """Transcribe audio to text."""
         try:
-            import speech_recognition as sr
-            r = sr.Recognizer()
-            with sr.AudioFile(audio_path) as source:
-                audio_data = r.record(source)
-                return r.recognize_google(audio_data)
+            return await self.transcriber.transcribe(self.transcriber.file_windows(audio_path))
         except Exception as e:
             logger.error(f"Error transcribing audio: {str(e)}", exc_info=True)
             raise
     
+    async def stream_transcription(self, audio_path: str) -> AsyncIterator[PartialTranscript]:
+        """Transcribe audio window by window, yielding partial transcripts in order."""
+        async for partial in self.transcriber.stream(self.transcriber.file_windows(audio_path)):
+            yield partial
+    
     async def extract_text_from_video(self, video_path: str) -> str:
         """Extract text from video using speech recognition."""
         try:
-            from moviepy.editor import VideoFileClip
-            import tempfile
-            import os
-            
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp:
-                video = VideoFileClip(video_path)
-                video.audio.write_audiofile(tmp.name, verbose=False, logger=None)
-                video.close()
-                
-                text = await self.transcribe_audio(tmp.name)
-                os.unlink(tmp.name)
-                return text
+            # Audio is piped out of ffmpeg and transcribed while it decodes
+            return await self.transcriber.transcribe(self.transcriber.media_windows(video_path))
         except Exception as e:
             logger.error(f"Error extracting text from video: {str(e)}", exc_info=True)
             raise
@@ -72,16 +134,7 @@ class TextProcessor:
     async def extract_from_web_script(self, script: str) -> str:
         """Extract main content from web script/HTML."""
         try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(script, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-                
-            # Get text and clean it up
-            text = soup.get_text(separator=' ', strip=True)
-            return ' '.join(text.split())
+            return await executors.run_cpu(extract_main_text, script)
         except Exception as e:
             logger.error(f"Error extracting text from web script: {str(e)}", exc_info=True)
             return script  # Return original if parsing fails
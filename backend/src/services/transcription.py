@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import os
+import re
+import shutil
+import wave
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Deque, Iterable, List, Optional, Union
+
+from ..utils.executors import executors
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class AudioWindow:
+    """A slice of mono PCM audio; ``start`` is its offset in seconds."""
+    index: int
+    start: float
+    pcm: bytes
+    sample_rate: int
+    sample_width: int
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / (self.sample_rate * self.sample_width)
+
+
+@dataclass
+class PartialTranscript:
+    """Text of one window (minus the overlap with the previous one) and the transcript so far."""
+    index: int
+    start: float
+    end: float
+    text: str
+    transcript: str
+
+
+class Recognizer:
+    """Turns one window of audio into text."""
+
+    async def recognize(self, window: AudioWindow) -> str:
+        raise NotImplementedError
+
+
+class GoogleRecognizer(Recognizer):
+    """The Google Web Speech API through ``speech_recognition``."""
+
+    def __init__(self, language: str = "en-US"):
+        self.language = language
+
+    async def recognize(self, window: AudioWindow) -> str:
+        # The call is mostly waiting on the network
+        return await executors.run_thread(self._recognize, window)
+
+    def _recognize(self, window: AudioWindow) -> str:
+        import speech_recognition as sr
+        audio = sr.AudioData(window.pcm, window.sample_rate, window.sample_width)
+        try:
+            return sr.Recognizer().recognize_google(audio, language=self.language)
+        except sr.UnknownValueError:
+            # Silence or unintelligible speech
+            return ""
+
+
+class PCMWindower:
+    """Cuts a stream of mono PCM bytes into overlapping windows.
+
+    Feed it chunks of any size; it keeps at most one window of audio.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        sample_width: int,
+        window_seconds: float = 30.0,
+        overlap_seconds: float = 2.0
+    ):
+        if not 0 <= overlap_seconds < window_seconds:
+            raise ValueError("overlap_seconds must be in [0, window_seconds)")
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self._window_bytes = int(window_seconds * sample_rate) * sample_width
+        self._step_bytes = self._window_bytes - int(overlap_seconds * sample_rate) * sample_width
+        self._buffer = bytearray()
+        self._offset = 0
+        self._index = 0
+
+    def _window(self, pcm: bytes) -> AudioWindow:
+        window = AudioWindow(
+            index=self._index,
+            start=self._offset / (self.sample_rate * self.sample_width),
+            pcm=pcm,
+            sample_rate=self.sample_rate,
+            sample_width=self.sample_width
+        )
+        self._index += 1
+        return window
+
+    def feed(self, chunk: bytes) -> List[AudioWindow]:
+        """Add audio and return the windows it completed."""
+        self._buffer.extend(chunk)
+        windows = []
+        while len(self._buffer) >= self._window_bytes:
+            windows.append(self._window(bytes(self._buffer[:self._window_bytes])))
+            del self._buffer[:self._step_bytes]
+            self._offset += self._step_bytes
+        return windows
+
+    def flush(self) -> List[AudioWindow]:
+        """Return the trailing partial window, unless it is only overlap already sent."""
+        overlap = self._window_bytes - self._step_bytes
+        if len(self._buffer) > (overlap if self._index else 0):
+            window = self._window(bytes(self._buffer))
+            self._buffer.clear()
+            return [window]
+        self._buffer.clear()
+        return []
+
+
+async def audio_file_windows(
+    path: str,
+    window_seconds: float = 30.0,
+    overlap_seconds: float = 2.0,
+    chunk_seconds: float = 1.0
+) -> AsyncIterator[AudioWindow]:
+    """Read an audio file incrementally as overlapping mono windows.
+
+    WAV is read with the ``wave`` module; AIFF and FLAC go through
+    ``speech_recognition``'s reader. File reads run in a worker thread.
+    """
+    try:
+        reader = await asyncio.to_thread(wave.open, path, "rb")
+    except (wave.Error, EOFError):
+        async for window in _sr_file_windows(path, window_seconds, overlap_seconds, chunk_seconds):
+            yield window
+        return
+    try:
+        channels = reader.getnchannels()
+        width = reader.getsampwidth()
+        windower = PCMWindower(reader.getframerate(), width, window_seconds, overlap_seconds)
+        frames = max(1, int(chunk_seconds * reader.getframerate()))
+        while True:
+            chunk = await asyncio.to_thread(reader.readframes, frames)
+            if not chunk:
+                break
+            for window in windower.feed(_to_mono(chunk, width, channels)):
+                yield window
+        for window in windower.flush():
+            yield window
+    finally:
+        reader.close()
+
+
+async def _sr_file_windows(path, window_seconds, overlap_seconds, chunk_seconds) -> AsyncIterator[AudioWindow]:
+    import speech_recognition as sr
+    source = sr.AudioFile(path)
+    # Opening decodes FLAC through a subprocess
+    await asyncio.to_thread(source.__enter__)
+    try:
+        windower = PCMWindower(source.SAMPLE_RATE, source.SAMPLE_WIDTH, window_seconds, overlap_seconds)
+        size = max(1, int(chunk_seconds * source.SAMPLE_RATE)) * source.SAMPLE_WIDTH
+        while True:
+            chunk = await asyncio.to_thread(source.stream.read, size)
+            if not chunk:
+                break
+            for window in windower.feed(chunk):
+                yield window
+        for window in windower.flush():
+            yield window
+    finally:
+        source.__exit__(None, None, None)
+
+
+def ffmpeg_binary() -> str:
+    """FFMPEG_BINARY, else ffmpeg on PATH, else the one bundled with moviepy's imageio-ffmpeg."""
+    binary = os.getenv("FFMPEG_BINARY") or shutil.which("ffmpeg")
+    if binary:
+        return binary
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        raise FileNotFoundError("ffmpeg not found; install it or set FFMPEG_BINARY")
+
+
+async def ffmpeg_windows(
+    path: str,
+    window_seconds: float = 30.0,
+    overlap_seconds: float = 2.0,
+    sample_rate: int = 16000,
+    chunk_bytes: int = 64 * 1024
+) -> AsyncIterator[AudioWindow]:
+    """Decode the audio track of any media file through an ffmpeg pipe.
+
+    ffmpeg writes 16-bit mono PCM to stdout and windows are cut as it
+    arrives, so nothing touches the disk. The pipe applies backpressure: when
+    the consumer stops pulling windows, ffmpeg blocks. The process is
+    killed if the consumer stops early.
+    """
+    process = await asyncio.create_subprocess_exec(
+        ffmpeg_binary(), "-nostdin", "-loglevel", "error", "-i", path,
+        "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "pipe:1",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    # Drain stderr alongside stdout so a chatty ffmpeg can't fill that pipe and stall
+    errors = asyncio.ensure_future(process.stderr.read())
+    windower = PCMWindower(sample_rate, 2, window_seconds, overlap_seconds)
+    try:
+        while True:
+            chunk = await process.stdout.read(chunk_bytes)
+            if not chunk:
+                break
+            for window in windower.feed(chunk):
+                yield window
+        if await process.wait() != 0:
+            message = (await errors).decode("utf-8", "replace").strip()
+            raise RuntimeError(f"ffmpeg failed to decode {path}: {message}")
+        for window in windower.flush():
+            yield window
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        errors.cancel()
+
+
+# numpy dtypes of WAV samples by width; 8-bit WAV is unsigned
+_PCM_DTYPES = {1: "u1", 2: "<i2", 4: "<i4"}
+
+
+def _to_mono(pcm: bytes, width: int, channels: int) -> bytes:
+    """Downmix interleaved little-endian PCM frames by averaging the channels."""
+    if channels == 1:
+        return pcm
+    import numpy as np
+    pcm = pcm[:len(pcm) - len(pcm) % (width * channels)]
+    if width == 3:
+        raw = np.frombuffer(pcm, np.uint8).reshape(-1, 3).astype(np.int64)
+        samples = raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16
+        samples = np.where(samples & 0x800000, samples - (1 << 24), samples)
+    else:
+        samples = np.frombuffer(pcm, _PCM_DTYPES[width]).astype(np.int64)
+    mono = samples.reshape(-1, channels).sum(axis=1) // channels
+    if width == 3:
+        return mono.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    return mono.astype(_PCM_DTYPES[width]).tobytes()
+
+
+def _normalize(token: str) -> str:
+    return "".join(_WORD_RE.findall(token.lower()))
+
+
+def stitch(previous: str, text: str, max_overlap_words: int = 12) -> str:
+    """Drop the start of ``text`` that repeats the end of ``previous``.
+
+    Overlapping windows transcribe the shared audio twice; the longest run
+    of words ending ``previous`` and starting ``text`` is kept only once.
+    """
+    tail = [_normalize(token) for token in previous.split()[-max_overlap_words:]]
+    tokens = text.split()
+    head = [_normalize(token) for token in tokens[:max_overlap_words]]
+    for size in range(min(len(tail), len(head)), 0, -1):
+        if head[:size] == tail[-size:]:
+            return " ".join(tokens[size:])
+    return text
+
+
+class StreamingTranscriber:
+    """Transcribes overlapping windows concurrently and yields them in order.
+
+    Up to ``concurrency`` windows are in flight at once, which also bounds
+    how much audio is held in memory.
+    """
+
+    def __init__(
+        self,
+        recognizer: Optional[Recognizer] = None,
+        window_seconds: float = float(os.getenv("TRANSCRIBE_WINDOW_SECONDS", "30")),
+        overlap_seconds: float = float(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "2")),
+        concurrency: int = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+    ):
+        self.recognizer = recognizer or GoogleRecognizer()
+        self.window_seconds = window_seconds
+        self.overlap_seconds = overlap_seconds
+        self.concurrency = concurrency
+
+    def file_windows(self, path: str) -> AsyncIterator[AudioWindow]:
+        """Windows of an audio file (WAV, AIFF or FLAC)."""
+        return audio_file_windows(path, self.window_seconds, self.overlap_seconds)
+
+    def media_windows(self, path: str) -> AsyncIterator[AudioWindow]:
+        """Windows of the audio track of any file ffmpeg can decode, e.g. video."""
+        return ffmpeg_windows(path, self.window_seconds, self.overlap_seconds)
+
+    async def stream(
+        self,
+        windows: Union[Iterable[AudioWindow], AsyncIterable[AudioWindow]]
+    ) -> AsyncIterator[PartialTranscript]:
+        """Yield a PartialTranscript per window, in window order."""
+        pending: Deque = deque()
+        transcript = ""
+        source = _aiter(windows)
+        try:
+            async for window in source:
+                pending.append((window, asyncio.ensure_future(self.recognizer.recognize(window))))
+                if len(pending) >= self.concurrency:
+                    partial = await self._next(pending, transcript)
+                    transcript = partial.transcript
+                    yield partial
+            while pending:
+                partial = await self._next(pending, transcript)
+                transcript = partial.transcript
+                yield partial
+        finally:
+            # A failed window or a consumer that stopped early
+            for _, task in pending:
+                task.cancel()
+            # Stop the producer now (e.g. kill ffmpeg) rather than at garbage collection
+            await source.aclose()
+
+    async def _next(self, pending: Deque, transcript: str) -> PartialTranscript:
+        window, task = pending[0]
+        text = (await task).strip()
+        pending.popleft()
+        if window.index and self.overlap_seconds:
+            text = stitch(transcript, text)
+        return PartialTranscript(
+            index=window.index,
+            start=window.start,
+            end=window.start + window.duration,
+            text=text,
+            transcript=" ".join(part for part in (transcript, text) if part)
+        )
+
+    async def transcribe(self, windows: Union[Iterable[AudioWindow], AsyncIterable[AudioWindow]]) -> str:
+        transcript = ""
+        async for partial in self.stream(windows):
+            transcript = partial.transcript
+        return transcript
+
+
+async def _aiter(windows):
+    if not hasattr(windows, "__aiter__"):
+        for window in windows:
+            yield window
+        return
+    try:
+        async for window in windows:
+            yield window
+    finally:
+        if hasattr(windows, "aclose"):
+            await windows.aclose()
@@ -1,12 +1,60 @@
+import codecs
 import logging
-from typing import List, Dict, Optional
+import os
+import re
+from contextlib import asynccontextmanager
+from typing import Iterable, List, Dict, Optional, Tuple
 import httpx
 from urllib.parse import urlparse
 import asyncio
 from dataclasses import dataclass
+from ..utils.executors import executors
+from ..utils.html_extract import MainContentExtractor
+from ..utils.http_cache import cached_client
+from ..utils.traffic import HostUnavailable
+from .domain_reputation import DomainReputationIndex, get_domain_reputation, normalize_host
+from .search_index import SearchBackend, default_search_backend
 
 logger = logging.getLogger(__name__)
 
+# Connection pool shared by all fetches of a WebSearcher
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+)
+
+# A page is read until this many (decoded) bytes, or until this many
+# characters of its main text are kept; that is all that gets stored
+PAGE_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(1024 * 1024)))
+PAGE_MAX_CHARS = int(os.getenv("FETCH_MAX_CHARS", "4000"))
+# Decoded HTML is handed to the extractor in a worker thread in batches of this size
+PARSE_BATCH_CHARS = 16 * 1024
+
+# Media types worth reading; anything else is refused from the headers
+HTML_TYPES = frozenset({"text/html", "application/xhtml+xml"})
+TEXT_TYPES = HTML_TYPES | {"text/plain"}
+
+# How much of an HTML page without a charset header is searched for <meta charset>
+SNIFF_BYTES = 1024
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+
+def _page_decoder(response: httpx.Response, prefix: bytes, html: bool):
+    """Incremental decoder for a body: BOM, then the header charset, then <meta charset>, then UTF-8."""
+    encoding = next((name for bom, name in _BOMS if prefix.startswith(bom)), None)
+    encoding = encoding or response.charset_encoding
+    if encoding is None and html:
+        match = _META_CHARSET_RE.search(prefix)
+        if match:
+            encoding = match.group(1).decode("ascii")
+    try:
+        return codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
 @dataclass
 class SearchResult:
     title: str
@@ -17,75 +65,264 @@ class SearchResult:
     credibility_score: float = 0.5
 
 class WebSearcher:
-    def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
-        self.credible_domains = {
-            'reuters.com': 0.9,
-            'apnews.com': 0.9,
-            'bbc.com': 0.9,
-            'npr.org': 0.85,
-            'nytimes.com': 0.85,
-            'washingtonpost.com': 0.85,
-            'theguardian.com': 0.85,
-            'factcheck.org': 0.95,
-            'snopes.com': 0.95,
-            'politifact.com': 0.95,
-            'ap.org': 0.9,
-            'reuters.com': 0.9,
-        }
+    """Web search and page fetching over one pooled HTTP client.
+
+    ``search`` asks a pluggable SearchBackend, by default the local BM25
+    index at SEARCH_INDEX_PATH. GETs go through the shared HTTP cache and
+    traffic controller (see ``http_cache`` and ``traffic``), so a slow or
+    failing host is cut off quickly. ``fetch_many`` runs at most
+    ``concurrency`` fetches at once, and at most ``per_host`` against any
+    one host. Pages are streamed and cut off at ``max_bytes`` or
+    ``max_chars`` of main text. HTTP/2 needs the optional ``h2`` package
+    (``pip install httpx[http2]``).
+    """
+
+    def __init__(
+        self,
+        timeout: float = 30.0,
+        limits: httpx.Limits = HTTP_LIMITS,
+        http2: bool = os.getenv("HTTP2", "0") == "1",
+        concurrency: int = int(os.getenv("FETCH_CONCURRENCY", "16")),
+        per_host: int = int(os.getenv("FETCH_PER_HOST", "4")),
+        deadline: Optional[float] = float(os.getenv("FETCH_DEADLINE", "10")) or None,
+        backend: Optional[SearchBackend] = None,
+        reputation: Optional[DomainReputationIndex] = None,
+        max_bytes: int = PAGE_MAX_BYTES,
+        max_chars: int = PAGE_MAX_CHARS
+    ):
+        self.backend = backend or default_search_backend()
+        self.reputation = reputation if reputation is not None else get_domain_reputation()
+        self.timeout = timeout
+        self.limits = limits
+        self.http2 = http2
+        self.per_host = per_host
+        self.deadline = deadline
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots = asyncio.Semaphore(concurrency)
+        # host -> [semaphore, users]; dropped when no fetch uses the host
+        self._hosts: Dict[str, list] = {}
+        self.fetches = 0
+        self.rejected = 0
+        self.truncated = 0
+        self.bytes_downloaded = 0
+        self.bytes_decoded = 0
+        self.peak_fetch_bytes = 0
     
     async def search(self, query: str, max_results: int = 10) -> List[Dict]:
         """Search the web for information related to the query."""
         try:
-            # In a real implementation, you would use a search API here
-            # This is a placeholder that simulates search results
-            
-            # For demonstration, we'll use a simple approach with a search API
-            # In production, you might use Google Custom Search, SerpAPI, or similar
-            
-            # This is a placeholder that would be replaced with actual API calls
-            # to a search service
-            
-            # For now, return an empty list as we don't have actual search implementation
-            # In a real implementation, you would:
-            # 1. Call a search API
-            # 2. Parse the results
-            # 3. Return structured data
-            
-            return []
-            
+            results = await self.backend.search(query, max_results)
         except Exception as e:
             logger.error(f"Error performing web search: {str(e)}", exc_info=True)
             return []
+        for result in results:
+            result["domain"] = result.get("domain") or self._extract_domain(result["url"])
+            result.setdefault("credibility_score", self._get_credibility_score(result["domain"]))
+        return results
+    
+    async def index_pages(self, pages: List[Dict]) -> int:
+        """Add pages (``url``, ``title``, ``content``, ...) to the search backend.
+
+        Results the backend returned from its own index are skipped: their
+        ``content`` is only a snippet and would replace the full page.
+        """
+        pages = [page for page in pages if not page.get("indexed")]
+        if not pages:
+            return 0
+        try:
+            return await self.backend.add_documents(pages)
+        except Exception as e:
+            logger.warning(f"Failed to index {len(pages)} pages: {str(e)}")
+            return 0
     
     def _extract_domain(self, url: str) -> str:
         """Extract domain from URL."""
-        try:
-            domain = urlparse(url).netloc
-            # Remove www. prefix if present
-            if domain.startswith('www.'):
-                domain = domain[4:]
-            return domain
-        except Exception:
-            return ""
+        domain = normalize_host(url)
+        # Remove www. prefix if present
+        if domain.startswith('www.'):
+            domain = domain[4:]
+        return domain
     
     def _get_credibility_score(self, domain: str) -> float:
-        """Get credibility score for a domain."""
-        return self.credible_domains.get(domain, 0.5)
+        """Get credibility score for a domain (or any of its subdomains)."""
+        return self.reputation.score(domain)
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The HTTP client, created on first use (most requests never fetch a page)."""
+        if self._client is None:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("HTTP2=1 but the h2 package is not installed; using HTTP/1.1")
+                    http2 = False
+            self._client = cached_client(timeout=self.timeout, limits=self.limits, http2=http2)
+        return self._client
+    
+    @asynccontextmanager
+    async def _host_slot(self, host: str):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = [asyncio.Semaphore(self.per_host), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._hosts[host]
+    
+    async def _fetch_limited(self, url: str) -> Optional[str]:
+        # Host slot first, so fetches queued behind a busy host don't hold global slots
+        async with self._host_slot(urlparse(url).netloc.lower()):
+            async with self._slots:
+                return await self._fetch_page_content(url)
+    
+    async def fetch_many(self, urls: Iterable[str], deadline: Optional[float] = None) -> Dict[str, str]:
+        """Fetch pages concurrently, returning those that arrived within the deadline.
+        
+        The result maps URL to page text (see ``_fetch_page_content``) in
+        input order; failed or refused pages and pages still loading when
+        ``deadline`` seconds (default ``self.deadline``) have passed are
+        left out.
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        deadline = self.deadline if deadline is None else deadline
+        tasks = {url: asyncio.ensure_future(self._fetch_limited(url)) for url in urls}
+        try:
+            done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+        finally:
+            late = [task for task in tasks.values() if not task.done()]
+            for task in late:
+                task.cancel()
+            # Let cancelled requests hand their connections back to the pool
+            await asyncio.gather(*late, return_exceptions=True)
+        if pending:
+            logger.warning(f"{len(pending)} of {len(urls)} pages did not load within {deadline}s")
+        return {
+            url: task.result() for url, task in tasks.items()
+            if task in done and task.result() is not None
+        }
     
     async def _fetch_page_content(self, url: str) -> Optional[str]:
-        """Fetch content from a URL."""
+        """Fetch the readable text of a page, reading no more of it than needed.
+        
+        HTML is fed to the main-content extractor as it arrives, and the
+        download stops once ``max_chars`` characters of main content (of any
+        text, for plain text) are kept or ``max_bytes`` have been read. Responses that are not HTML or plain text are closed
+        after the headers.
+        """
         try:
-            response = await self.client.get(url, follow_redirects=True)
-            response.raise_for_status()
-            return response.text
+            async with self.client.stream("GET", url, follow_redirects=True) as response:
+                response.raise_for_status()
+                media_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                if media_type and media_type not in TEXT_TYPES:
+                    self.rejected += 1
+                    logger.info(f"Skipped {url}: {media_type} content")
+                    return None
+                text, decoded, peak, truncated = await self._read_text(response, media_type != "text/plain")
+                downloaded = response.num_bytes_downloaded
+        except HostUnavailable as e:
+            # Failing fast on an unhealthy host; the caller keeps what else arrived
+            logger.info(f"Skipped {url}: {str(e)}")
+            return None
         except Exception as e:
             logger.warning(f"Failed to fetch {url}: {str(e)}")
             return None
+        self.fetches += 1
+        self.truncated += truncated
+        self.bytes_downloaded += downloaded
+        self.bytes_decoded += decoded
+        self.peak_fetch_bytes = max(self.peak_fetch_bytes, peak)
+        logger.debug(
+            f"Fetched {url}: {downloaded} bytes received, {decoded} decoded, "
+            f"{len(text)} chars kept, peak {peak} bytes held{', truncated' if truncated else ''}"
+        )
+        return text
+    
+    async def _read_text(self, response: httpx.Response, html: bool) -> Tuple[str, int, int, bool]:
+        """Stream a body into text.
+        
+        Returns the text, the bytes read, roughly the most memory held at
+        once (the largest buffered chunk plus the kept text) and whether
+        reading stopped before the end of the body.
+        """
+        extractor = MainContentExtractor(self.max_chars) if html else None
+        parts: List[str] = []
+        chars = 0
+        batch: List[str] = []
+        batched = 0
+        decoder = None
+        pending = b""
+        size = 0
+        largest = 0
+        truncated = False
+        
+        async def feed(text: str, final: bool = False) -> bool:
+            nonlocal chars, batch, batched, largest
+            if extractor is not None:
+                # Parsing is CPU-bound; keep it off the event loop
+                batch.append(text)
+                batched += len(text)
+                largest = max(largest, batched)
+                if batched >= PARSE_BATCH_CHARS or final:
+                    text, batch, batched = "".join(batch), [], 0
+                    await executors.run_thread(extractor.feed, text)
+                return extractor.done
+            parts.append(text)
+            chars += len(text)
+            return chars >= self.max_chars
+        
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if decoder is None:
+                # Hold the start of the body back until the charset is known
+                pending += chunk
+                if len(pending) < SNIFF_BYTES and size < self.max_bytes:
+                    continue
+                decoder = _page_decoder(response, pending, html)
+                chunk, pending = pending, b""
+            largest = max(largest, len(chunk))
+            if await feed(decoder.decode(chunk), final=size >= self.max_bytes) or size >= self.max_bytes:
+                truncated = True
+                break
+        if not truncated:
+            largest = max(largest, len(pending))
+            if decoder is None:
+                decoder = _page_decoder(response, pending, html)
+            await feed(decoder.decode(pending, final=True), final=True)
+            if extractor is not None:
+                await executors.run_thread(extractor.close)
+        if extractor is not None:
+            text = extractor.text()
+        else:
+            text = " ".join("".join(parts).split())[:self.max_chars]
+        return text, size, largest + len(text.encode("utf-8")), truncated
+    
+    def stats(self) -> Dict:
+        """Page fetch counts, bandwidth and the most memory one fetch held."""
+        return {
+            "fetches": self.fetches,
+            "rejected": self.rejected,
+            "truncated": self.truncated,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_decoded": self.bytes_decoded,
+            "bytes_per_fetch": self.bytes_downloaded / self.fetches if self.fetches else 0.0,
+            "peak_fetch_bytes": self.peak_fetch_bytes,
+        }
     
     async def close(self):
         """Close the HTTP client."""
-        await self.client.aclose()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
         
     async def __aenter__(self):
         return self
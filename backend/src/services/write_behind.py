@@ -0,0 +1,432 @@
+import asyncio
+import atexit
+import enum
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import Column, DateTime, Integer, String, Table, case, func, insert, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+from ..database import Base
+
+logger = logging.getLogger(__name__)
+
+# Spilled rows kept in memory so ``take`` can still hand them to writers of their children
+SPILLED_ROWS_KEPT = 10000
+
+# Hi/lo counters: each row holds the next unreserved id of one table
+id_sequences = Table(
+    "id_sequences",
+    Base.metadata,
+    Column("name", String(64), primary_key=True),
+    Column("next_value", Integer, nullable=False),
+)
+
+
+class IdAllocator:
+    """Hands out primary keys without a round-trip per row.
+
+    Ids are reserved from ``id_sequences`` in blocks, so only one short
+    transaction is needed every ``block_size`` ids. Each block starts past
+    the table's highest id, and on PostgreSQL the table's own sequence is
+    moved past the block, so autoincrement inserts from code without an
+    allocator (scripts, ``query_log=None``) cannot take a reserved id.
+    SQLite has no such sequence: there, a row inserted without the
+    allocator while a block is in use can still collide with it.
+    """
+
+    def __init__(self, engine: Engine, block_size: int = 100):
+        self.engine = engine
+        self.block_size = block_size
+        self._blocks: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def next_id(self, table: Table) -> int:
+        with self._lock:
+            block = self._blocks.get(table.name)
+            if block is None or block[0] >= block[1]:
+                start = self._reserve(table)
+                block = self._blocks[table.name] = [start, start + self.block_size]
+            value = block[0]
+            block[0] += 1
+            return value
+
+    async def anext_id(self, table: Table) -> int:
+        """Allocate an id, only leaving the event loop when a new block is needed."""
+        block = self._blocks.get(table.name)
+        if block is not None and block[0] < block[1]:
+            return self.next_id(table)
+        return await asyncio.to_thread(self.next_id, table)
+
+    def _reserve(self, table: Table) -> int:
+        if not self._table_ready:
+            id_sequences.create(self.engine, checkfirst=True)
+            self._table_ready = True
+        for _ in range(3):
+            try:
+                with self.engine.begin() as conn:
+                    # Continue after the rows written so far, by allocators or not
+                    floor = (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+                    start = case((id_sequences.c.next_value < floor, floor), else_=id_sequences.c.next_value)
+                    row = conn.execute(
+                        update(id_sequences)
+                        .where(id_sequences.c.name == table.name)
+                        .values(next_value=start + self.block_size)
+                        .returning(id_sequences.c.next_value)
+                    ).first()
+                    if row is not None:
+                        start = row[0] - self.block_size
+                    else:
+                        start = floor
+                        conn.execute(insert(id_sequences).values(
+                            name=table.name, next_value=start + self.block_size
+                        ))
+                    self._skip_sequence(conn, table, start + self.block_size - 1)
+                    return start
+            except IntegrityError:
+                # Another worker seeded the counter first; take a block from it
+                continue
+        raise RuntimeError(f"Could not reserve ids for {table.name}")
+
+    @staticmethod
+    def _skip_sequence(conn, table: Table, last: int) -> None:
+        """Move a PostgreSQL serial sequence to at least ``last``."""
+        if conn.dialect.name != "postgresql":
+            return
+        sequence = conn.execute(
+            text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table.name}
+        ).scalar()
+        if sequence is not None:
+            conn.execute(
+                text(f"SELECT setval(CAST(:sequence AS regclass), GREATEST(:last, (SELECT last_value FROM {sequence})))"),
+                {"sequence": sequence, "last": last}
+            )
+
+
+class WriteBehindQueue:
+    """Batches inserts off the request path.
+
+    Rows are buffered in memory and written in one transaction per flush,
+    when ``flush_size`` rows are pending or every ``flush_interval`` seconds.
+    Rows that cannot be written are appended to ``spill_path`` as JSON lines
+    and replayed on the next start; spilled rows the database rejects are
+    moved to ``<spill_path>.rejected``.
+
+    Ids come from the queue's IdAllocator, which assumes it is the only
+    source of ids for the tables it writes (see IdAllocator).
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        flush_size: int = 100,
+        flush_interval: float = 0.5,
+        spill_path: str = "./query_log.spill.jsonl",
+        id_block_size: int = 100
+    ):
+        self.engine = engine
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        # Single writer per table: on SQLite, rows inserted without this
+        # allocator while a block is in use can collide with its ids
+        self.ids = IdAllocator(engine, id_block_size)
+        self._tables: Dict[str, Table] = {}
+        self._pending: Dict[str, "OrderedDict[Any, Dict]"] = {}
+        # Recently spilled rows by key, until taken or replayed
+        self._spilled: Dict[str, "OrderedDict[Any, Dict]"] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.written = 0
+        self.flushes = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    def enqueue(self, table: Table, row: Dict) -> None:
+        """Buffer a row for insertion; never touches the database."""
+        with self._lock:
+            self._add(table, row)
+            self.enqueued += 1
+        if self._count >= self.flush_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def restore(self, table: Table, row: Dict) -> None:
+        """Queue again a row from ``take`` whose caller failed to write it."""
+        with self._lock:
+            self._add(table, row)
+
+    def _add(self, table: Table, row: Dict) -> None:
+        self._tables[table.name] = table
+        rows = self._pending.setdefault(table.name, OrderedDict())
+        rows[row.get("id", self.enqueued)] = row
+        self._count += 1
+
+    async def take(self, table: Table, key: Any) -> Optional[Dict]:
+        """Remove a pending row so the caller can write it in its own transaction.
+
+        Waits for a flush in progress, so a row that is not returned has
+        already been written. A row that was spilled is returned too: rows
+        referencing it need it in the database before the spill is replayed,
+        and the replay skips it once the caller has written it.
+        """
+        async with self._get_flush_lock():
+            with self._lock:
+                row = self._pending.get(table.name, {}).pop(key, None)
+                if row is not None:
+                    self._count -= 1
+                    return row
+                return self._spilled.get(table.name, {}).pop(key, None)
+
+    def _drain(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            batches = {name: list(rows.values()) for name, rows in self._pending.items() if rows}
+            self._pending = {}
+            self._count = 0
+        return batches
+
+    def _write(self, batches: Dict[str, List[Dict]]) -> None:
+        with self.engine.begin() as conn:
+            for name, rows in batches.items():
+                conn.execute(insert(self._tables[name]), rows)
+
+    def _write_or_spill(self, batches: Dict[str, List[Dict]]) -> None:
+        if not batches:
+            return
+        try:
+            self._write(batches)
+            self.written += sum(len(rows) for rows in batches.values())
+        except SQLAlchemyError as e:
+            logger.error(f"Write-behind flush failed, spilling to {self.spill_path}: {str(e)}")
+            self._spill(batches)
+        self.flushes += 1
+
+    async def flush(self) -> None:
+        """Write every pending row now."""
+        async with self._get_flush_lock():
+            batches = self._drain()
+            if batches:
+                await asyncio.to_thread(self._write_or_spill, batches)
+
+    def flush_sync(self) -> None:
+        """Flush from synchronous code, e.g. at interpreter exit."""
+        self._write_or_spill(self._drain())
+
+    def _get_flush_lock(self) -> asyncio.Lock:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        return self._flush_lock
+
+    async def start(self) -> None:
+        """Replay spilled rows and start the background flusher."""
+        if self._task is not None:
+            return
+        await asyncio.to_thread(self.replay_spill)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        atexit.register(self.flush_sync)
+
+    async def stop(self) -> None:
+        """Stop the flusher and write (or spill) whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            atexit.unregister(self.flush_sync)
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush error: {str(e)}", exc_info=True)
+
+    def _spill(self, batches: Dict[str, List[Dict]]) -> None:
+        with open(self.spill_path, "a", encoding="utf-8") as spill:
+            for name, rows in batches.items():
+                for row in rows:
+                    spill.write(json.dumps({"table": name, "row": _encode_row(row)}) + "\n")
+                    self.spilled += 1
+        with self._lock:
+            for name, rows in batches.items():
+                spilled = self._spilled.setdefault(name, OrderedDict())
+                spilled.update((row["id"], row) for row in rows if "id" in row)
+                while len(spilled) > SPILLED_ROWS_KEPT:
+                    spilled.popitem(last=False)
+
+    def replay_spill(self) -> int:
+        """Insert rows spilled by an earlier run and return how many were written.
+
+        The rows are written in one transaction, or one at a time if that
+        fails. Rows the database rejects (e.g. with an IntegrityError) are
+        moved to ``<spill_path>.rejected`` so they cannot block the rest,
+        except rows already stored as they are (written after a ``take``),
+        which are skipped. If the database cannot be written at all, the
+        unwritten rows stay in the spill file for the next start.
+        """
+        if not os.path.exists(self.spill_path):
+            return 0
+        records: List[Tuple[str, Dict, str]] = []
+        rejected: List[str] = []
+        with open(self.spill_path, encoding="utf-8") as spill:
+            for line in spill:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    table = Base.metadata.tables[record["table"]]
+                    row = _decode_row(table, record["row"])
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Unreadable spilled row in {self.spill_path}: {str(e)}")
+                    rejected.append(line)
+                    continue
+                self._tables[table.name] = table
+                records.append((table.name, row, line))
+
+        written = 0
+        duplicates = 0
+        kept: List[str] = []
+        try:
+            self._write(_batches(records))
+            written = len(records)
+        except SQLAlchemyError as e:
+            logger.warning(f"Replaying {self.spill_path} row by row: {str(e)}")
+            for position, (name, row, line) in enumerate(records):
+                try:
+                    self._write({name: [row]})
+                    written += 1
+                except (IntegrityError, DataError) as e:
+                    if self._stored(name, row):
+                        duplicates += 1
+                        continue
+                    logger.error(f"Rejected spilled {name} row: {str(e)}")
+                    rejected.append(line)
+                except SQLAlchemyError as e:
+                    kept = [line for _, _, line in records[position:]]
+                    logger.error(f"Could not replay {self.spill_path}, keeping {len(kept)} rows: {str(e)}")
+                    break
+
+        if rejected:
+            with open(self.spill_path + ".rejected", "a", encoding="utf-8") as quarantine:
+                quarantine.writelines(rejected)
+        if kept:
+            replacement = self.spill_path + ".tmp"
+            with open(replacement, "w", encoding="utf-8") as spill:
+                spill.writelines(kept)
+            os.replace(replacement, self.spill_path)
+        else:
+            os.remove(self.spill_path)
+        if not kept:
+            with self._lock:
+                self._spilled = {}
+        self.replayed += written
+        self.rejected += len(rejected)
+        logger.info(
+            f"Replayed {written} spilled rows from {self.spill_path}"
+            f" ({duplicates} already written, {len(rejected)} rejected, {len(kept)} kept)"
+        )
+        return written
+
+    def _stored(self, name: str, row: Dict) -> bool:
+        """Whether ``row`` is already in the database exactly as spilled."""
+        table = self._tables[name]
+        if "id" not in row:
+            return False
+        with self.engine.connect() as conn:
+            stored = conn.execute(
+                select(*(table.c[key] for key in row)).where(table.c.id == row["id"])
+            ).mappings().first()
+        return stored is not None and dict(stored) == row
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self._count,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "flushes": self.flushes,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+        }
+
+
+def _batches(records: List[Tuple[str, Dict, str]]) -> Dict[str, List[Dict]]:
+    batches: Dict[str, List[Dict]] = {}
+    for name, row, _ in records:
+        batches.setdefault(name, []).append(row)
+    return batches
+
+
+def _encode_row(row: Dict) -> Dict:
+    encoded = {}
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, enum.Enum):
+            value = value.name
+        encoded[key] = value
+    return encoded
+
+
+def _decode_row(table: Table, row: Dict) -> Dict:
+    decoded = {}
+    for key, value in row.items():
+        column_type = table.c[key].type
+        enum_class = getattr(column_type, "enum_class", None)
+        if value is not None and enum_class is not None:
+            value = enum_class[value]
+        elif value is not None and isinstance(column_type, DateTime):
+            value = datetime.fromisoformat(value)
+        decoded[key] = value
+    return decoded
+
+
+_query_log: Optional[WriteBehindQueue] = None
+
+
+def get_query_log() -> Optional[WriteBehindQueue]:
+    """The process-wide write-behind queue, if one has been started."""
+    return _query_log
+
+
+async def start_query_log(engine: Engine) -> WriteBehindQueue:
+    """Start the process-wide write-behind queue from environment settings."""
+    global _query_log
+    if _query_log is None:
+        _query_log = WriteBehindQueue(
+            engine,
+            flush_size=int(os.getenv("QUERY_LOG_FLUSH_SIZE", "100")),
+            flush_interval=float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "0.5")),
+            spill_path=os.getenv("QUERY_LOG_SPILL_PATH", "./query_log.spill.jsonl"),
+        )
+        await _query_log.start()
+    return _query_log
+
+
+async def stop_query_log() -> None:
+    global _query_log
+    if _query_log is not None:
+        await _query_log.stop()
+        _query_log = None
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _ready() -> bool:
+    return True
+
+
+class _Pool:
+    """An executor plus the counters behind its queue-depth metrics."""
+
+    def __init__(self, name: str, executor: Executor, workers: int):
+        self.name = name
+        self.executor = executor
+        self.workers = workers
+        self.in_flight = 0
+        self.peak_queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        """Tasks waiting for a free worker."""
+        return max(0, self.in_flight - self.workers)
+
+    def submit(self, fn: Callable[..., T], *args) -> Future:
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+                self.failed += 1
+            raise
+        # Counted when the task really ends, not when its caller gives up
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+        }
+
+
+class ExecutorManager:
+    """Runs blocking work off the event loop.
+
+    ``run_cpu`` sends CPU-bound, GIL-holding work (parsing, NLP) to a process
+    pool whose workers are prepared by ``initializer``, e.g. to load models.
+    ``run_thread`` uses a thread pool for work that releases the GIL or
+    blocks on I/O. Every call has a timeout. A timed-out task is cancelled
+    if it has not started; a running one cannot be interrupted and keeps
+    its worker until it finishes.
+
+    Until ``start()`` creates the process pool (or with ``process_workers=0``)
+    CPU work runs on the thread pool, so scripts and tests spawn no processes.
+    """
+
+    def __init__(
+        self,
+        process_workers: int = 0,
+        thread_workers: Optional[int] = None,
+        cpu_timeout: Optional[float] = 30.0,
+        io_timeout: Optional[float] = 300.0,
+        initializer: Optional[Callable[[], Any]] = None
+    ):
+        self.process_workers = process_workers
+        self.thread_workers = thread_workers
+        self.cpu_timeout = cpu_timeout
+        self.io_timeout = io_timeout
+        self.initializer = initializer
+        self._processes: Optional[_Pool] = None
+        self._threads: Optional[_Pool] = None
+        self._lock = threading.Lock()
+
+    def start(self, initializer: Optional[Callable[[], Any]] = None) -> None:
+        """Create the process pool and spawn its workers, running ``initializer`` in each."""
+        with self._lock:
+            if initializer is not None:
+                self.initializer = initializer
+            if self._processes is None and self.process_workers > 0:
+                self._processes = self._process_pool()
+                # Workers spawn on demand; one task each brings them all up now
+                for _ in range(self.process_workers):
+                    self._processes.executor.submit(_ready)
+
+    def _process_pool(self) -> _Pool:
+        # Spawned rather than forked: the parent runs threads (the event
+        # loop's executors, database drivers) that a fork would copy mid-use
+        executor = ProcessPoolExecutor(
+            max_workers=self.process_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=self.initializer
+        )
+        return _Pool("process", executor, self.process_workers)
+
+    def _thread_pool(self) -> _Pool:
+        if self._threads is None:
+            with self._lock:
+                if self._threads is None:
+                    # ThreadPoolExecutor's own default size
+                    workers = self.thread_workers or min(32, (os.cpu_count() or 1) + 4)
+                    executor = ThreadPoolExecutor(workers, thread_name_prefix="athena-worker")
+                    self._threads = _Pool("thread", executor, workers)
+        return self._threads
+
+    async def run_cpu(self, fn: Callable[..., T], *args, timeout: Optional[float] = None) -> T:
+        """Run CPU-bound ``fn(*args)`` in the process pool; ``fn`` and its arguments must pickle."""
+        pool = self._processes or self._thread_pool()
+        try:
+            return await self._run(pool, fn, args, self.cpu_timeout if timeout is None else timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool for later calls
+            logger.error("Process pool broke, starting a new one")
+            with self._lock:
+                if self._processes is pool:
+                    pool.executor.shutdown(wait=False, cancel_futures=True)
+                    self._processes = self._process_pool()
+            raise
+
+    async def run_thread(self, fn: Callable[..., T], *args, timeout: Optional[float] = None) -> T:
+        """Run blocking ``fn(*args)`` in the thread pool."""
+        return await self._run(
+            self._thread_pool(), fn, args, self.io_timeout if timeout is None else timeout
+        )
+
+    async def _run(self, pool: _Pool, fn: Callable[..., T], args, timeout: Optional[float]) -> T:
+        future = pool.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            pool.timeouts += 1
+            name = getattr(fn, "__qualname__", repr(fn))
+            raise TimeoutError(f"{name} did not finish within {timeout}s on the {pool.name} pool")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Queue depth and outcome counters per pool."""
+        pools = {"thread": self._threads, "process": self._processes}
+        return {name: pool.stats() for name, pool in pools.items() if pool is not None}
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            for pool in (self._processes, self._threads):
+                if pool is not None:
+                    pool.executor.shutdown(wait=wait, cancel_futures=True)
+            self._processes = None
+            self._threads = None
+
+
+executors = ExecutorManager(
+    process_workers=int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    thread_workers=int(os.getenv("IO_WORKERS", "0")) or None,
+    cpu_timeout=float(os.getenv("CPU_TASK_TIMEOUT", "30")) or None,
+    io_timeout=float(os.getenv("IO_TASK_TIMEOUT", "300")) or None,
+)
@@ -0,0 +1,180 @@
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# Subtrees that never hold the main content; they are skipped without
+# being collected (script and style bodies are not even tokenized)
+SKIP_TAGS = frozenset({
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+    "nav", "footer", "aside", "form", "button", "select", "textarea", "menu", "dialog",
+})
+
+BLOCK_TAGS = frozenset({
+    "p", "div", "section", "article", "main", "header", "li", "ul", "ol", "dl", "dt", "dd",
+    "table", "tr", "td", "th", "blockquote", "pre", "figure", "figcaption", "br", "hr",
+    "h1", "h2", "h3", "h4", "h5", "h6",
+})
+
+MAIN_TAGS = frozenset({"article", "main"})
+
+VOID_TAGS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr",
+})
+
+# Page-level classes like "has-sidebar" must not hide the whole document
+NEVER_BOILERPLATE = VOID_TAGS | MAIN_TAGS | {"html", "body"}
+
+# class/id/role values of navigation chrome, ads and widgets
+BOILERPLATE_RE = re.compile(
+    r"(^|[\s_-])(nav|navbar|navigation|menu|sidebar|footer|breadcrumbs?|cookies?|consent|banner|"
+    r"ads?|advert\w*|promo\w*|sponsor\w*|share|social|newsletter|subscribe|related|"
+    r"comments?|popup|modal|masthead|toolbar|pagination)($|[\s_-])",
+    re.IGNORECASE
+)
+
+MAX_CHARS = int(os.getenv("WEB_SCRIPT_MAX_CHARS", "100000"))
+
+# Characters of markup read past a full fallback before giving up on finding
+# an <article> or <main>
+FALLBACK_LOOKAHEAD = 64 * 1024
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+class MainContentExtractor(HTMLParser):
+    """Collects the readable text of an HTML page in one streaming pass.
+
+    No tree is built: skipped subtrees are tracked with a tag counter, and
+    text is gathered per block. Blocks that are mostly link text (menus,
+    tag clouds) are dropped, and when the page marks up an ``<article>`` or
+    ``<main>`` only the blocks inside it are kept. Parsing stops once
+    ``max_chars`` characters of main content have been kept. Other text is
+    the fallback for pages without main content: once ``max_chars`` of it is
+    held, parsing goes on for ``lookahead`` more characters of input in case
+    an ``<article>`` follows a long header, then stops.
+    """
+
+    def __init__(self, max_chars: int = MAX_CHARS, max_link_density: float = 0.5,
+                 lookahead: int = FALLBACK_LOOKAHEAD):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.max_link_density = max_link_density
+        self.lookahead = lookahead
+        self.done = False
+        self._fed = 0
+        self._fallback_full_at: Optional[int] = None
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+        self._link_depth = 0
+        self._main_depth = 0
+        self._text: List[str] = []
+        self._link_chars = 0
+        self._block_in_main = False
+        self._blocks: List[str] = []
+        self._main_blocks: List[str] = []
+        self._chars = 0
+        self._main_chars = 0
+
+    def feed(self, data: str) -> None:
+        super().feed(data)
+        self._fed += len(data)
+        if (self._fallback_full_at is not None and not self.done and not self._main_depth
+                and not self._main_blocks and self._fed - self._fallback_full_at >= self.lookahead):
+            self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in SKIP_TAGS or (tag not in NEVER_BOILERPLATE and self._is_boilerplate(attrs)):
+            self._end_block()
+            self._skip_tag = tag
+            self._skip_depth = 1
+            return
+        if tag in BLOCK_TAGS:
+            self._end_block()
+        if tag in MAIN_TAGS:
+            self._main_depth += 1
+        elif tag == "a":
+            self._link_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> and friends; nothing to open
+        if self._skip_tag is None and tag in BLOCK_TAGS:
+            self._end_block()
+
+    def handle_endtag(self, tag):
+        if self._skip_tag is not None:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        if tag in BLOCK_TAGS:
+            self._end_block()
+        if tag in MAIN_TAGS:
+            self._main_depth = max(0, self._main_depth - 1)
+        elif tag == "a":
+            self._link_depth = max(0, self._link_depth - 1)
+
+    def handle_data(self, data):
+        if self._skip_tag is not None or self.done:
+            return
+        if not self._text:
+            self._block_in_main = self._main_depth > 0
+        self._text.append(data)
+        if self._link_depth:
+            self._link_chars += len(data.strip())
+
+    @staticmethod
+    def _is_boilerplate(attrs) -> bool:
+        for name, value in attrs:
+            if value and name in ("class", "id", "role") and BOILERPLATE_RE.search(value):
+                return True
+            if name == "aria-hidden" and value == "true":
+                return True
+        return False
+
+    def _end_block(self) -> None:
+        if not self._text:
+            return
+        text = _SPACE_RE.sub(" ", "".join(self._text)).strip()
+        link_chars = self._link_chars
+        self._text = []
+        self._link_chars = 0
+        if not text or link_chars > self.max_link_density * len(text):
+            return
+        if self._block_in_main:
+            self._main_blocks.append(text)
+            self._main_chars += len(text) + 1
+            if self._main_chars >= self.max_chars:
+                self.done = True
+        elif not self._main_blocks and self._chars < self.max_chars:
+            self._blocks.append(text)
+            self._chars += len(text) + 1
+            if self._chars >= self.max_chars:
+                self._fallback_full_at = self._fed
+
+    def text(self) -> str:
+        self._end_block()
+        text = " ".join(self._main_blocks or self._blocks)
+        return text[:self.max_chars].rstrip()
+
+
+def extract_main_text(html: str, max_chars: int = MAX_CHARS, chunk_size: int = 64 * 1024) -> str:
+    """Readable main text of an HTML document, at most ``max_chars`` characters.
+
+    The document is fed in chunks so parsing stops soon after the budget of
+    main content is reached instead of running over the whole page.
+    """
+    parser = MainContentExtractor(max_chars)
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.text()
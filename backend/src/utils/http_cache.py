@@ -0,0 +1,469 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from .traffic import TrafficController, TrafficControlTransport, traffic_controller
+
+logger = logging.getLogger(__name__)
+
+# Statuses a cache may store without explicit freshness (RFC 9110 section 15.1)
+CACHEABLE_STATUSES = frozenset({200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501})
+
+# Origin errors answered with a stale copy when there is one (RFC 5861 stale-if-error)
+STALE_IF_ERROR_STATUSES = frozenset({500, 502, 503, 504})
+
+# Hop-by-hop and per-message headers a 304 must not overwrite
+_NOT_UPDATED = frozenset({"content-length", "content-encoding", "transfer-encoding", "connection"})
+
+
+def cache_control(headers: httpx.Headers) -> Dict[str, Optional[str]]:
+    """Cache-Control directives, lowercased; valueless ones map to None."""
+    directives: Dict[str, Optional[str]] = {}
+    for value in headers.get_list("cache-control"):
+        for part in value.split(","):
+            name, _, argument = part.strip().partition("=")
+            if name:
+                directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def _seconds(value: Optional[str]) -> Optional[int]:
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+@dataclass
+class CachedResponse:
+    key: bytes
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    # Epoch seconds until which the response may be served without asking the origin
+    fresh_until: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.fresh_until
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers that let the origin answer 304."""
+        headers = httpx.Headers(self.headers)
+        conditions = {}
+        if "etag" in headers:
+            conditions["If-None-Match"] = headers["etag"]
+        if "last-modified" in headers:
+            conditions["If-Modified-Since"] = headers["last-modified"]
+        return conditions
+
+    def response(self, request: httpx.Request, stale: bool = False) -> httpx.Response:
+        headers = self.headers
+        if stale:
+            headers = headers + [("Warning", '111 - "Revalidation Failed"')]
+        return httpx.Response(
+            self.status,
+            headers=headers,
+            stream=httpx.ByteStream(self.body),
+            request=request,
+        )
+
+
+class HTTPCache:
+    """Private HTTP cache of GET responses in SQLite.
+
+    Freshness follows Cache-Control ``max-age``, then ``Expires``, then the
+    usual heuristic of 10% of the time since ``Last-Modified``. Responses
+    marked ``no-store`` or ``Vary: *`` are not kept. Bodies are stored as
+    received and zlib-compressed unless already content-encoded. The file is
+    capped at ``max_bytes``, evicting least recently used responses first.
+    One variant is kept per URL; a request whose ``Vary`` headers differ is
+    a miss. When the origin cannot be reached or answers 5xx, a stored copy
+    up to ``max_stale`` seconds past its freshness is served instead.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_bytes: int = 256 * 2**20,
+        max_entry_bytes: int = 8 * 2**20,
+        max_heuristic_seconds: int = 24 * 3600,
+        max_stale: float = 24 * 3600
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.max_heuristic_seconds = max_heuristic_seconds
+        self.max_stale = max_stale
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stale = 0
+        self.stores = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and self.path != ":memory:":
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key BLOB PRIMARY KEY, url TEXT NOT NULL, vary TEXT NOT NULL, status INTEGER NOT NULL, "
+                "headers TEXT NOT NULL, body BLOB NOT NULL, compressed INTEGER NOT NULL, "
+                "fresh_until REAL NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(request: httpx.Request) -> bytes:
+        return hashlib.blake2b(f"{request.method} {request.url}".encode("utf-8"), digest_size=16).digest()
+
+    @staticmethod
+    def _vary(request: httpx.Request, headers: httpx.Headers) -> str:
+        names = sorted({
+            name.strip().lower()
+            for value in headers.get_list("vary") for name in value.split(",") if name.strip()
+        })
+        return json.dumps({name: request.headers.get(name) for name in names})
+
+    def lookup(self, request: httpx.Request) -> Optional[CachedResponse]:
+        key = self.key(request)
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT vary, status, headers, body, compressed, fresh_until, accessed "
+                    "FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                vary, status, headers, body, compressed, fresh_until, accessed = row
+                stored_vary = json.loads(vary)
+                if any(request.headers.get(name) != value for name, value in stored_vary.items()):
+                    return None
+                now = time.time()
+                # Recency only needs to be approximate; skip most writes on hot keys
+                if now - accessed > 60:
+                    self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"HTTP cache read failed: {str(e)}")
+            return None
+        return CachedResponse(
+            key=key,
+            status=status,
+            headers=[tuple(pair) for pair in json.loads(headers)],
+            body=zlib.decompress(body) if compressed else body,
+            fresh_until=fresh_until,
+        )
+
+    def storable(self, response: httpx.Response) -> bool:
+        if response.request.method != "GET" or response.status_code not in CACHEABLE_STATUSES:
+            return False
+        directives = cache_control(response.headers)
+        if "no-store" in directives or "*" in response.headers.get("vary", ""):
+            return False
+        return (
+            self._lifetime(response.headers, directives) > 0
+            or "etag" in response.headers or "last-modified" in response.headers
+        )
+
+    def _lifetime(self, headers: httpx.Headers, directives: Dict[str, Optional[str]]) -> float:
+        """Seconds the response stays fresh from when the origin generated it."""
+        if "no-cache" in directives:
+            return 0
+        max_age = _seconds(directives.get("max-age"))
+        if max_age is not None:
+            return max_age
+        date = _http_date(headers.get("date")) or time.time()
+        if "expires" in headers:
+            expires = _http_date(headers["expires"])
+            return max(0.0, expires - date) if expires is not None else 0
+        last_modified = _http_date(headers.get("last-modified"))
+        if last_modified is not None:
+            return min(max(0.0, date - last_modified) * 0.1, self.max_heuristic_seconds)
+        return 0
+
+    def _fresh_until(self, headers: httpx.Headers) -> float:
+        now = time.time()
+        date = _http_date(headers.get("date"))
+        # Age the response already had when it reached us
+        age = max(_seconds(headers.get("age")) or 0, now - date if date else 0)
+        return now - age + self._lifetime(headers, cache_control(headers))
+
+    def store(self, request: httpx.Request, response: httpx.Response, body: bytes) -> Optional[CachedResponse]:
+        headers = response.headers
+        entry = CachedResponse(
+            key=self.key(request),
+            status=response.status_code,
+            headers=list(headers.multi_items()),
+            body=body,
+            fresh_until=self._fresh_until(headers),
+        )
+        self._write(entry, self._vary(request, headers), str(request.url))
+        return entry
+
+    def refresh(self, request: httpx.Request, entry: CachedResponse, not_modified: httpx.Response) -> CachedResponse:
+        """Apply a 304's headers to the stored response and restart its freshness."""
+        updated = {name for name, _ in not_modified.headers.multi_items()} - _NOT_UPDATED
+        headers = httpx.Headers(
+            [(name, value) for name, value in entry.headers if name.lower() not in updated]
+            + [(name, value) for name, value in not_modified.headers.multi_items() if name in updated]
+        )
+        entry = CachedResponse(
+            key=entry.key,
+            status=entry.status,
+            headers=list(headers.multi_items()),
+            body=entry.body,
+            fresh_until=self._fresh_until(headers),
+        )
+        self._write(entry, self._vary(request, headers), str(request.url))
+        return entry
+
+    def _write(self, entry: CachedResponse, vary: str, url: str) -> None:
+        encoded = "content-encoding" in httpx.Headers(entry.headers)
+        body = entry.body if encoded else zlib.compress(entry.body, 6)
+        headers = json.dumps(entry.headers)
+        size = len(body) + len(headers) + len(url)
+        try:
+            with self._lock:
+                conn = self._connection()
+                old = conn.execute("SELECT size FROM responses WHERE key = ?", (entry.key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(key, url, vary, status, headers, body, compressed, fresh_until, size, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry.key, url, vary, entry.status, headers, body, int(not encoded),
+                     entry.fresh_until, size, time.time())
+                )
+                self._bytes += size - (old[0] if old else 0)
+                self.stores += 1
+                if self._bytes > self.max_bytes:
+                    self._evict(conn)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"HTTP cache write failed: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # Other workers write too, so recount before deciding how much to drop
+        self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # Drop the least recently used responses until 10% below the limit
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 256").fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                if self._bytes <= target:
+                    break
+                doomed.append((key,))
+                self._bytes -= size
+            conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.evictions += len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM responses")
+            self._bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict:
+        """Hit, revalidation and miss counts, for judging whether the cache pays off."""
+        lookups = self.hits + self.revalidated + self.misses
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "stale": self.stale,
+            "hit_rate": (self.hits + self.revalidated) / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+class _Tee(httpx.AsyncByteStream):
+    """The transport's raw stream, stored in the cache once read to the end.
+
+    Bytes reach the reader as they arrive, so a reader that stops early
+    (see ``WebSearcher._fetch_page_content``) stops the download too; such
+    partial bodies, and bodies over ``max_entry_bytes``, are not stored.
+    """
+
+    def __init__(self, cache: "HTTPCache", request: httpx.Request, response: httpx.Response):
+        self.cache = cache
+        self.request = request
+        self.response = response
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        chunks: Optional[List[bytes]] = []
+        size = 0
+        # Bytes as received, still content-encoded
+        async for chunk in self.response.stream:
+            if chunks is not None:
+                size += len(chunk)
+                if size > self.cache.max_entry_bytes:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+            yield chunk
+        if chunks is not None:
+            await asyncio.to_thread(self.cache.store, self.request, self.response, b"".join(chunks))
+
+    async def aclose(self) -> None:
+        await self.response.aclose()
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """An httpx transport that answers GETs from an HTTPCache.
+
+    Fresh responses are served without a request; stale ones with an ETag
+    or Last-Modified are revalidated with a conditional request, and a 304
+    serves the stored body. If the origin is down, or the traffic
+    controller below has opened its circuit, a stale copy is served rather
+    than an error. Requests with ``Cache-Control: no-store`` or a
+    ``Range`` go straight through; ``no-cache`` forces revalidation.
+    Cache reads and writes, including (de)compression, run in a worker
+    thread.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cache: "HTTPCache"):
+        self.transport = transport
+        self.cache = cache
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        directives = cache_control(request.headers)
+        if request.method != "GET" or "range" in request.headers or "no-store" in directives:
+            self.cache.bypassed += 1
+            return await self.transport.handle_async_request(request)
+
+        entry = await asyncio.to_thread(self.cache.lookup, request)
+        must_ask = "no-cache" in directives or directives.get("max-age") == "0"
+        if entry is not None and entry.fresh and not must_ask:
+            self.cache.hits += 1
+            return entry.response(request)
+
+        forwarded = request
+        if entry is not None and entry.validators():
+            headers = httpx.Headers(request.headers)
+            headers.update(entry.validators())
+            forwarded = httpx.Request(
+                request.method, request.url, headers=headers, extensions=request.extensions
+            )
+        usable_stale = (
+            entry is not None
+            and time.time() - entry.fresh_until < self.cache.max_stale
+            and "must-revalidate" not in cache_control(httpx.Headers(entry.headers))
+        )
+        try:
+            response = await self.transport.handle_async_request(forwarded)
+        except httpx.TransportError:
+            if not usable_stale:
+                raise
+            self.cache.stale += 1
+            return entry.response(request, stale=True)
+        if usable_stale and response.status_code in STALE_IF_ERROR_STATUSES:
+            await response.aclose()
+            self.cache.stale += 1
+            return entry.response(request, stale=True)
+
+        if entry is not None and response.status_code == 304 and forwarded is not request:
+            await response.aclose()
+            self.cache.revalidated += 1
+            entry = await asyncio.to_thread(self.cache.refresh, request, entry, response)
+            return entry.response(request)
+
+        self.cache.misses += 1
+        response.request = request
+        if not self.cache.storable(response):
+            return response
+        length = _seconds(response.headers.get("content-length"))
+        if length is not None and length > self.cache.max_entry_bytes:
+            return response
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_Tee(self.cache, request, response),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# Next to athena.db by default, so every worker shares one file and it survives restarts;
+# ":memory:" keeps a private copy per worker, up to HTTP_CACHE_MAX_MB each
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH") or "./http_cache.db"
+
+_http_cache: Optional[HTTPCache] = None
+
+
+def http_cache() -> HTTPCache:
+    """The process-wide HTTPCache, configured from HTTP_CACHE_PATH and HTTP_CACHE_MAX_MB."""
+    global _http_cache
+    if _http_cache is None:
+        _http_cache = HTTPCache(
+            path=HTTP_CACHE_PATH,
+            max_bytes=int(float(os.getenv("HTTP_CACHE_MAX_MB", "256")) * 2**20),
+        )
+    return _http_cache
+
+
+def cached_client(
+    timeout: float = 30.0,
+    limits: httpx.Limits = httpx.Limits(),
+    http2: bool = False,
+    cache: Optional[HTTPCache] = None,
+    controller: Optional[TrafficController] = None
+) -> httpx.AsyncClient:
+    """An AsyncClient whose GETs go through the HTTP cache.
+
+    Requests the cache cannot answer pass through the shared traffic
+    controller (per-host rate limits, adaptive timeouts, circuit breaking).
+    """
+    transport = TrafficControlTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=http2), controller or traffic_controller()
+    )
+    return httpx.AsyncClient(
+        timeout=timeout, transport=CachingTransport(transport, cache or http_cache())
+    )
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# NLTK data the app uses, by download id and nltk.data path
+NLTK_RESOURCES: Dict[str, str] = {
+    "punkt": "tokenizers/punkt",
+    "stopwords": "corpora/stopwords",
+    "wordnet": "corpora/wordnet",
+}
+
+_lock = threading.Lock()
+_found: Dict[str, str] = {}
+
+
+def nltk_version() -> str:
+    """Installed NLTK version, without importing it."""
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version("nltk")
+    except PackageNotFoundError:
+        return "not-installed"
+
+
+def require_nltk(name: str) -> str:
+    """Locate an NLTK resource on first use, never downloading it.
+
+    Raises LookupError naming the fix when the data is not baked into the
+    image; NLTK_DATA adds search directories.
+    """
+    location = _found.get(name)
+    if location is None:
+        import nltk
+        with _lock:
+            try:
+                location = _found[name] = str(nltk.data.find(NLTK_RESOURCES[name]))
+            except LookupError:
+                raise LookupError(
+                    f"NLTK resource '{name}' is not installed; run `scripts/athena-prefetch` "
+                    f"or set NLTK_DATA (searched {nltk.data.path})"
+                ) from None
+    return location
+
+
+@lru_cache(maxsize=None)
+def stopword_set(language: str = "english") -> FrozenSet[str]:
+    require_nltk("stopwords")
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words(language))
+
+
+def word_tokenize(text: str) -> List[str]:
+    """nltk.word_tokenize, importing NLTK and checking for punkt on first call."""
+    require_nltk("punkt")
+    from nltk.tokenize import word_tokenize as tokenize
+    return tokenize(text)
+
+
+@lru_cache(maxsize=None)
+@lru_cache(maxsize=None)
+def stemmer():
+    """The shared Porter stemmer (original algorithm); it needs no NLTK data."""
+    from nltk.stem.porter import PorterStemmer
+    return PorterStemmer(PorterStemmer.ORIGINAL_ALGORITHM)
+
+
+def lemmatizer():
+    """The shared WordNet lemmatizer."""
+    require_nltk("wordnet")
+    from nltk.stem import WordNetLemmatizer
+    return WordNetLemmatizer()
+
+
+def missing_nltk(names: Iterable[str] = NLTK_RESOURCES) -> List[str]:
+    """Resources that ``require_nltk`` would fail on."""
+    missing = []
+    for name in names:
+        try:
+            require_nltk(name)
+        except LookupError:
+            missing.append(name)
+    return missing
+
+
+def prefetch_nltk(download_dir: Optional[str] = None, names: Iterable[str] = NLTK_RESOURCES) -> List[str]:
+    """Download missing NLTK data (build time only); returns what was fetched."""
+    import nltk
+    if download_dir:
+        os.makedirs(download_dir, exist_ok=True)
+        if download_dir not in nltk.data.path:
+            nltk.data.path.insert(0, download_dir)
+    fetched = []
+    for name in missing_nltk(names):
+        logger.info(f"Downloading NLTK resource {name}")
+        if not nltk.download(name, download_dir=download_dir, quiet=True, raise_on_error=True):
+            raise RuntimeError(f"Could not download NLTK resource '{name}'")
+        fetched.append(name)
+    return fetched
@@ -1,62 +1,166 @@
+import asyncio
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import string
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+from .executors import executors
+from .nlp_resources import lemmatizer, nltk_version, stopword_set, word_tokenize
+from .result_cache import result_cache
 
-# Download required NLTK data
-nltk.download('punkt', quiet=True)
-nltk.download('stopwords', quiet=True)
-nltk.download('wordnet', quiet=True)
+# NLTK data is resolved on first use, never downloaded here; see scripts/athena-prefetch
+
+# Bump when the pipeline changes so cached results are not reused
+PREPROCESS_VERSION = 1
+
+preprocess_cache = result_cache("preprocess", f"{PREPROCESS_VERSION}:nltk-{nltk_version()}")
+
+_URL_RE = re.compile(r'https?://\S+|www\.\S+')
+_TAG_RE = re.compile(r'<.*?>')
+_DIGITS_RE = re.compile(r'\d+')
+
+_PUNCTUATION = str.maketrans('', '', string.punctuation)
+# ASCII text has no other digits, so one translate removes both
+_PUNCTUATION_AND_DIGITS = str.maketrans('', '', string.punctuation + string.digits)
+
+# The only rules of NLTK's Treebank tokenizer that fire on lowercase ASCII
+# words separated by single spaces (its CONTRACTIONS2 list)
+_CONTRACTIONS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+
+# Lemmas per process; WordNet lookups dominate preprocessing time and
+# vocabularies repeat heavily across documents
+_lemmas: Dict[str, str] = {}
+LEMMA_TABLE_SIZE = 200000
 
 class TextPreprocessor:
-    def __init__(self):
-        self.stop_words = set(stopwords.words('english'))
-        self.lemmatizer = WordNetLemmatizer()
-    
+    def __init__(self, lemmatizer: Optional[Any] = None):
+        # None uses the shared WordNet lemmatizer and its lemma table
+        self.lemmatizer = lemmatizer
+
+    @property
+    def stop_words(self):
+        return stopword_set('english')
+
     async def clean_text(self, text: str) -> str:
         """Basic text cleaning"""
+        return self._clean_text(text)
+
+    def _clean_text(self, text: str) -> str:
         if not text:
             return ""
-        
-        # Convert to lowercase
+
         text = text.lower()
-        
-        # Remove URLs
-        text = re.sub(r'https?://\S+|www\.\S+', '', text)
-        
-        # Remove HTML tags
-        text = re.sub(r'<.*?>', '', text)
-        
-        # Remove punctuation
-        text = text.translate(str.maketrans('', '', string.punctuation))
-        
-        # Remove numbers
-        text = re.sub(r'\d+', '', text)
-        
-        # Remove extra whitespace
-        text = ' '.join(text.split())
-        
-        return text
-    
+
+        # URLs, then HTML tags; each pattern only runs when it could match
+        if 'http' in text or 'www.' in text:
+            text = _URL_RE.sub('', text)
+        if '<' in text:
+            text = _TAG_RE.sub('', text)
+
+        # Punctuation and numbers
+        if text.isascii():
+            text = text.translate(_PUNCTUATION_AND_DIGITS)
+        else:
+            text = _DIGITS_RE.sub('', text.translate(_PUNCTUATION))
+
+        # Collapse whitespace
+        return ' '.join(text.split())
+
     async def tokenize(self, text: str) -> List[str]:
         """Tokenize text into words"""
         return word_tokenize(text)
-    
+
+    def _tokenize_clean(self, text: str) -> List[str]:
+        """word_tokenize for output of _clean_text.
+
+        Cleaned ASCII text is lowercase letters and single spaces, where the
+        Treebank tokenizer only splits a few contractions, so splitting on
+        spaces gives the same tokens without the sentence tokenizer and
+        regex passes. Anything else goes through NLTK.
+        """
+        if not text:
+            return []
+        if not text.isascii() or not text.replace(' ', '').isalpha():
+            return word_tokenize(text)
+        tokens = []
+        for word in text.split(' '):
+            parts = _CONTRACTIONS.get(word)
+            if parts is None:
+                tokens.append(word)
+            else:
+                tokens.extend(parts)
+        return tokens
+
     async def remove_stopwords(self, tokens: List[str]) -> List[str]:
         """Remove stopwords from tokens"""
+        return self._remove_stopwords(tokens)
+
+    def _remove_stopwords(self, tokens: List[str]) -> List[str]:
         return [token for token in tokens if token not in self.stop_words]
-    
+
     async def lemmatize(self, tokens: List[str]) -> List[str]:
         """Lemmatize tokens"""
-        return [self.lemmatizer.lemmatize(token) for token in tokens]
-    
+        return self._lemmatize(tokens)
+
+    def _lemmatize(self, tokens: List[str]) -> List[str]:
+        if self.lemmatizer is not None:
+            return [self.lemmatizer.lemmatize(token) for token in tokens]
+        wordnet = lemmatizer()
+        lemmas = []
+        for token in tokens:
+            lemma = _lemmas.get(token)
+            if lemma is None:
+                if len(_lemmas) >= LEMMA_TABLE_SIZE:
+                    _lemmas.clear()
+                lemma = _lemmas[token] = wordnet.lemmatize(token)
+            lemmas.append(lemma)
+        return lemmas
+
     async def preprocess_text(self, text: str) -> List[str]:
-        """Full preprocessing pipeline"""
-        cleaned = await self.clean_text(text)
-        tokens = await self.tokenize(cleaned)
-        tokens = await self.remove_stopwords(tokens)
-        tokens = await self.lemmatize(tokens)
+        """Full preprocessing pipeline, run in the CPU worker pool"""
+        key = preprocess_cache.key(text)
+        tokens = await preprocess_cache.aget(key)
+        if tokens is None:
+            tokens = await executors.run_cpu(self._preprocess_text, text)
+            await preprocess_cache.aput(key, tokens)
         return tokens
+
+    async def preprocess_batch(self, texts: List[str], chunk_size: int = 500) -> List[List[str]]:
+        """preprocess_text for many documents.
+
+        Uncached documents are deduplicated and sent to the worker pool in
+        chunks, so each task carries enough work to outweigh pickling and
+        the chunks run on all workers at once.
+        """
+        keys = [preprocess_cache.key(text) for text in texts]
+        results: List[Any] = await preprocess_cache.aget_many(keys)
+        missing = list(dict.fromkeys(text for text, tokens in zip(texts, results) if tokens is None))
+        if missing:
+            chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+            done = await asyncio.gather(*(
+                executors.run_cpu(self._preprocess_many, chunk) for chunk in chunks
+            ))
+            processed = {}
+            for chunk, chunk_tokens in zip(chunks, done):
+                for text, tokens in zip(chunk, chunk_tokens):
+                    processed[text] = tokens
+            await preprocess_cache.aput_many(
+                (preprocess_cache.key(text), tokens) for text, tokens in processed.items()
+            )
+            results = [
+                list(processed[text]) if tokens is None else tokens
+                for text, tokens in zip(texts, results)
+            ]
+        return results
+
+    def _preprocess_many(self, texts: List[str]) -> List[List[str]]:
+        return [self._preprocess_text(text) for text in texts]
+
+    def _preprocess_text(self, text: str) -> List[str]:
+        tokens = self._tokenize_clean(self._clean_text(text))
+        return self._lemmatize(self._remove_stopwords(tokens))
@@ -0,0 +1,288 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class ResultCache:
+    """Memoizes results of pure functions of text, keyed by a content hash.
+
+    Keys are BLAKE2b digests of the namespace, the version and the inputs,
+    so bumping ``version`` (e.g. when the model changes) makes old results
+    unreachable. There are two tiers:
+
+    - a bounded in-process LRU;
+    - an optional SQLite file that every worker on the host reads and
+      writes. It is evicted least-recently-used first once it grows past
+      ``disk_max_bytes``, and rows from other versions of the namespace are
+      dropped when it is opened.
+
+    Values must be JSON serializable. Async code should use ``aget_many``
+    and ``aput_many``, which do their disk I/O in a worker thread.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        version: str,
+        max_entries: int = 10000,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 256 * 2**20
+    ):
+        self.namespace = namespace
+        self.version = version
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[bytes, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.disk_errors = 0
+
+    def key(self, *parts: Any) -> bytes:
+        """Digest of the inputs; parts are joined unambiguously."""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (self.namespace, self.version) + parts:
+            data = str(part).encode("utf-8")
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.digest()
+
+    def get(self, key: bytes, default: Any = None) -> Any:
+        value = self._memory_get(key)
+        if value is _MISSING and self.disk_path is not None:
+            value = self._disk_found(key, self._disk_get_many([key])[0])
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        return copy.deepcopy(value)
+
+    async def aget_many(self, keys: List[bytes], default: Any = None) -> List[Any]:
+        """``get`` for several keys, with one disk read off the event loop."""
+        values = [self._memory_get(key) for key in keys]
+        missing = [position for position, value in enumerate(values) if value is _MISSING]
+        if missing and self.disk_path is not None:
+            found = await asyncio.to_thread(self._disk_get_many, [keys[p] for p in missing])
+            for position, value in zip(missing, found):
+                values[position] = self._disk_found(keys[position], value)
+        results = []
+        for value in values:
+            if value is _MISSING:
+                self.misses += 1
+                results.append(default)
+            else:
+                results.append(copy.deepcopy(value))
+        return results
+
+    async def aget(self, key: bytes, default: Any = None) -> Any:
+        return (await self.aget_many([key], default))[0]
+
+    def put(self, key: bytes, value: Any) -> None:
+        value = copy.deepcopy(value)
+        self._remember(key, value)
+        if self.disk_path is not None:
+            self._disk_put_many([(key, value)])
+
+    async def aput_many(self, items: Iterable[Tuple[bytes, Any]]) -> None:
+        """``put`` for several values, written to disk in one transaction off the event loop."""
+        items = [(key, copy.deepcopy(value)) for key, value in items]
+        for key, value in items:
+            self._remember(key, value)
+        if items and self.disk_path is not None:
+            await asyncio.to_thread(self._disk_put_many, items)
+
+    async def aput(self, key: bytes, value: Any) -> None:
+        await self.aput_many([(key, value)])
+
+    def _memory_get(self, key: bytes) -> Any:
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+            return value
+
+    def _disk_found(self, key: bytes, value: Any) -> Any:
+        if value is not _MISSING:
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def _remember(self, key: bytes, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._disk is None:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False, isolation_level=None)
+            # WAL lets workers read while another one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key BLOB PRIMARY KEY, namespace TEXT NOT NULL, version TEXT NOT NULL, "
+                "value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            stale = conn.execute(
+                "DELETE FROM results WHERE namespace = ? AND version != ?",
+                (self.namespace, self.version)
+            ).rowcount
+            if stale:
+                logger.info(f"Dropped {stale} cached {self.namespace} results from older versions")
+            self._disk_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            self._disk = conn
+        return self._disk
+
+    def _disk_get_many(self, keys: List[bytes]) -> List[Any]:
+        try:
+            rows = {}
+            with self._disk_lock:
+                conn = self._connection()
+                # SQLite allows at most 999 parameters per statement
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    rows.update(
+                        (row[0], row[1:]) for row in conn.execute(
+                            "SELECT key, value, accessed FROM results WHERE key IN "
+                            f"({', '.join('?' * len(chunk))})",
+                            chunk
+                        )
+                    )
+                now = time.time()
+                # Recency only needs to be approximate; skip most writes on hot keys
+                touched = [(now, key) for key, (_, accessed) in rows.items() if now - accessed > 60]
+                if touched:
+                    conn.executemany("UPDATE results SET accessed = ? WHERE key = ?", touched)
+            return [json.loads(rows[key][0]) if key in rows else _MISSING for key in keys]
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            logger.warning(f"Result cache read failed: {str(e)}")
+            return [_MISSING] * len(keys)
+
+    def _disk_put_many(self, items: List[Tuple[bytes, Any]]) -> None:
+        rows = {}
+        for key, value in items:
+            data = json.dumps(value)
+            rows[key] = (key, self.namespace, self.version, data, len(data) + len(key))
+        try:
+            with self._disk_lock:
+                conn = self._connection()
+                conn.execute("BEGIN")
+                try:
+                    # Overwritten rows give their old size back
+                    replaced = 0
+                    keys = list(rows)
+                    for start in range(0, len(keys), 500):
+                        chunk = keys[start:start + 500]
+                        replaced += conn.execute(
+                            "SELECT COALESCE(SUM(size), 0) FROM results WHERE key IN "
+                            f"({', '.join('?' * len(chunk))})",
+                            chunk
+                        ).fetchone()[0]
+                    now = time.time()
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO results (key, namespace, version, value, size, accessed) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [row + (now,) for row in rows.values()]
+                    )
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    conn.execute("ROLLBACK")
+                    raise
+                self._disk_bytes += sum(row[4] for row in rows.values()) - replaced
+                if self._disk_bytes > self.disk_max_bytes:
+                    self._evict_disk(conn)
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            logger.warning(f"Result cache write failed: {str(e)}")
+
+    def _evict_disk(self, conn: sqlite3.Connection) -> None:
+        # Other workers write too, so recount before deciding how much to drop
+        self._disk_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+        # Drop the least recently used rows until 10% below the limit
+        target = int(self.disk_max_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = conn.execute("SELECT key, size FROM results ORDER BY accessed LIMIT 256").fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                if self._disk_bytes <= target:
+                    break
+                doomed.append((key,))
+                self._disk_bytes -= size
+            conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+            self.disk_evictions += len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.disk_path is not None:
+            with self._disk_lock:
+                self._connection().execute("DELETE FROM results WHERE namespace = ?", (self.namespace,))
+                self._disk_bytes = self._disk.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM results"
+                ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._disk_lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def stats(self) -> Dict:
+        """Hit rates per tier, for judging whether the cache pays off."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "version": self.version,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "disk_bytes": self._disk_bytes if self.disk_path is not None else None,
+            "disk_evictions": self.disk_evictions,
+            "disk_errors": self.disk_errors,
+        }
+
+
+def result_cache(namespace: str, version: str) -> ResultCache:
+    """A ResultCache configured from RESULT_CACHE_SIZE, RESULT_CACHE_PATH and RESULT_CACHE_MAX_MB."""
+    return ResultCache(
+        namespace,
+        version,
+        max_entries=int(os.getenv("RESULT_CACHE_SIZE", "10000")),
+        disk_path=os.getenv("RESULT_CACHE_PATH") or None,
+        disk_max_bytes=int(float(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 2**20),
+    )
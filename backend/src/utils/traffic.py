@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Responses that count against a host's health
+FAILURE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class HostUnavailable(httpx.TransportError):
+    """Raised without a request while a host's circuit is open or its queue is too long."""
+
+
+class TokenBucket:
+    """``rate`` requests per second with bursts of up to ``burst``.
+
+    ``reserve`` takes a token and returns how long to wait for it, so
+    callers queue without a lock and in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self) -> None:
+        self.tokens += 1
+
+    def pause(self, seconds: float) -> None:
+        """Hold back requests for ``seconds``, e.g. for a Retry-After."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class LatencyEstimate:
+    """Smoothed latency and its variation, as TCP estimates round-trip time (RFC 6298)."""
+
+    def __init__(self):
+        self.mean: Optional[float] = None
+        self.deviation = 0.0
+        self.samples = 0
+
+    def add(self, seconds: float) -> None:
+        if self.mean is None:
+            self.mean = seconds
+            self.deviation = seconds / 2
+        else:
+            self.deviation = 0.75 * self.deviation + 0.25 * abs(self.mean - seconds)
+            self.mean = 0.875 * self.mean + 0.125 * seconds
+        self.samples += 1
+
+    @property
+    def bound(self) -> Optional[float]:
+        """A latency few healthy responses exceed."""
+        return None if self.mean is None else self.mean + 4 * self.deviation
+
+
+class CircuitBreaker:
+    """Closed, open after ``failure_threshold`` consecutive failures, then half-open.
+
+    An open circuit rejects requests for ``cooldown`` seconds, doubling up to
+    ``max_cooldown`` each time a half-open probe fails. Half-open lets a
+    single probe through; its success closes the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self._probing = False
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.open_until - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() < self.open_until:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def release(self) -> None:
+        """Give back a probe whose request ended without an outcome (e.g. was cancelled)."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self, duration: Optional[float] = None) -> None:
+        self.trips += 1
+        if duration is None:
+            duration = min(self.cooldown * 2 ** (self.trips - 1), self.max_cooldown)
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + duration
+        self._probing = False
+
+
+class HostState:
+    def __init__(self, controller: "TrafficController"):
+        self.bucket = TokenBucket(controller.rate, controller.burst) if controller.rate > 0 else None
+        self.latency = LatencyEstimate()
+        self.breaker = CircuitBreaker(controller.failure_threshold, controller.cooldown, controller.max_cooldown)
+
+
+class TrafficController:
+    """Per-host rate limits, timeouts and circuit breakers for outbound HTTP.
+
+    Each host gets a token bucket (``rate`` per second, ``burst``), a
+    latency estimate and a circuit breaker. Once ``min_samples`` responses
+    have been timed, connect/read/write timeouts for the host shrink to
+    ``timeout_factor`` times its latency bound (never below
+    ``min_timeout`` or above the client's timeout), so a host that turns
+    slow fails in seconds rather than after the full client timeout. After
+    ``failure_threshold`` consecutive failures requests to the host fail
+    immediately with HostUnavailable until a probe succeeds. State is kept
+    for the ``max_hosts`` most recently used hosts.
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        burst: float = 10.0,
+        max_wait: float = 5.0,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+        min_samples: int = 5,
+        timeout_factor: float = 3.0,
+        min_timeout: float = 2.0,
+        max_hosts: int = 10000
+    ):
+        self.rate = rate
+        self.burst = burst
+        # Requests that would queue longer than this for a token fail instead
+        self.max_wait = max_wait
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.min_samples = min_samples
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self.max_hosts = max_hosts
+        self._hosts: "OrderedDict[str, HostState]" = OrderedDict()
+        self.requests = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def host(self, name: str) -> HostState:
+        state = self._hosts.get(name)
+        if state is None:
+            state = self._hosts[name] = HostState(self)
+            if len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+        else:
+            self._hosts.move_to_end(name)
+        return state
+
+    def timeout_for(self, state: HostState) -> Optional[float]:
+        """The adaptive timeout for a host, once enough of its responses were timed."""
+        bound = state.latency.bound
+        if state.latency.samples < self.min_samples or bound is None:
+            return None
+        return max(self.min_timeout, self.timeout_factor * bound)
+
+    def stats(self) -> Dict:
+        return {
+            "hosts": len(self._hosts),
+            "open_circuits": sum(
+                1 for state in self._hosts.values() if state.breaker.state != CircuitBreaker.CLOSED
+            ),
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+        }
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after", "")
+    return float(value) if value.isdigit() else None
+
+
+class TrafficControlTransport(httpx.AsyncBaseTransport):
+    """An httpx transport that sends requests through a TrafficController."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, controller: TrafficController):
+        self.transport = transport
+        self.controller = controller
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        controller = self.controller
+        host = request.url.host
+        state = controller.host(host)
+        breaker = state.breaker
+        if not breaker.allow():
+            controller.rejected += 1
+            raise HostUnavailable(
+                f"{host} is failing; retrying in {breaker.retry_after:.0f}s", request=request
+            )
+        settled = False
+        try:
+            if state.bucket is not None:
+                delay = state.bucket.reserve()
+                if delay > controller.max_wait:
+                    state.bucket.refund()
+                    controller.rejected += 1
+                    raise HostUnavailable(f"{host} is rate limited for {delay:.1f}s", request=request)
+                if delay:
+                    controller.throttled += 1
+                    await asyncio.sleep(delay)
+
+            adaptive = controller.timeout_for(state)
+            if adaptive is not None:
+                timeouts = dict(request.extensions.get("timeout") or {})
+                for phase in ("connect", "read", "write"):
+                    current = timeouts.get(phase)
+                    timeouts[phase] = adaptive if current is None else min(current, adaptive)
+                request.extensions = {**request.extensions, "timeout": timeouts}
+
+            controller.requests += 1
+            started = time.monotonic()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                settled = True
+                controller.failures += 1
+                if isinstance(e, httpx.TimeoutException):
+                    controller.timeouts += 1
+                    # A timeout is a (censored) latency sample too, so timeouts widen
+                    state.latency.add(time.monotonic() - started)
+                breaker.record_failure()
+                raise
+            state.latency.add(time.monotonic() - started)
+            settled = True
+            if response.status_code in FAILURE_STATUSES:
+                controller.failures += 1
+                retry_after = _retry_after(response)
+                if retry_after and response.status_code in (429, 503):
+                    # The host said when to come back
+                    if state.bucket is not None:
+                        state.bucket.pause(min(retry_after, controller.max_cooldown))
+                    breaker.trip(min(retry_after, controller.max_cooldown))
+                else:
+                    breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+        finally:
+            if not settled:
+                breaker.release()
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_traffic: Optional[TrafficController] = None
+
+
+def traffic_controller() -> TrafficController:
+    """The process-wide TrafficController, configured from HOST_RATE, HOST_BURST and CIRCUIT_* settings."""
+    global _traffic
+    if _traffic is None:
+        _traffic = TrafficController(
+            rate=float(os.getenv("HOST_RATE", "5")),
+            burst=float(os.getenv("HOST_BURST", "10")),
+            max_wait=float(os.getenv("HOST_MAX_WAIT", "5")),
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURES", "5")),
+            cooldown=float(os.getenv("CIRCUIT_COOLDOWN", "30")),
+            min_timeout=float(os.getenv("ADAPTIVE_MIN_TIMEOUT", "2")),
+        )
+    return _traffic
@@ -0,0 +1,412 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    # Epoch seconds: served as is until fresh_until, then served while being
+    # refreshed until stale_until, then gone
+    fresh_until: float
+    stale_until: float
+
+    def encode(self) -> str:
+        return json.dumps([self.value, self.fresh_until, self.stale_until])
+
+    @classmethod
+    def decode(cls, data: str) -> "CacheEntry":
+        value, fresh_until, stale_until = json.loads(data)
+        return cls(value, fresh_until, stale_until)
+
+
+class SharedTier:
+    """Cache storage shared by every worker, with advisory per-key locks.
+
+    ``acquire`` returns an owner token, or None when another worker holds
+    the key; locks expire after ``ttl`` seconds so a crashed worker cannot
+    block a key for good.
+    """
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        raise NotImplementedError
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        raise NotImplementedError
+
+    async def release(self, key: str, owner: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteTier(SharedTier):
+    """A SQLite file shared by the workers on one host.
+
+    Entries past their stale deadline are purged, then the least recently
+    used ones, once the file grows past ``max_bytes``.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, stale_until REAL NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _run(self, fn: Callable, *args) -> Any:
+        try:
+            with self._lock:
+                return fn(self._connection(), *args)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared cache operation failed: {str(e)}")
+            return None
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return await asyncio.to_thread(self._run, self._get, key)
+
+    def _get(self, conn: sqlite3.Connection, key: str) -> Optional[CacheEntry]:
+        row = conn.execute("SELECT value, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        # Recency only needs to be approximate; skip most writes on hot keys
+        if now - row[1] > 60:
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return CacheEntry.decode(row[0])
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        await asyncio.to_thread(self._run, self._set, key, entry.encode(), entry.stale_until)
+
+    def _set(self, conn: sqlite3.Connection, key: str, data: str, stale_until: float) -> None:
+        size = len(data) + len(key)
+        old = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, stale_until, size, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, data, stale_until, size, time.time())
+        )
+        self._bytes += size - (old[0] if old else 0)
+        if self._bytes > self.max_bytes:
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        self.evictions += conn.execute("DELETE FROM entries WHERE stale_until < ?", (time.time(),)).rowcount
+        # Other workers write too, so recount before deciding how much to drop
+        self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        # Drop the least recently used rows until 10% below the limit
+        target = int(self.max_bytes * 0.9)
+        while self._bytes > target:
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY accessed LIMIT 256").fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                if self._bytes <= target:
+                    break
+                doomed.append((key,))
+                self._bytes -= size
+            conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+            self.evictions += len(doomed)
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        owner = uuid.uuid4().hex
+        taken = await asyncio.to_thread(self._run, self._acquire, key, owner, ttl)
+        # Without a working lock table, compute rather than wait on nobody
+        return None if taken is False else owner
+
+    def _acquire(self, conn: sqlite3.Connection, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        # Take the lock if it is free or its holder's time ran out
+        taken = conn.execute(
+            "INSERT INTO locks (key, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE locks.expires < ?",
+            (key, owner, now + ttl, now)
+        ).rowcount
+        return bool(taken)
+
+    async def release(self, key: str, owner: str) -> None:
+        await asyncio.to_thread(self._run, self._release, key, owner)
+
+    def _release(self, conn: sqlite3.Connection, key: str, owner: str) -> None:
+        conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RedisTier(SharedTier):
+    """Redis, or any server speaking its protocol, shared by workers on many hosts.
+
+    Needs the optional ``redis`` package. Entries expire on the server at
+    their stale deadline; locks are ``SET NX PX`` keys. While the server is
+    unreachable every lookup is a miss and every lock is granted.
+    """
+
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url: str, prefix: str = "athena:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("A redis:// shared cache needs the redis package (pip install redis)") from None
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._errors = redis.RedisError
+        self.errors = 0
+
+    async def _call(self, operation: Awaitable, default: Any = None) -> Any:
+        try:
+            return await operation
+        except self._errors as e:
+            self.errors += 1
+            logger.warning(f"Shared cache operation failed: {str(e)}")
+            return default
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        data = await self._call(self.client.get(self.prefix + key))
+        return None if data is None else CacheEntry.decode(data)
+
+    async def set(self, key: str, entry: CacheEntry) -> None:
+        ttl = int((entry.stale_until - time.time()) * 1000)
+        if ttl > 0:
+            await self._call(self.client.set(self.prefix + key, entry.encode(), px=ttl))
+
+    async def acquire(self, key: str, ttl: float) -> Optional[str]:
+        owner = uuid.uuid4().hex
+        taken = await self._call(
+            self.client.set(f"{self.prefix}lock:{key}", owner, nx=True, px=int(ttl * 1000)), default=True
+        )
+        return owner if taken else None
+
+    async def release(self, key: str, owner: str) -> None:
+        # Only the holder deletes the lock, atomically
+        await self._call(self.client.eval(self._RELEASE, 1, f"{self.prefix}lock:{key}", owner))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def shared_tier(url: Optional[str], max_bytes: int = 64 * 2**20) -> Optional[SharedTier]:
+    """A shared tier for ``sqlite:///path/to/file.db`` or ``redis://host:port/db`` URLs."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteTier(url[len("sqlite:///"):], max_bytes)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisTier(url)
+    raise ValueError(f"Unsupported shared cache URL: {url}")
+
+
+class TTLCache:
+    """Async read-through cache with expiry, stale-while-revalidate and stampede control.
+
+    ``get(key, compute)`` returns a cached value for up to ``ttl`` seconds.
+    For ``stale_ttl`` seconds after that the old value is still returned at
+    once while one background task recomputes it. Values live in a bounded
+    in-process LRU and, with a ``shared`` tier, in storage every worker
+    sees, so one worker's result serves the others. Concurrent misses for a
+    key run ``compute`` once per process (SingleFlight) and, through the
+    shared tier's lock, about once across workers: the others wait up to
+    ``lock_timeout`` for the holder's result. Failed computations are not
+    cached, and a failed background refresh leaves the stale value in
+    place. Values must be JSON serializable.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        version: str = "1",
+        ttl: float = 3600.0,
+        stale_ttl: float = 3600.0,
+        max_entries: int = 10000,
+        shared: Optional[SharedTier] = None,
+        lock_timeout: float = 5.0,
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None
+    ):
+        self.namespace = namespace
+        self.version = version
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.lock_timeout = lock_timeout
+        # Per-value freshness, e.g. shorter for partial results; None means ``ttl``
+        self.ttl_for = ttl_for
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._flight = SingleFlight()
+        self._refreshing: Set[asyncio.Task] = set()
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.computations = 0
+        self.peer_waits = 0
+        self.refresh_failures = 0
+        self.evictions = 0
+
+    def key(self, key: str) -> str:
+        digest = hashlib.blake2b(f"{self.namespace}\0{self.version}\0{key}".encode("utf-8"), digest_size=16)
+        return f"{self.namespace}:{digest.hexdigest()}"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        digest = self.key(key)
+        now = time.time()
+        entry = self._entries.get(digest)
+        if entry is not None:
+            self._entries.move_to_end(digest)
+            if now >= entry.stale_until:
+                del self._entries[digest]
+                entry = None
+            elif now < entry.fresh_until:
+                self.memory_hits += 1
+                return copy.deepcopy(entry.value)
+        if entry is None and self.shared is not None:
+            entry = await self.shared.get(digest)
+            if entry is not None and now < entry.stale_until:
+                self._remember(digest, entry)
+                if now < entry.fresh_until:
+                    self.shared_hits += 1
+                    return copy.deepcopy(entry.value)
+            else:
+                entry = None
+        if entry is not None:
+            self.stale_hits += 1
+            self._refresh(digest, compute)
+            return copy.deepcopy(entry.value)
+        self.misses += 1
+        value = await self._flight.do(digest, lambda: self._load(digest, compute))
+        return copy.deepcopy(value)
+
+    def _refresh(self, digest: str, compute: Callable[[], Awaitable[Any]]) -> None:
+        """Recompute a stale entry in the background, once."""
+        if digest in self._flight:
+            return
+        task = asyncio.ensure_future(self._flight.do(digest, lambda: self._load(digest, compute)))
+        self._refreshing.add(task)
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task: asyncio.Task) -> None:
+        self._refreshing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.refresh_failures += 1
+            logger.warning(f"Background refresh of a {self.namespace} entry failed: {str(task.exception())}")
+
+    async def _load(self, digest: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        owner = None
+        if self.shared is not None:
+            owner = await self.shared.acquire(digest, self.lock_timeout)
+            if owner is None:
+                entry = await self._wait_for_peer(digest)
+                if entry is not None:
+                    self._remember(digest, entry)
+                    return entry.value
+        try:
+            self.computations += 1
+            value = await compute()
+            now = time.time()
+            ttl = self.ttl_for(value) if self.ttl_for is not None else None
+            if ttl is None:
+                ttl = self.ttl
+            entry = CacheEntry(value, now + ttl, now + ttl + self.stale_ttl)
+            self._remember(digest, entry)
+            if self.shared is not None:
+                await self.shared.set(digest, entry)
+            return value
+        finally:
+            if owner is not None:
+                await self.shared.release(digest, owner)
+
+    async def _wait_for_peer(self, digest: str) -> Optional[CacheEntry]:
+        """Poll the shared tier while another worker computes the entry."""
+        self.peer_waits += 1
+        started = time.time()
+        delay = 0.02
+        while time.time() - started < self.lock_timeout:
+            await asyncio.sleep(delay)
+            entry = await self.shared.get(digest)
+            if entry is not None and entry.fresh_until > started:
+                return entry
+            delay = min(delay * 2, 0.25)
+        return None
+
+    def _remember(self, digest: str, entry: CacheEntry) -> None:
+        self._entries[digest] = entry
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def close(self) -> None:
+        for task in list(self._refreshing):
+            task.cancel()
+        await asyncio.gather(*self._refreshing, return_exceptions=True)
+        if self.shared is not None:
+            await self.shared.close()
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.shared_hits + self.stale_hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "shared_hits": self.shared_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.shared_hits + self.stale_hits) / lookups if lookups else 0.0,
+            "computations": self.computations,
+            "peer_waits": self.peer_waits,
+            "refresh_failures": self.refresh_failures,
+            "evictions": self.evictions,
+        }
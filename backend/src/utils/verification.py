@@ -1,59 +1,142 @@
+import asyncio
 import httpx
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+import os
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+from datetime import datetime
 import logging
+from ..services.domain_reputation import TRUSTED_SCORE, DomainReputationIndex, get_domain_reputation, normalize_host
+from .http_cache import cached_client
+from .ttl_cache import TTLCache, shared_tier
 
 logger = logging.getLogger(__name__)
 
+# Bump when verification results change shape so cached ones are not reused
+VERIFICATION_VERSION = 2
+
+# Seconds each fact-checking backend gets to answer
+FACT_CHECK_DEADLINE = float(os.getenv("FACT_CHECK_DEADLINE", "3"))
+# Domains verified at once by one verifier
+VERIFY_CONCURRENCY = int(os.getenv("VERIFY_CONCURRENCY", "16"))
+# Results missing a backend are kept this long, so the gap is retried soon
+PARTIAL_RESULT_TTL = float(os.getenv("VERIFY_PARTIAL_TTL", "60"))
+
+_verification_cache: Optional[TTLCache] = None
+
+
+def verification_cache() -> TTLCache:
+    """The process-wide cache of domain verifications.
+
+    Configured from VERIFY_CACHE_TTL, VERIFY_CACHE_STALE and VERIFY_CACHE_SIZE;
+    SHARED_CACHE_URL (``sqlite:///path`` or ``redis://...``) shares results
+    between workers.
+    """
+    global _verification_cache
+    if _verification_cache is None:
+        _verification_cache = TTLCache(
+            "verify_source",
+            str(VERIFICATION_VERSION),
+            ttl=float(os.getenv("VERIFY_CACHE_TTL", "3600")),
+            stale_ttl=float(os.getenv("VERIFY_CACHE_STALE", "3600")),
+            max_entries=int(os.getenv("VERIFY_CACHE_SIZE", "10000")),
+            ttl_for=_verification_ttl,
+            shared=shared_tier(
+                os.getenv("SHARED_CACHE_URL"),
+                max_bytes=int(float(os.getenv("SHARED_CACHE_MAX_MB", "64")) * 2**20),
+            ),
+        )
+    return _verification_cache
+
+
+def _verification_ttl(result: Dict[str, Any]) -> Optional[float]:
+    """Keep results missing a fact-checking backend only briefly."""
+    return PARTIAL_RESULT_TTL if result.get('unavailable_services') else None
+
+
 class SourceVerifier:
-    def __init__(self):
-        self.cache = {}
-        self.cache_ttl = timedelta(hours=1)
+    def __init__(
+        self,
+        reputation: Optional[DomainReputationIndex] = None,
+        cache: Optional[TTLCache] = None,
+        concurrency: int = VERIFY_CONCURRENCY
+    ):
+        self.reputation = reputation if reputation is not None else get_domain_reputation()
+        self._client: Optional[httpx.AsyncClient] = None
+        # Verifications depend only on the domain, so they are cached per domain
+        self.cache = cache if cache is not None else verification_cache()
+        self._slots = asyncio.Semaphore(concurrency)
         self.fact_checking_apis = {
             'google_fact_check': 'https://factchecktools.googleapis.com/v1/claims:search',
             'media_bias_fact_check': 'https://mediabiasfactcheck.com/api/v1/check',
         }
+        # Per-backend deadlines in seconds; backends not listed get FACT_CHECK_DEADLINE
+        self.api_deadlines: Dict[str, float] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client for reputation and fact-checking APIs, through the shared HTTP cache."""
+        if self._client is None:
+            self._client = cached_client(timeout=10.0)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def verify_source(self, source_url: str) -> Dict[str, Any]:
         """Verify the credibility of a source URL"""
-        # Check cache first
-        if source_url in self.cache:
-            cached = self.cache[source_url]
-            if datetime.now() - cached['timestamp'] < self.cache_ttl:
-                return cached['data']
-
-        try:
-            # Check domain reputation (placeholder implementation)
-            domain = self._extract_domain(source_url)
-            reputation = await self._check_domain_reputation(domain)
-            
-            # Check fact-checking databases
-            fact_checks = await self._check_fact_checking_apis(domain)
-            
-            result = {
-                'source_url': source_url,
-                'domain': domain,
-                'reputation_score': reputation.get('score', 0.5),
-                'is_trusted': reputation.get('is_trusted', False),
-                'fact_checks': fact_checks,
-                'last_checked': datetime.utcnow().isoformat()
-            }
-            
-            # Cache the result
-            self.cache[source_url] = {
-                'data': result,
-                'timestamp': datetime.now()
-            }
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Error verifying source {source_url}: {str(e)}")
-            return {
-                'source_url': source_url,
-                'error': str(e),
+        return (await self.verify_sources([source_url]))[source_url]
+
+    async def verify_sources(self, source_urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Verify many source URLs in one call, checking each domain once.
+        
+        URLs are grouped by host. Each host is looked up in the cache or
+        verified once, up to ``concurrency`` hosts at a time, and concurrent
+        callers for a host share the same check. Returns a result for every
+        URL, keyed by URL in input order; URLs that could not be verified
+        get an ``error`` instead.
+        """
+        domains = {url: self._extract_domain(url) for url in source_urls}
+        unique = [domain for domain in dict.fromkeys(domains.values()) if domain]
+        verified = await asyncio.gather(
+            *(self._verify_domain_limited(domain) for domain in unique), return_exceptions=True
+        )
+        by_domain = dict(zip(unique, verified))
+        results = {}
+        for url, domain in domains.items():
+            result = by_domain.get(domain)
+            if isinstance(result, dict):
+                results[url] = {'source_url': url, **result}
+                continue
+            error = str(result) if result is not None else 'URL has no host'
+            logger.error(f"Error verifying source {url}: {error}")
+            results[url] = {
+                'source_url': url,
+                'error': error,
                 'is_trusted': False
             }
+        return results
+
+    async def _verify_domain_limited(self, domain: str) -> Dict[str, Any]:
+        async with self._slots:
+            return await self.cache.get(domain, lambda: self._verify_domain(domain))
+
+    async def _verify_domain(self, domain: str) -> Dict[str, Any]:
+        # Domain reputation and every fact-checking database, at once
+        reputation, (fact_checks, unavailable) = await asyncio.gather(
+            self._check_domain_reputation(domain),
+            self._check_fact_checking_apis(domain),
+        )
+        result = {
+            'domain': domain,
+            'reputation_score': reputation.get('score', 0.5),
+            'is_trusted': reputation.get('is_trusted', False),
+            'fact_checks': fact_checks,
+            'last_checked': datetime.utcnow().isoformat()
+        }
+        if unavailable:
+            result['unavailable_services'] = unavailable
+        return result
     
     async def fact_check_claim(self, claim: str) -> Dict[str, Any]:
         """Check a specific claim against fact-checking services"""
@@ -67,25 +150,54 @@ class SourceVerifier:
         }
     
     def _extract_domain(self, url: str) -> str:
-        """Extract domain from URL"""
-        # Simple domain extraction (improve with urllib.parse for production)
-        return url.split('//')[-1].split('/')[0].lower()
+        """Extract the host from a URL"""
+        return normalize_host(url)
     
     async def _check_domain_reputation(self, domain: str) -> Dict[str, Any]:
-        """Check domain reputation (placeholder implementation)"""
-        # In a real implementation, this would call a reputation service
+        """Check domain reputation against the shared domain reputation index"""
+        entry = self.reputation.lookup(domain)
+        if entry is None:
+            return {
+                'score': self.reputation.default_score,  # 0-1 scale
+                'is_trusted': False,
+                'reasons': ['Domain is not in our sources list']
+            }
         return {
-            'score': 0.8,  # 0-1 scale
-            'is_trusted': True,
-            'reasons': ['Domain is in our trusted sources list']
+            'score': entry.score,
+            'is_trusted': entry.score >= TRUSTED_SCORE,
+            'reasons': [f'{entry.domain} is in our sources list ({entry.origin})']
         }
     
-    async def _check_fact_checking_apis(self, domain: str) -> List[Dict[str, Any]]:
-        """Check fact-checking APIs (placeholder implementation)"""
-        # In a real implementation, this would make API calls to fact-checking services
+    async def _check_fact_checking_apis(self, domain: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Query every fact-checking backend concurrently, each within its deadline.
+        
+        Returns the findings of the backends that answered in time and the
+        names of those that failed or timed out.
+        """
+        services = list(self.fact_checking_apis.items())
+        answers = await asyncio.gather(*(
+            asyncio.wait_for(
+                self._query_fact_checking_api(service, endpoint, domain),
+                self.api_deadlines.get(service, FACT_CHECK_DEADLINE)
+            )
+            for service, endpoint in services
+        ), return_exceptions=True)
+        fact_checks = []
+        unavailable = []
+        for (service, _), answer in zip(services, answers):
+            if isinstance(answer, BaseException):
+                logger.warning(f"Fact-checking service {service} failed for {domain}: {type(answer).__name__} {answer}")
+                unavailable.append(service)
+            else:
+                fact_checks.extend(answer)
+        return fact_checks, unavailable
+    
+    async def _query_fact_checking_api(self, service: str, endpoint: str, domain: str) -> List[Dict[str, Any]]:
+        """Ask one fact-checking service about a domain (placeholder implementation)"""
+        # In a real implementation, this would call ``endpoint`` through self.client
         return [
             {
-                'service': 'Sample Fact Checker',
+                'service': service,
                 'rating': 'mostly_true',
                 'confidence': 0.9,
                 'url': f"https://factcheck.example.com/check?domain={domain}"
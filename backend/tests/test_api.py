@@ -1,6 +1,16 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import textwrap
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from main import app
+from src.database import Base, get_async_db
+from src.services import fact_checking_service
+from src.services.claim_cache import NearDuplicateCache
 
 client = TestClient(app)
 
@@ -10,4 +20,99 @@ def test_root_endpoint():
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to Athena API"}
 
-# Add more test cases as needed
+# Seconds `import main` may take in a fresh interpreter
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "3"))
+
+def test_import_main_is_fast_and_offline():
+    """Test that importing the app does no network or NLP loading work and stays within budget"""
+    probe = textwrap.dedent("""
+        import json, socket, sys, time
+        attempts = []
+        def offline(*args, **kwargs):
+            attempts.append(repr(args[:2]))
+            raise OSError("network access at import time")
+        socket.getaddrinfo = offline
+        socket.socket.connect = offline
+        start = time.perf_counter()
+        import main
+        print(json.dumps({
+            "seconds": time.perf_counter() - start,
+            "network": attempts,
+            "loaded": [name for name in ("nltk", "spacy", "speech_recognition") if name in sys.modules],
+        }))
+    """)
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=backend, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["network"] == []
+    # NLP libraries and data load lazily, in the workers
+    assert report["loaded"] == []
+    assert report["seconds"] < IMPORT_TIME_BUDGET, f"import main took {report['seconds']:.2f}s"
+
+@pytest.mark.parametrize("accept", ["text/event-stream", "application/x-ndjson"])
+def test_analyze_stream_sends_stages_in_order(tmp_path, monkeypatch, accept):
+    """Test the streaming analysis endpoint emits each stage, then the verdict"""
+
+    class KeywordStub:
+        async def extract_keywords(self, text):
+            return [word for word in text.lower().split() if len(word) > 3]
+
+        async def extract_keywords_batch(self, texts):
+            return [await self.extract_keywords(text) for text in texts]
+
+    class SearchStub:
+        async def search(self, text, max_results=10):
+            return [
+                {"url": "https://apnews.com/a", "domain": "apnews.com", "title": "A",
+                 "snippet": text, "credibility_score": 0.6},
+                {"url": "https://snopes.com/b", "domain": "snopes.com", "title": "B",
+                 "snippet": text, "credibility_score": 0.9},
+            ]
+
+        async def index_pages(self, pages):
+            return 0
+
+    monkeypatch.setattr(fact_checking_service, "TextProcessor", KeywordStub)
+    monkeypatch.setattr(fact_checking_service, "WebSearcher", SearchStub)
+    monkeypatch.setattr(fact_checking_service, "default_claim_cache", NearDuplicateCache())
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'athena.db'}")
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_tables())
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def override_db():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override_db
+    try:
+        response = client.post(
+            "/api/misinformation/analyze/stream",
+            json={"text": "Vaccines contain microchips"},
+            headers={"Accept": accept}
+        )
+    finally:
+        app.dependency_overrides.clear()
+        asyncio.run(engine.dispose())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(accept)
+    if accept == "application/x-ndjson":
+        events = [json.loads(line) for line in response.text.splitlines()]
+    else:
+        events = []
+        for message in response.text.strip().split("\n\n"):
+            name, data = message.split("\n")
+            events.append({"event": name[len("event: "):], "data": json.loads(data[len("data: "):])})
+
+    assert [e["event"] for e in events] == ["query", "source", "source", "verdict"]
+    assert [e["data"]["domain"] for e in events[1:3]] == ["snopes.com", "apnews.com"]
+    assert events[-1]["data"]["query_id"] == events[0]["data"]["query_id"]
+    assert events[-1]["data"]["sources"] == [e["data"] for e in events[1:3]]
@@ -0,0 +1,1118 @@
+import pytest
+import asyncio
+import os
+import sys
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.database import Base
+from src.models.fact_checking_models import (
+    UserQuery, VerifiedFact, ExternalSource, ContentType, VerificationStatus
+)
+from src.services import fact_checking_service
+from src.services.claim_index import MemoryClaimIndex, SQLiteClaimIndex, get_claim_index
+from src.services.claim_cache import NearDuplicateCache
+from src.services.transcription import PCMWindower, Recognizer, StreamingTranscriber, stitch
+from src.services.write_behind import WriteBehindQueue
+from src.utils.single_flight import SingleFlight
+from src.utils.result_cache import ResultCache
+
+
+class KeywordStub:
+    """Stand-in for TextProcessor that does not need the spaCy model"""
+
+    async def extract_keywords(self, text, top_n=10):
+        return [word for word in text.lower().split() if len(word) > 3][:top_n]
+
+    async def extract_keywords_batch(self, texts, top_n=10, batch_size=64, n_process=1):
+        return [await self.extract_keywords(text, top_n) for text in texts]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def service(db, monkeypatch):
+    monkeypatch.setattr(fact_checking_service, "TextProcessor", KeywordStub)
+    return fact_checking_service.FactCheckingService(db, claim_cache=NearDuplicateCache())
+
+
+@pytest.mark.parametrize("index_class", [MemoryClaimIndex, SQLiteClaimIndex])
+def test_claim_index_ranks_by_relevance(db, index_class):
+    """Test that claim indexes require every term and rank by relevance"""
+    index = index_class()
+    index.add_many(db, [
+        (1, "vaccines cause autism claims debunked"),
+        (2, "vaccines vaccines autism autism"),
+        (3, "moon landing was staged"),
+    ])
+    results = index.search(db, ["vaccines", "autism"])
+    assert [fact_id for fact_id, _ in results] == [2, 1]
+    assert index.search(db, ["vaccines", "moon"]) == []
+    assert {fact_id for fact_id, _ in index.search(db, ["vaccines", "moon"], match_all=False)} == {1, 2, 3}
+    # Both backends stem the same way
+    assert {fact_id for fact_id, _ in index.search(db, ["vaccine", "claimed"])} == {1}
+    assert index.search(db, ["landings", "staging"])[0][0] == 3
+
+
+def test_claim_index_hooks_are_abstract():
+    """Test that a claim index missing a backend hook cannot be created"""
+    from src.services.claim_index import ClaimIndex, _SQLClaimIndex
+
+    with pytest.raises(TypeError):
+        ClaimIndex()
+
+    class NoSelect(_SQLClaimIndex):
+        table = "t"
+
+    with pytest.raises(TypeError):
+        NoSelect()
+
+
+def test_sqlite_claim_index_setup_joins_a_writing_session(tmp_path):
+    """Test that setting the FTS table up inside a session holding the write lock does not wait on it"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'athena.db'}", connect_args={"timeout": 0.2})
+    Base.metadata.create_all(engine)
+    index = SQLiteClaimIndex()
+    with sessionmaker(bind=engine)() as session:
+        query = UserQuery(content="Fluoride in water lowers IQ", content_type=ContentType.TEXT)
+        session.add(query)
+        session.flush()
+        session.add(VerifiedFact(query_id=query.id, status=VerificationStatus.FALSE, summary="Debunked"))
+        session.flush()
+        assert index.search(session, ["fluoride", "water"])
+        assert not index._ready
+        session.rollback()
+        assert not index._ready
+    with sessionmaker(bind=engine)() as session:
+        session.execute(select(func.count()).select_from(UserQuery))
+        assert index.search(session, ["fluoride"]) == []
+        session.commit()
+    assert index._ready
+    engine.dispose()
+
+
+def test_get_claim_index_uses_fts5_for_sqlite(db):
+    """Test that SQLite sessions get the FTS5 backed index"""
+    assert isinstance(get_claim_index(db), SQLiteClaimIndex)
+    assert get_claim_index(db) is get_claim_index(db)
+
+
+def test_sqlite_claim_index_backfill_survives_uncommitted_sessions(tmp_path):
+    """Test that the FTS backfill commits on its own and refills an emptied table"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'athena.db'}")
+    Base.metadata.create_all(engine)
+    sessions = sessionmaker(bind=engine)
+    with sessions() as session:
+        query = UserQuery(content="Fluoride in water lowers IQ", content_type=ContentType.TEXT)
+        session.add(query)
+        session.flush()
+        session.add(VerifiedFact(query_id=query.id, status=VerificationStatus.FALSE, summary="Debunked"))
+        session.commit()
+
+    # The first lookup creates the table; its session then closes without committing
+    with sessions() as session:
+        assert SQLiteClaimIndex().search(session, ["fluoride", "water"])
+    with sessions() as session:
+        assert SQLiteClaimIndex().search(session, ["fluoride", "water"])
+
+    # A table left empty by a lost backfill is filled again on the next start
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DELETE FROM {SQLiteClaimIndex.table}")
+    with sessions() as session:
+        assert SQLiteClaimIndex().search(session, ["fluoride", "water"])
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_stored_sources_are_found_by_database_check(db, service):
+    """Test that facts written by the web path are indexed incrementally"""
+    query = UserQuery(content="5G towers spread the virus", content_type=ContentType.TEXT)
+    db.add(query)
+    db.commit()
+    assert await service._check_database("towers spread virus") is None
+
+    await service._store_external_sources(
+        [{
+            "url": "https://factcheck.org/5g",
+            "domain": "factcheck.org",
+            "title": "No, 5G does not spread viruses",
+            "snippet": "Radio waves cannot carry viruses.",
+            "credibility_score": 0.9,
+        }],
+        query.id,
+        query.content
+    )
+    fact = db.query(VerifiedFact).one()
+    fact.status = VerificationStatus.FALSE
+    db.commit()
+
+    result = await service._check_database("towers spread virus")
+    assert result["status"] == VerificationStatus.FALSE
+    assert result["summary"] == "Radio waves cannot carry viruses."
+
+
+def test_near_duplicate_cache_matches_reworded_claims():
+    """Test near-duplicate lookups, counters and LRU eviction"""
+    cache = NearDuplicateCache(threshold=0.85, max_entries=2)
+    cache.put("The COVID vaccine contains microchips for tracking people", {"verdict": "false"})
+    assert cache.get("the covid vaccine contains microchips for tracking people!!") == {"verdict": "false"}
+    assert cache.get("The COVID vaccine contains tiny microchips for tracking people") == {"verdict": "false"}
+    assert cache.get("The moon landing was staged in a studio in Nevada") is None
+
+    cache.put("The moon landing was staged in a studio in Nevada", {"verdict": "false"})
+    cache.put("Drinking bleach cures the flu according to doctors", {"verdict": "false"})
+    assert len(cache) == 2
+    assert cache.get("The COVID vaccine contains microchips for tracking people") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 1)
+
+
+@pytest.mark.asyncio
+async def test_process_query_reuses_near_duplicate_verdict(db, service, monkeypatch):
+    """Test that a reworded claim skips the web search path"""
+    calls = []
+
+    async def search(text, max_results=10):
+        calls.append(text)
+        return [{
+            "url": "https://apnews.com/bleach",
+            "domain": "apnews.com",
+            "title": "Bleach does not cure the flu",
+            "snippet": "Health officials warn against drinking bleach.",
+            "credibility_score": 0.9,
+        }]
+
+    monkeypatch.setattr(service.web_searcher, "search", search)
+    first = await service.process_query("Drinking bleach cures the flu, doctors say", ContentType.TEXT)
+    second = await service.process_query("drinking bleach cures the flu doctors say!", ContentType.TEXT)
+
+    assert len(calls) == 1
+    assert second["sources"] == first["sources"]
+    assert second["query_id"] != first["query_id"]
+    assert db.query(UserQuery).count() == 2
+
+
+@pytest.mark.asyncio
+async def test_process_queries_deduplicates_and_commits_once(db, service, monkeypatch):
+    """Test the batch entry point writes a whole batch in one transaction"""
+    searched = []
+
+    async def search(text, max_results=10):
+        searched.append(text)
+        return [{
+            "url": f"https://snopes.com/{len(searched)}",
+            "domain": "snopes.com",
+            "title": text,
+            "snippet": f"Fact check: {text}",
+            "credibility_score": 0.95,
+        }, {
+            "url": "https://reuters.com/shared",
+            "domain": "reuters.com",
+            "title": "Shared coverage",
+            "snippet": "Covers several claims",
+            "credibility_score": 0.9,
+        }]
+
+    commits = []
+    event.listen(db, "after_commit", lambda session: commits.append(session))
+    monkeypatch.setattr(service.web_searcher, "search", search)
+
+    claims = [
+        "Drinking bleach cures the flu",
+        "The moon landing was staged",
+        "Drinking bleach cures the flu",
+    ]
+    results = await service.process_queries([
+        {"content": claim, "content_type": ContentType.TEXT, "user_id": "moderator"}
+        for claim in claims
+    ])
+
+    assert sorted(searched) == sorted(set(claims))
+    assert len(commits) == 1
+    assert [r["query_id"] for r in results] == [q.id for q in db.query(UserQuery).order_by(UserQuery.id)]
+    assert results[0]["sources"] == results[2]["sources"]
+    assert db.query(ExternalSource).count() == 3
+    assert db.query(VerifiedFact).count() == 4
+
+
+@pytest.mark.asyncio
+async def test_store_external_sources_statement_count_is_constant(db, service):
+    """Test that storing sources does not issue a query per result"""
+    query = UserQuery(content="Claim with many sources", content_type=ContentType.TEXT)
+    db.add(query)
+    db.add(ExternalSource(url="https://bbc.com/known", domain="bbc.com", credibility_score=0.9))
+    db.commit()
+    query_id, content = query.id, query.content
+    service.claim_index.search(db, ["warm", "up"])
+
+    def results(count):
+        return [{
+            "url": "https://bbc.com/known" if i == 0 else f"https://example.org/{count}/{i}",
+            "domain": "example.org",
+            "title": f"Result {i}",
+            "snippet": "Snippet",
+            "credibility_score": 0.5,
+        } for i in range(count)]
+
+    statements = []
+    engine = db.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        await service._store_external_sources(results(2), query_id, content)
+        few = len(statements)
+        statements.clear()
+        await service._store_external_sources(results(10), query_id, content)
+        many = len(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    # IN prefetch, source upsert, fact insert, and the FTS delete/insert pair
+    assert few == many == 5
+    assert db.query(ExternalSource).count() == 1 + 1 + 9
+    assert db.query(VerifiedFact).count() == 12
+    assert all(fact.source_id is not None for fact in db.query(VerifiedFact))
+
+
+@pytest.mark.asyncio
+async def test_store_external_sources_without_returning(db, service, monkeypatch):
+    """Test that databases without ON CONFLICT or multi-row RETURNING still store sources"""
+    monkeypatch.setattr(db.get_bind().dialect, "insert_executemany_returning", False)
+    monkeypatch.setattr(service, "_upsert", lambda db, model: None)
+    query = UserQuery(content="Tap water contains microchips", content_type=ContentType.TEXT)
+    db.add(query)
+    db.commit()
+    await service._store_external_sources([{
+        "url": f"https://example.org/{i}",
+        "domain": "example.org",
+        "title": f"Result {i}",
+        "snippet": "Microchips in tap water",
+        "credibility_score": 0.5,
+    } for i in range(3)], query.id, query.content)
+
+    sources = {source.url: source.id for source in db.query(ExternalSource)}
+    assert len(sources) == 3
+    assert {fact.source_id for fact in db.query(VerifiedFact)} == set(sources.values())
+    assert service.claim_index.search(db, ["microchips", "water"])
+
+
+@pytest.mark.asyncio
+async def test_async_service_overlaps_concurrent_queries(tmp_path, monkeypatch):
+    """Test the AsyncSession backed service handles concurrent queries"""
+    monkeypatch.setattr(fact_checking_service, "TextProcessor", KeywordStub)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'athena.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    async with sessions() as db:
+        # Create the FTS table up front; doing it on the first lookup would
+        # hold SQLite's write lock while that request is searching
+        await db.run_sync(lambda session: get_claim_index(session).rebuild(session))
+        await db.commit()
+
+    in_flight = []
+    overlapped = asyncio.Event()
+
+    async def search(text, max_results=10):
+        # Each request waits here until the other one has arrived too
+        in_flight.append(text)
+        if len(in_flight) == 2:
+            overlapped.set()
+        await asyncio.wait_for(overlapped.wait(), timeout=5)
+        return [{
+            "url": f"https://politifact.com/{abs(hash(text))}",
+            "domain": "politifact.com",
+            "title": text,
+            "snippet": text,
+            "credibility_score": 0.95,
+        }]
+
+    async def check(claim):
+        async with sessions() as db:
+            service = fact_checking_service.AsyncFactCheckingService(db, claim_cache=NearDuplicateCache())
+            monkeypatch.setattr(service.web_searcher, "search", search)
+            return await service.process_query(claim, ContentType.TEXT)
+
+    claims = ["Wind turbines cause cancer", "Tap water contains mind control drugs"]
+    results = await asyncio.gather(*(check(claim) for claim in claims))
+
+    assert overlapped.is_set()
+    assert [r["sources"][0]["title"] for r in results] == claims
+    async with sessions() as db:
+        assert await db.scalar(select(func.count()).select_from(VerifiedFact)) == 2
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_identical_in_flight_queries_are_coalesced(db, service, monkeypatch):
+    """Test that identical concurrent claims share one pipeline run but are each recorded"""
+    service.single_flight = SingleFlight()
+    searched = []
+
+    async def search(text, max_results=10):
+        searched.append(text)
+        await asyncio.sleep(0.01)
+        return []
+
+    monkeypatch.setattr(service.web_searcher, "search", search)
+    results = await asyncio.gather(*(
+        service.process_query(claim, ContentType.TEXT)
+        for claim in ["Chemtrails control the weather", "chemtrails  control the weather!"] * 2
+    ))
+
+    assert len(searched) == 1
+    assert sorted(r["query_id"] for r in results) == [q.id for q in db.query(UserQuery).order_by(UserQuery.id)]
+    assert len({r["query_id"] for r in results}) == 4
+    assert service.single_flight.stats()["coalesced"] == 3
+
+
+@pytest.mark.asyncio
+async def test_coalesced_pipeline_outlives_the_leaders_session(db, service, monkeypatch):
+    """Test that the shared run keeps working after the request that started it closes its session"""
+    service.single_flight = SingleFlight()
+    leader_db = sessionmaker(bind=db.get_bind())()
+    leader = fact_checking_service.FactCheckingService(
+        leader_db, claim_cache=NearDuplicateCache(), single_flight=service.single_flight
+    )
+    monkeypatch.setattr(leader, "text_processor", service.text_processor)
+    searching = asyncio.Event()
+    release = asyncio.Event()
+
+    async def search(text, max_results=10):
+        searching.set()
+        await release.wait()
+        return [{"url": "https://politifact.com/chemtrails", "domain": "politifact.com",
+                 "title": "Chemtrails", "snippet": "No evidence", "credibility_score": 0.95}]
+
+    monkeypatch.setattr(leader.web_searcher, "search", search)
+    first = asyncio.ensure_future(leader.process_query("Chemtrails control the weather", ContentType.TEXT))
+    await searching.wait()
+    follower = asyncio.ensure_future(service.process_query("Chemtrails control the weather", ContentType.TEXT))
+    await asyncio.sleep(0)
+    # The leader's request goes away and its session is closed, as get_db does
+    first.cancel()
+    leader_db.close()
+    reopened = []
+    event.listen(leader_db, "after_begin", lambda *args: reopened.append(args))
+    release.set()
+    result = await follower
+
+    assert reopened == []
+    assert result["sources"][0]["url"] == "https://politifact.com/chemtrails"
+    assert db.query(VerifiedFact).count() == 1
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'athena.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_write_behind_queue_batches_and_spills(file_engine, tmp_path):
+    """Test size-triggered flushes, durable shutdown and spill replay"""
+    spill_path = str(tmp_path / "spill.jsonl")
+    log = WriteBehindQueue(file_engine, flush_size=3, flush_interval=60, spill_path=spill_path)
+    await log.start()
+    table = UserQuery.__table__
+    count = lambda: sessionmaker(bind=file_engine)().query(UserQuery).count()
+
+    for i in range(2):
+        log.enqueue(table, {"id": await log.ids.anext_id(table), "content": f"claim {i}", "content_type": ContentType.TEXT})
+    await asyncio.sleep(0.05)
+    assert count() == 0
+    log.enqueue(table, {"id": await log.ids.anext_id(table), "content": "claim 2", "content_type": ContentType.AUDIO})
+    await asyncio.sleep(0.05)
+    assert count() == 3
+
+    log.enqueue(table, {"id": await log.ids.anext_id(table), "content": "claim 3", "content_type": ContentType.TEXT})
+    await log.stop()
+    assert count() == 4
+
+    # A database that cannot be written spills to disk, and the next start replays it
+    broken = WriteBehindQueue(create_engine(f"sqlite:///{tmp_path / 'missing' / 'x.db'}"), spill_path=spill_path)
+    broken.enqueue(table, {"id": 100, "content": "spilled", "content_type": ContentType.VIDEO})
+    await broken.stop()
+    assert broken.stats()["spilled"] == 1
+
+    recovered = WriteBehindQueue(file_engine, spill_path=spill_path)
+    await recovered.start()
+    await recovered.stop()
+    assert recovered.stats()["replayed"] == 1
+    spilled = sessionmaker(bind=file_engine)().get(UserQuery, 100)
+    assert spilled.content_type == ContentType.VIDEO
+
+    # Rows the database rejects are set aside instead of blocking the others
+    for row_id in (100, 101):
+        broken.enqueue(table, {"id": row_id, "content": "again", "content_type": ContentType.TEXT})
+    await broken.stop()
+    with open(spill_path, "a", encoding="utf-8") as spill:
+        spill.write("{not json\n")
+    recovered = WriteBehindQueue(file_engine, spill_path=spill_path)
+    assert recovered.replay_spill() == 1
+    assert recovered.stats()["rejected"] == 2
+    assert not os.path.exists(spill_path)
+    with open(spill_path + ".rejected", encoding="utf-8") as quarantine:
+        assert len(quarantine.readlines()) == 2
+    assert count() == 6
+
+
+@pytest.mark.asyncio
+async def test_write_behind_take_returns_spilled_parents(file_engine, tmp_path, monkeypatch):
+    """Test that a spilled query can still be written before its facts, and that ids skip other writers' rows"""
+    spill_path = str(tmp_path / "spill.jsonl")
+    log = WriteBehindQueue(file_engine, spill_path=spill_path, id_block_size=10)
+    table = UserQuery.__table__
+    row = {"id": log.ids.next_id(table), "content": "spilled claim", "content_type": ContentType.TEXT}
+    log.enqueue(table, row)
+    write = log._write
+
+    def unavailable(batches):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(log, "_write", unavailable)
+    await log.flush()
+    monkeypatch.setattr(log, "_write", write)
+    assert log.stats()["spilled"] == 1
+    # The caller writes the parent with its children, then the replay skips it
+    taken = await log.take(table, row["id"])
+    assert taken == row
+    log._write({"user_queries": [taken]})
+    assert log.replay_spill() == 0
+    assert log.stats()["rejected"] == 0 and not os.path.exists(spill_path)
+
+    # A row inserted without the allocator pushes the next block past it
+    db = sessionmaker(bind=file_engine)()
+    db.add(UserQuery(id=500, content="from a script", content_type=ContentType.TEXT))
+    db.commit()
+    log.ids._blocks.clear()
+    assert log.ids.next_id(table) == 501
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_process_query_logs_queries_write_behind(file_engine, tmp_path, monkeypatch):
+    """Test that queries are recorded without a commit on the request path"""
+    monkeypatch.setattr(fact_checking_service, "TextProcessor", KeywordStub)
+    db = sessionmaker(bind=file_engine)()
+    log = WriteBehindQueue(file_engine, flush_interval=60, spill_path=str(tmp_path / "spill.jsonl"))
+    service = fact_checking_service.FactCheckingService(
+        db, claim_cache=NearDuplicateCache(), query_log=log
+    )
+    results = {"Microwaves cause memory loss": []}
+
+    async def search(text, max_results=10):
+        return results.get(text, [{
+            "url": "https://factcheck.org/fluoride",
+            "domain": "factcheck.org",
+            "title": "Fluoride",
+            "snippet": "Fluoride at these levels is safe",
+            "credibility_score": 0.95,
+        }])
+
+    monkeypatch.setattr(service.web_searcher, "search", search)
+    commits = []
+    event.listen(db, "after_commit", lambda session: commits.append(session))
+    new_session = service._new_session
+
+    def pipeline_session():
+        # The pipeline runs on a session of its own; count its commits too
+        session = new_session()
+        event.listen(session, "after_commit", lambda session: commits.append(session))
+        return session
+
+    monkeypatch.setattr(service, "_new_session", pipeline_session)
+
+    queued = await service.process_query("Microwaves cause memory loss", ContentType.TEXT)
+    assert commits == [] and log.pending == 1
+    assert db.get(UserQuery, queued["query_id"]) is None
+
+    # Facts reference their query, so it is written in the same transaction
+    stored = await service.process_query("Fluoride in water lowers IQ", ContentType.TEXT)
+    assert len(commits) == 1 and log.pending == 1
+    assert db.query(VerifiedFact).one().query_id == stored["query_id"]
+
+    # A query taken for a failed transaction goes back in the queue
+    def fail(*args):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(service, "_write_external_sources", fail)
+    with pytest.raises(RuntimeError):
+        await service.process_query("Wind turbines cause cancer", ContentType.TEXT)
+    assert log.pending == 2
+
+    await log.stop()
+    assert db.query(UserQuery).count() == 3
+    db.close()
+
+
+@pytest.fixture
+def ner_models(monkeypatch):
+    """Model registry whose spaCy "model" is a blank pipeline with an entity ruler"""
+    import spacy
+    from src.services import nlp_models, text_processor
+
+    loads = []
+
+    def load(name, exclude=()):
+        loads.append((name, set(exclude)))
+        nlp = spacy.blank("en")
+        nlp.add_pipe("entity_ruler").add_patterns([
+            {"label": "ORG", "pattern": "World Health Organization"},
+            {"label": "GPE", "pattern": "New Zealand"},
+        ])
+        return nlp
+
+    registry = nlp_models.ModelRegistry()
+    registry.loads = loads
+    monkeypatch.setattr(spacy, "load", load)
+    monkeypatch.setattr(text_processor, "models", registry)
+    monkeypatch.setattr(text_processor, "keyword_cache", ResultCache("keywords", "test"))
+    # NLTK's stopword and punkt data may not be downloaded here
+    monkeypatch.setattr(text_processor, "stopword_set", lambda language: frozenset(["the", "in", "said", "so"]))
+    monkeypatch.setattr(text_processor, "word_tokenize", str.split)
+    return registry
+
+
+def test_model_registry_loads_a_trimmed_pipeline_once(ner_models):
+    """Test that TextProcessors share one spaCy pipeline without parser or lemmatizer"""
+    from src.services.text_processor import TextProcessor
+
+    processors = [TextProcessor(), TextProcessor()]
+    assert ner_models.loads == []
+    ner_models.warmup()
+    assert processors[0].nlp is processors[1].nlp
+    assert len(ner_models.loads) == 1
+    assert {"parser", "lemmatizer"} <= ner_models.loads[0][1]
+
+    doc = processors[0].nlp("The World Health Organization said so")
+    assert [ent.text for ent in doc.ents] == ["World Health Organization"]
+    stats = ner_models.stats()
+    assert stats["models"][0]["components"] == ["entity_ruler"]
+    assert stats["rss_bytes"] > 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("n_process", [1, 2])
+async def test_extract_keywords_batch_matches_single_text(ner_models, n_process):
+    """Test that batched keyword extraction returns the per-text results in order"""
+    from src.services import text_processor
+
+    processor = text_processor.TextProcessor()
+    texts = [
+        "The World Health Organization said vaccines are safe",
+        "",
+        "Sheep outnumber people in New Zealand New Zealand",
+        "fluoride in the water",
+    ] * 3
+    single = [await processor.extract_keywords(text, top_n=5) for text in texts]
+    text_processor.keyword_cache.clear()
+    batched = await processor.extract_keywords_batch(texts, top_n=5, batch_size=4, n_process=n_process)
+    assert batched == single
+    assert "new zealand" in batched[2]
+
+    # Repeats are served from the content-hash cache
+    assert await processor.extract_keywords_batch(texts, top_n=5) == single
+    stats = text_processor.keyword_cache.stats()
+    assert stats["entries"] == 4 and stats["memory_hits"] >= len(texts) + 8
+
+
+class WordPerSecondRecognizer(Recognizer):
+    """Fake recognizer: the audio says "w<second>" once per second"""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+
+    async def recognize(self, window):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        # Later windows finish first, so results arrive out of order
+        await asyncio.sleep(0.02 / (window.index + 1))
+        self.active -= 1
+        first = round(window.start)
+        return " ".join(f"W{second}." for second in range(first, first + round(window.duration)))
+
+
+@pytest.mark.asyncio
+async def test_streaming_transcription_stitches_overlapping_windows(tmp_path):
+    """Test that windows are transcribed concurrently and stitched back in order"""
+    import wave
+    path = str(tmp_path / "claim.wav")
+    with wave.open(path, "wb") as audio:
+        audio.setnchannels(2)
+        audio.setsampwidth(2)
+        audio.setframerate(8000)
+        audio.writeframes(b"\x00\x00" * 2 * 8000 * 11)
+
+    recognizer = WordPerSecondRecognizer()
+    transcriber = StreamingTranscriber(recognizer, window_seconds=4, overlap_seconds=1, concurrency=2)
+    partials = [p async for p in transcriber.stream(transcriber.file_windows(path))]
+
+    assert [(p.start, p.end) for p in partials] == [(0, 4), (3, 7), (6, 10), (9, 11)]
+    assert partials[1].text == "W4. W5. W6."
+    assert partials[-1].transcript == " ".join(f"W{second}." for second in range(11))
+    assert recognizer.peak == 2
+
+
+def test_to_mono_averages_channels():
+    """Test the stereo downmix for each WAV sample width"""
+    import struct
+    from src.services.transcription import _to_mono
+
+    assert struct.unpack("<2h", _to_mono(struct.pack("<4h", 100, -300, 32767, 32767), 2, 2)) == (-100, 32767)
+    assert _to_mono(bytes([0, 255, 128, 128]), 1, 2) == bytes([127, 128])
+    # 24-bit: -0x7ffff0 and -0x7fffd0 average to -0x7fffe0
+    assert _to_mono(bytes([0x10, 0, 0x80, 0x30, 0, 0x80]), 3, 2) == bytes([0x20, 0, 0x80])
+    assert _to_mono(struct.pack("<3i", 3, 6, 9), 4, 3) == struct.pack("<i", 6)
+
+
+def test_pcm_windower_and_stitch():
+    """Test window boundaries for streamed PCM and overlap removal"""
+    windower = PCMWindower(sample_rate=10, sample_width=2, window_seconds=2, overlap_seconds=0.5)
+    windows = []
+    for _ in range(8):
+        windows += windower.feed(b"\x01\x00" * 5)
+    windows += windower.flush()
+    assert [(w.start, w.duration) for w in windows] == [(0, 2), (1.5, 2), (3.0, 1.0)]
+
+    assert stitch("the vaccine was tested", "Was tested on mice") == "on mice"
+    assert stitch("the vaccine was tested", "on mice") == "on mice"
+    assert stitch("", "hello there") == "hello there"
+
+
+FAKE_FFMPEG = """#!{python}
+import os, sys, time
+# 16-bit mono PCM at 16 kHz, like the real command line asks for
+second = b"\\x00\\x00" * 16000
+if "{fail}" == "1":
+    sys.stderr.write("Invalid data found when processing input")
+    sys.exit(1)
+sys.stdout.buffer.write(second * 4)
+sys.stdout.flush()
+# Hold the rest of the audio back until the first window has been transcribed
+deadline = time.time() + 5
+while not os.path.exists("{go}"):
+    if time.time() > deadline:
+        sys.exit(2)
+    time.sleep(0.01)
+sys.stdout.buffer.write(second * 3)
+"""
+
+
+def fake_ffmpeg(tmp_path, fail=False):
+    script = tmp_path / ("ffmpeg-fail" if fail else "ffmpeg")
+    script.write_text(FAKE_FFMPEG.format(python=sys.executable, go=tmp_path / "go", fail=int(fail)))
+    script.chmod(0o755)
+    return str(script)
+
+
+@pytest.mark.asyncio
+async def test_video_audio_is_piped_from_ffmpeg_while_decoding(tmp_path, monkeypatch):
+    """Test that transcription starts before ffmpeg finishes and nothing is written to disk"""
+    monkeypatch.setenv("FFMPEG_BINARY", fake_ffmpeg(tmp_path))
+
+    class SignallingRecognizer(WordPerSecondRecognizer):
+        async def recognize(self, window):
+            (tmp_path / "go").touch()
+            return await super().recognize(window)
+
+    transcriber = StreamingTranscriber(SignallingRecognizer(), window_seconds=4, overlap_seconds=1)
+    transcript = await transcriber.transcribe(transcriber.media_windows(str(tmp_path / "clip.mp4")))
+    assert transcript == " ".join(f"W{second}." for second in range(7))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["ffmpeg", "go"]
+
+    monkeypatch.setenv("FFMPEG_BINARY", fake_ffmpeg(tmp_path, fail=True))
+    with pytest.raises(RuntimeError, match="Invalid data"):
+        await transcriber.transcribe(transcriber.media_windows(str(tmp_path / "clip.mp4")))
+
+
+@pytest.fixture
+def stub_server():
+    """A local HTTP server recording how many requests each host has open"""
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"open": {}, "peak": {}, "peak_total": 0, "lock": threading.Lock()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            host = self.headers["Host"].split(":")[0]
+            with state["lock"]:
+                state["open"][host] = state["open"].get(host, 0) + 1
+                state["peak"][host] = max(state["peak"].get(host, 0), state["open"][host])
+                state["peak_total"] = max(state["peak_total"], sum(state["open"].values()))
+            try:
+                time.sleep(1.5 if self.path == "/slow" else 0.1)
+                status = 404 if self.path == "/missing" else 200
+                body = f"page {self.path}".encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass
+            finally:
+                with state["lock"]:
+                    state["open"][host] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state["port"] = server.server_address[1]
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_fetch_many_bounds_fan_out_and_meets_deadline(stub_server, tmp_path, monkeypatch):
+    """Test concurrent page fetching against global and per-host limits and the deadline"""
+    import time
+    from src.services.web_searcher import WebSearcher
+    from src.utils import http_cache
+
+    monkeypatch.setattr(http_cache, "_http_cache", http_cache.HTTPCache(str(tmp_path / "http.db")))
+    port = stub_server["port"]
+    urls = [
+        f"http://{host}:{port}/page/{i}" for i in range(6) for host in ("127.0.0.1", "127.0.0.2")
+    ]
+    async with WebSearcher(concurrency=3, per_host=2) as searcher:
+        pages = await searcher.fetch_many(urls + urls[:2] + [f"http://127.0.0.1:{port}/missing"])
+        assert list(pages) == urls
+        assert pages[urls[0]] == "page /page/0"
+        assert stub_server["peak_total"] <= 3
+        assert max(stub_server["peak"].values()) <= 2
+        assert searcher._hosts == {}
+
+        # Whatever finished by the deadline comes back; the slow page is abandoned
+        started = time.perf_counter()
+        pages = await searcher.fetch_many([f"http://127.0.0.1:{port}/slow", urls[0]], deadline=0.7)
+        assert time.perf_counter() - started < 1.2
+        assert list(pages) == [urls[0]]
+        assert await searcher.fetch_many([]) == {}
+
+
+def reference_bm25(docs, query, k1=1.2, b=0.75):
+    """Brute-force BM25 over ``{url: text}``"""
+    import math
+    from collections import Counter
+    from src.services.claim_index import index_terms
+
+    terms = {url: Counter(index_terms(text)) for url, text in docs.items()}
+    avg_length = sum(sum(counts.values()) for counts in terms.values()) / len(terms)
+    scores = {}
+    for term in dict.fromkeys(index_terms(query)):
+        df = sum(1 for counts in terms.values() if term in counts)
+        if not df:
+            continue
+        idf = math.log(1 + (len(terms) - df + 0.5) / (df + 0.5))
+        for url, counts in terms.items():
+            tf = counts.get(term)
+            if tf:
+                norm = k1 * (1 - b + b * sum(counts.values()) / avg_length)
+                scores[url] = scores.get(url, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def test_bm25_index_segments_merges_and_replacements(tmp_path):
+    """Test the on-disk BM25 index against brute-force scores across segments, merges and updates"""
+    import random
+    from src.services.search_index import BM25Index
+
+    rng = random.Random(5)
+    vocabulary = ["vaccine", "autism", "study", "towers", "virus", "election", "fraud", "ballots",
+                  "climate", "warming", "water", "fluoride", "moon", "landing", "hoax", "report"]
+    docs = {
+        f"https://news.example/{i}": " ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 40)))
+        for i in range(60)
+    }
+    path = str(tmp_path / "index")
+    index = BM25Index(path, buffer_docs=7, merge_factor=3, max_df_ratio=1.0)
+    items = list(docs.items())
+    for start in range(0, len(items), 5):
+        index.add_documents({"url": url, "title": "", "content": text} for url, text in items[start:start + 5])
+    index.commit()
+    stats = index.stats()
+    assert stats["documents"] == 60 and stats["buffered"] == 0
+    # 60 docs flushed 7 at a time and merged in threes
+    assert stats["segments"] < 60 / 7
+
+    def check(index, docs):
+        for query in ("vaccine autism", "election fraud ballots", "moon landing hoax report", "zebra"):
+            expected = reference_bm25(docs, query)
+            hits = index.search(query, k=5)
+            best = sorted(expected.values(), reverse=True)[:5]
+            assert [round(score, 3) for score, _ in hits] == [round(score, 3) for score in best]
+            for score, document in hits:
+                assert abs(expected[document["url"]] - score) < 1e-4
+                assert document["snippet"] == docs[document["url"]][:500]
+
+    check(index, docs)
+
+    # Unchanged pages are skipped; a changed page replaces its old version
+    unchanged = {"url": items[0][0], "title": "", "content": items[0][1]}
+    changed_url = items[1][0]
+    docs[changed_url] = "zebra zebra crossing report"
+    assert index.add_documents([unchanged]) == 0
+    assert index.add_documents([unchanged, {"url": changed_url, "content": docs[changed_url]}]) == 1
+    assert index.commit() == 0
+    assert index.stats()["deleted"] == 1 and index.stats()["documents"] == 60
+    assert index.search("zebra", k=3)[0][1]["url"] == changed_url
+
+    index.merge()
+    stats = index.stats()
+    assert stats["segments"] == 1 and stats["deleted"] == 0
+    check(index, docs)
+    index.close()
+
+    # Another worker opens the same directory
+    reopened = BM25Index(path, max_df_ratio=1.0)
+    check(reopened, docs)
+    reopened.close()
+
+
+def test_bm25_index_failed_commit_keeps_old_versions(tmp_path, monkeypatch):
+    """Test that a commit whose segment cannot be written loses neither the old page nor the new one"""
+    from src.services import search_index
+    from src.services.search_index import BM25Index
+
+    path = str(tmp_path / "index")
+    index = BM25Index(path)
+    index.add_documents([{"url": "https://news.example/a", "content": "vaccine trial results"}])
+    index.commit()
+    write_segment = search_index._write_segment
+
+    def disk_full(*args):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(search_index, "_write_segment", disk_full)
+    assert index.add_documents([{"url": "https://news.example/a", "content": "vaccine trial retracted"}]) == 1
+    with pytest.raises(OSError):
+        index.commit()
+    # The old version is still live, in this worker and in others
+    assert [document["url"] for _, document in index.search("vaccine")] == ["https://news.example/a"]
+    other = BM25Index(path)
+    assert len(other) == 1 and other.search("trial")
+    assert index.stats()["buffered"] == 1
+
+    monkeypatch.setattr(search_index, "_write_segment", write_segment)
+    index.commit()
+    assert index.search("results") == [] and index.search("retracted")[0][1]["url"] == "https://news.example/a"
+    assert len(other) == 1 and other.search("results") == []
+    other.close()
+    index.close()
+
+
+@pytest.mark.asyncio
+async def test_web_searcher_uses_local_search_backend(tmp_path):
+    """Test that WebSearcher.search returns scored results from the local index"""
+    from src.services.search_index import BM25Index, LocalSearchBackend
+    from src.services.web_searcher import WebSearcher
+
+    backend = LocalSearchBackend(BM25Index(str(tmp_path / "index")), commit_interval=3600)
+    searcher = WebSearcher(backend=backend)
+    assert await searcher.search("5g towers covid") == []
+    added = await searcher.index_pages([
+        {"url": "https://www.reuters.com/fact-check/5g", "title": "Fact check: 5G towers do not spread COVID-19",
+         "content": "Radio waves cannot carry viruses. " + "filler " * 200 + "spectrum"},
+        {"url": "https://blog.example/5g", "title": "5G towers and COVID", "content": "5G towers spread COVID, covid, COVID"},
+        {"url": "https://apnews.com/weather", "title": "Weather", "content": "Rain expected on Sunday."},
+    ])
+    assert added == 3
+    # Added pages are buffered until the background commit
+    assert await searcher.search("5g towers covid") == []
+    await backend.commit()
+    results = await searcher.search("Do 5G towers spread COVID-19?")
+    assert {result["url"] for result in results} == {"https://www.reuters.com/fact-check/5g", "https://blog.example/5g"}
+    reuters = next(result for result in results if result["domain"] == "reuters.com")
+    assert reuters["credibility_score"] == 0.9 and reuters["snippet"].startswith("Radio waves cannot carry viruses.")
+    assert all(result["relevance"] > 0 for result in results)
+    # Search hits only carry a snippet and are not indexed over the full page
+    assert all(result["indexed"] for result in results)
+    assert await searcher.index_pages(results) == 0
+    await backend.commit()
+    assert [result["url"] for result in await searcher.search("spectrum")] == ["https://www.reuters.com/fact-check/5g"]
+    # Indexing the same pages again changes nothing
+    assert await searcher.index_pages([{"url": "https://apnews.com/weather", "title": "Weather",
+                                        "content": "Rain expected on Sunday."}]) == 0
+    await backend.close()
+
+
+@pytest.mark.asyncio
+async def test_default_search_backend_commits_on_shutdown(tmp_path, monkeypatch):
+    """Test that pages waiting for the background commit are written when the app shuts down"""
+    from src.services import search_index
+    from src.services.search_index import BM25Index, LocalSearchBackend, close_default_search_backend
+
+    path = str(tmp_path / "index")
+    backend = LocalSearchBackend(BM25Index(path), commit_interval=3600)
+    monkeypatch.setattr(search_index, "_default_backend", backend)
+    assert await backend.add_documents([{"url": "https://news.example/a", "content": "flood warning"}]) == 1
+    await close_default_search_backend()
+    assert search_index._default_backend is None
+    reopened = BM25Index(path)
+    assert reopened.search("flood")[0][1]["url"] == "https://news.example/a"
+    reopened.close()
+
+
+@pytest.mark.parametrize("public_suffixes", ["tldextract", "fallback"])
+def test_domain_reputation_resolves_subdomains_and_refreshes(db, monkeypatch, public_suffixes):
+    """Test that domain reputations cover subdomains, respect public suffixes and follow the tables"""
+    from src.models.fact_checking_models import CredibleSource, SourceType
+    from src.services import domain_reputation
+    from src.services.credibility_scorer import CredibilityScorer
+    from src.services.domain_reputation import DomainReputation, DomainReputationIndex
+    from src.services.web_searcher import WebSearcher
+    from src.utils.verification import SourceVerifier
+
+    if public_suffixes == "fallback":
+        monkeypatch.setattr(domain_reputation, "_extractor", lambda: None)
+    domain_reputation.registrable_domain.cache_clear()
+    index = DomainReputationIndex(entries=[
+        DomainReputation("reuters.com", 0.9, "seed"),
+        DomainReputation("co.uk", 0.99, "seed"),
+        DomainReputation("blogspot.com", 0.99, "seed"),
+        DomainReputation("bbc.co.uk", 0.9, "seed"),
+    ])
+    assert index.score("https://www.uk.Reuters.com:443/world/") == 0.9
+    assert index.score("reuters.com") == 0.9
+    assert index.score("notreuters.com") == 0.5
+    assert index.score("news.bbc.co.uk") == 0.9
+    # A suffix's score neither leaks to other owners nor is lost for the suffix itself
+    assert index.score("example.co.uk") == 0.5
+    assert index.score("someone.blogspot.com", default=0.1) == 0.1
+    assert index.score("blogspot.com") == 0.99
+    assert index.lookup("") is None and index.lookup("https://") is None
+
+    # Loaded from the tables, and rebuilt only when they change
+    engine = db.get_bind()
+    db.add_all([
+        CredibleSource(name="Reuters", domain="reuters.com", source_type=SourceType.NEWS_OUTLET,
+                       credibility_score=0.97),
+        CredibleSource(name="Gone", domain="gone.example", source_type=SourceType.NEWS_OUTLET,
+                       credibility_score=0.95, is_active=False),
+        ExternalSource(url="https://health.example/a", domain="health.example", credibility_score=0.8,
+                       is_whitelisted=True),
+        ExternalSource(url="https://spam.example/a", domain="spam.example", credibility_score=0.9),
+    ])
+    db.commit()
+    index = DomainReputationIndex()
+    assert index.load(engine) and not index.load(engine)
+    assert index.score("www.reuters.com") == 0.97
+    assert index.score("apnews.com") == 0.9
+    assert index.score("a.health.example") == 0.8
+    assert index.score("gone.example") == index.score("spam.example") == 0.5
+    db.query(CredibleSource).filter_by(domain="gone.example").update({"is_active": True})
+    db.commit()
+    assert index.load(engine)
+    assert index.score("gone.example") == 0.95
+    assert index.stats()["refreshes"] == 2
+
+    # Every scoring path reads the same index
+    searcher = WebSearcher(reputation=index)
+    assert searcher._extract_domain("https://WWW.Reuters.com/x") == "reuters.com"
+    assert searcher._get_credibility_score("live.reuters.com") == 0.97
+    scorer = CredibilityScorer(reputation=index)
+    assert scorer.score_result({"url": "https://gone.example/x"})["credibility_score"] == 0.95
+    assert scorer.score_result({"url": "https://gone.example/x", "credibility_score": 0.2})["credibility_score"] == 0.2
+    verifier = SourceVerifier(reputation=index)
+    reputation = asyncio.run(verifier._check_domain_reputation(verifier._extract_domain("https://www.reuters.com/a")))
+    assert reputation["score"] == 0.97 and reputation["is_trusted"]
+    assert not asyncio.run(verifier._check_domain_reputation("spam.example"))["is_trusted"]
+    domain_reputation.registrable_domain.cache_clear()
+
+
+@pytest.mark.asyncio
+async def test_page_fetch_streams_decodes_and_stops_early(tmp_path):
+    """Test that page fetches stop at the text or byte budget, decode charsets and refuse other types"""
+    import httpx
+    from src.services.web_searcher import PARSE_BATCH_CHARS, WebSearcher
+    from src.utils.http_cache import CachingTransport, HTTPCache
+
+    pulled = {}
+
+    class Body(httpx.AsyncByteStream):
+        def __init__(self, path, chunks):
+            self.path = path
+            self.chunks = chunks
+
+        async def __aiter__(self):
+            for chunk in self.chunks:
+                pulled[self.path] = pulled.get(self.path, 0) + 1
+                yield chunk
+
+    article = "<p>" + "Officials confirmed the report on Tuesday. " * 20 + "</p>"
+    comments = "<div class='comment'><p>First!</p></div>" * 200
+    pages = {
+        "/huge": ({"Content-Type": "text/html"},
+                  [b"<html><body><article>"] + [article.encode()] * 5000 + [b"</article>", comments.encode()]),
+        "/latin": ({"Content-Type": "text/html; charset=iso-8859-1"}, ["<p>Café crème</p>".encode("latin-1")]),
+        "/meta": ({"Content-Type": "text/html"},
+                  [b'<html><head><meta charset="windows-1252"></head>', "<p>“quoted”</p>".encode("cp1252")]),
+        "/sniffless": ({}, ["<p>naïve résumé</p>".encode("utf-8")]),
+        "/plain": ({"Content-Type": "text/plain"}, [b"line   one\nline two"]),
+        "/report.pdf": ({"Content-Type": "application/pdf", "Cache-Control": "max-age=60"}, [b"%PDF-1.7"] * 1000),
+        "/cached": ({"Content-Type": "text/html", "Cache-Control": "max-age=60"}, [b"<p>Short page.</p>"]),
+    }
+
+    def handler(request):
+        headers, chunks = pages[request.url.path]
+        return httpx.Response(200, headers=headers, stream=Body(request.url.path, chunks))
+
+    cache = HTTPCache(str(tmp_path / "http.db"))
+    searcher = WebSearcher(max_bytes=256 * 1024, max_chars=2000)
+    searcher._client = httpx.AsyncClient(transport=CachingTransport(httpx.MockTransport(handler), cache))
+
+    # The main text budget ends the download within a parse batch or so
+    text = await searcher._fetch_page_content("http://news.example/huge")
+    assert text.startswith("Officials confirmed the report") and len(text) <= 2000
+    assert pulled["/huge"] < 5 + PARSE_BATCH_CHARS // len(article)
+    # Without readable text the byte budget ends it
+    searcher.max_chars = 10 ** 9
+    await searcher._fetch_page_content("http://news.example/huge")
+    assert pulled["/huge"] < 5 + PARSE_BATCH_CHARS // len(article) + 256 * 1024 // len(article) + 2
+    searcher.max_chars = 2000
+
+    assert await searcher._fetch_page_content("http://news.example/latin") == "Café crème"
+    assert await searcher._fetch_page_content("http://news.example/meta") == "“quoted”"
+    assert await searcher._fetch_page_content("http://news.example/sniffless") == "naïve résumé"
+    assert await searcher._fetch_page_content("http://news.example/plain") == "line one line two"
+    # Refused from the headers, without reading the body
+    assert await searcher._fetch_page_content("http://news.example/report.pdf") is None
+    assert "/report.pdf" not in pulled
+
+    # Bodies read to the end are cached; cut-off ones are not
+    for _ in range(2):
+        assert await searcher._fetch_page_content("http://news.example/cached") == "Short page."
+    assert pulled["/cached"] == 1 and cache.stats()["stores"] == 1
+
+    stats = searcher.stats()
+    assert stats["fetches"] == 8 and stats["rejected"] == 1 and stats["truncated"] == 2
+    assert 0 < stats["peak_fetch_bytes"] < 512 * 1024
+    await searcher.close()
+    cache.close()
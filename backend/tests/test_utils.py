@@ -1,7 +1,25 @@
+import asyncio
+import gzip
+import random
+import re
+import string
+import threading
+import time
+from types import SimpleNamespace
+import httpx
 import pytest
+from nltk.tokenize import NLTKWordTokenizer
+from src.utils import preprocessing
 from src.utils.preprocessing import TextPreprocessor
 from src.utils.verification import SourceVerifier
 from src.utils.watermarking import ContentWatermarker
+from src.utils.single_flight import SingleFlight
+from src.utils.executors import ExecutorManager
+from src.utils.result_cache import ResultCache
+from src.utils.http_cache import CachingTransport, HTTPCache
+from src.utils.traffic import HostUnavailable, TrafficController, TrafficControlTransport
+from src.utils.ttl_cache import CacheEntry, SQLiteTier, TTLCache
+from src.utils.html_extract import MainContentExtractor, extract_main_text
 
 @pytest.mark.asyncio
 async def test_text_preprocessing():
@@ -42,3 +60,601 @@ def test_watermarking():
     modified_text = text + " modified"
     verification = watermarker.verify_watermark(modified_text, watermark)
     assert not verification['content_match']
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_and_propagates_errors():
+    """Test that concurrent calls share one computation, including its error"""
+    flight = SingleFlight()
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return {"verdict": "false"}
+
+    results = await asyncio.gather(*(flight.do("claim", compute) for _ in range(5)))
+    assert results == [{"verdict": "false"}] * 5
+    assert len(runs) == 1
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("search backend down")
+
+    outcomes = await asyncio.gather(*(flight.do("claim", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert await flight.do("claim", compute) == {"verdict": "false"}
+    assert flight.stats() == {
+        "calls": 9, "executions": 3, "coalesced": 6,
+        "failures": 1, "cancelled": 0, "in_flight": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancellation():
+    """Test that a cancelled waiter leaves the shared computation running"""
+    flight = SingleFlight()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def compute():
+        started.set()
+        await release.wait()
+        return "done"
+
+    first = asyncio.ensure_future(flight.do("claim", compute))
+    second = asyncio.ensure_future(flight.do("claim", compute))
+    await started.wait()
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await second == "done"
+    assert first.cancelled()
+
+    release.clear()
+    only = asyncio.ensure_future(flight.do("other", compute))
+    await asyncio.sleep(0.01)
+    only.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await only
+    await asyncio.sleep(0)
+    assert flight.stats()["cancelled"] == 1
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_executor_manager_timeouts_and_queue_depth():
+    """Test per-task timeouts and queue-depth metrics of the worker pools"""
+    import time
+    manager = ExecutorManager(process_workers=0, thread_workers=1, io_timeout=5)
+    try:
+        # Not started: CPU work falls back to the thread pool
+        assert await manager.run_cpu(sum, [1, 2, 3]) == 6
+
+        with pytest.raises(TimeoutError):
+            await manager.run_thread(time.sleep, 0.3, timeout=0.05)
+
+        await asyncio.gather(*(manager.run_thread(time.sleep, 0.05) for _ in range(3)))
+        stats = manager.stats()["thread"]
+        assert stats["timeouts"] == 1
+        assert stats["peak_queued"] >= 2
+        assert stats["completed"] == 5 and stats["in_flight"] == 0
+    finally:
+        manager.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_executor_manager_runs_cpu_work_in_processes():
+    """Test that CPU work goes to the spawned process pool once started"""
+    import os
+    manager = ExecutorManager(process_workers=1)
+    manager.start()
+    try:
+        assert await manager.run_cpu(os.getpid) != os.getpid()
+        assert manager.stats()["process"]["completed"] >= 1
+    finally:
+        manager.shutdown()
+
+
+def test_result_cache_tiers_versions_and_eviction(tmp_path):
+    """Test the memory and shared disk tiers of the content-hash result cache"""
+    path = str(tmp_path / "results.db")
+    worker_a = ResultCache("keywords", "model-1", max_entries=2, disk_path=path)
+    worker_b = ResultCache("keywords", "model-1", max_entries=2, disk_path=path)
+
+    key = worker_a.key(10, "Vaccines cause autism")
+    assert key != worker_a.key(1, "0Vaccines cause autism")
+    assert worker_a.get(key) is None
+    worker_a.put(key, ["vaccines", "autism"])
+    assert worker_a.get(key) == ["vaccines", "autism"]
+    # Another worker reads it from disk, then from its own memory tier
+    assert worker_b.get(key) == ["vaccines", "autism"]
+    assert worker_b.get(key) == ["vaccines", "autism"]
+    assert worker_b.stats()["disk_hits"] == 1 and worker_b.stats()["memory_hits"] == 1
+
+    for i in range(3):
+        worker_a.put(worker_a.key(i), [str(i)])
+    assert worker_a.stats()["entries"] == 2 and worker_a.stats()["evictions"] == 2
+
+    # A new model version drops the old rows
+    upgraded = ResultCache("keywords", "model-2", disk_path=path)
+    assert upgraded.get(upgraded.key(10, "Vaccines cause autism")) is None
+    assert upgraded.stats()["disk_bytes"] == 0
+    for cache in (worker_a, worker_b, upgraded):
+        cache.close()
+
+    small = ResultCache("preprocess", "1", max_entries=1, disk_path=path, disk_max_bytes=2000)
+    for i in range(100):
+        small.put(small.key(i), ["token"] * 10)
+    stats = small.stats()
+    assert stats["disk_bytes"] <= 2000 and stats["disk_evictions"] > 0
+    assert small.get(small.key(99)) == ["token"] * 10
+    assert small.get(small.key(0)) is None
+    small.close()
+
+    # Overwriting a key replaces its size instead of adding to it
+    rewritten = ResultCache("rewrite", "1", disk_path=str(tmp_path / "rewrite.db"))
+    for _ in range(5):
+        rewritten.put(rewritten.key("claim"), ["token"] * 10)
+    assert rewritten.stats()["disk_bytes"] == rewritten._disk.execute("SELECT SUM(size) FROM results").fetchone()[0]
+    rewritten.close()
+
+
+@pytest.mark.asyncio
+async def test_result_cache_async_api_reads_and_writes_disk_off_the_loop(tmp_path, monkeypatch):
+    """Test the batched async API goes to disk in a worker thread, once per call"""
+    path = str(tmp_path / "results.db")
+    writer = ResultCache("keywords", "model-1", disk_path=path)
+    reader = ResultCache("keywords", "model-1", disk_path=path)
+    threads = []
+    to_thread = asyncio.to_thread
+
+    async def counting_to_thread(fn, *args):
+        threads.append(fn.__name__)
+        return await to_thread(fn, *args)
+
+    monkeypatch.setattr(asyncio, "to_thread", counting_to_thread)
+    keys = [writer.key(i) for i in range(3)]
+    await writer.aput_many((key, [str(i)]) for i, key in enumerate(keys))
+    assert await reader.aget_many(keys + [reader.key("missing")], default=[]) == [["0"], ["1"], ["2"], []]
+    assert await reader.aget(keys[0]) == ["0"]
+    assert threads == ["_disk_put_many", "_disk_get_many"]
+    stats = reader.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (3, 1, 1)
+    writer.close()
+    reader.close()
+
+
+def test_extract_main_text_skips_boilerplate_and_respects_budget():
+    """Test the streaming HTML extractor against chrome, scripts and the char budget"""
+    page = """<!DOCTYPE html><html><head><title>Fact check</title>
+    <script>var tracking = "<p>not text</p>";</script><style>p { color: red }</style></head>
+    <body class="single-post has-sidebar">
+      <nav><a href="/">Home</a> <a href="/news">News</a></nav>
+      <div class="cookie-banner">We use cookies</div>
+      <div class="links"><a href="/a">Politics</a> <a href="/b">Health</a> <a href="/c">Science</a></div>
+      <article>
+        <h1>Does 5G spread viruses?</h1>
+        <p>No. Radio waves cannot carry viruses &amp; there is <a href="/study">no evidence</a> for it.</p>
+        <div id="share-tools">Share on Facebook</div>
+        <p>Experts agree.<br/>Case closed.</p>
+      </article>
+      <aside>Most read</aside><footer>(c) 2024</footer>
+    </body></html>"""
+    assert extract_main_text(page) == (
+        "Does 5G spread viruses? No. Radio waves cannot carry viruses & there is "
+        "no evidence for it. Experts agree. Case closed."
+    )
+    # Without an <article>, the remaining body text is kept and link lists dropped
+    assert extract_main_text(
+        '<body><div class="links"><a href="/a">One</a> <a href="/b">Two</a></div><p>Plain <b>text</b></p></body>'
+    ) == "Plain text"
+
+    huge = "<html><body>" + "<p>Vaccines are tested for years before approval.</p>" * 200000 + "</body></html>"
+    parser = MainContentExtractor(max_chars=1000)
+    parser.feed(huge[:64 * 1024])
+    parser.feed(huge[64 * 1024:128 * 1024])
+    assert parser.done
+    text = extract_main_text(huge, max_chars=1000)
+    assert 950 <= len(text) <= 1000 and text.startswith("Vaccines are tested")
+    parser = MainContentExtractor(max_chars=1000)
+    parser.feed("<html><body><main>" + huge[12:64 * 1024])
+    assert parser.done
+
+    # A header longer than the budget does not end the page before its article
+    header = "<header>" + "<p>Site banner text that goes on and on.</p>" * 200 + "</header>"
+    parser = MainContentExtractor(max_chars=1000)
+    parser.feed(f"<html><body>{header}")
+    assert not parser.done and parser._chars < 1100
+    parser.feed("<article><p>The actual story.</p></article></body></html>")
+    parser.close()
+    assert parser.text() == "The actual story."
+    # Without main content the header text is the fallback
+    parser = MainContentExtractor(max_chars=1000, lookahead=1024)
+    parser.feed(f"<html><body>{header}")
+    parser.feed("<div>more chrome</div>" * 100)
+    assert parser.done
+    text = extract_main_text(f"<html><body>{header}</body></html>", max_chars=1000)
+    assert 950 <= len(text) <= 1000 and text.startswith("Site banner text")
+
+
+STOPWORDS = ["the", "a", "is", "and", "with", "not", "no", "of", "to", "for"]
+
+
+@pytest.fixture
+def offline_preprocessor(monkeypatch):
+    """A TextPreprocessor whose NLTK data is replaced by small stand-ins"""
+    monkeypatch.setattr(preprocessing, "stopword_set", lambda language: frozenset(STOPWORDS))
+    # The Treebank half of word_tokenize; punkt only splits at . ? and !, which cleaning removes
+    monkeypatch.setattr(preprocessing, "word_tokenize", NLTKWordTokenizer().tokenize)
+    monkeypatch.setattr(preprocessing, "lemmatizer", lambda: SimpleNamespace(lemmatize=lambda word: word.rstrip("s") or word))
+    monkeypatch.setattr(preprocessing, "_lemmas", {})
+    monkeypatch.setattr(preprocessing, "preprocess_cache", ResultCache("preprocess", "test"))
+    return TextPreprocessor()
+
+
+def reference_preprocess(preprocessor, text):
+    """The original multi-pass pipeline"""
+    text = text.lower()
+    text = re.sub(r'https?://\S+|www\.\S+', '', text)
+    text = re.sub(r'<.*?>', '', text)
+    text = text.translate(str.maketrans('', '', string.punctuation))
+    text = re.sub(r'\d+', '', text)
+    text = ' '.join(text.split())
+    tokens = preprocessing.word_tokenize(text)
+    tokens = [token for token in tokens if token not in preprocessor.stop_words]
+    return [preprocessing.lemmatizer().lemmatize(token) for token in tokens]
+
+
+@pytest.mark.asyncio
+async def test_preprocess_batch_matches_original_pipeline(offline_preprocessor):
+    """Test the single-pass cleaner, fast tokenizer and lemma table against the old pipeline"""
+    texts = [
+        "",
+        "   ",
+        "This is a sample text with some stopwords and numbers 123!",
+        "See https://example.com/a?b=1 and www.who.int <b>NOW</b>: vaccines don't cause autism.",
+        "I cannot believe they're gonna say 5G towers spread COVID-19... wanna bet? Gimme proof",
+        "Café owners said the naïve claim — 100% false — was ２０２０'s biggest hoax",
+        "<p>Tabs\tand\nnewlines</p>\x0bcontrol\x00chars lemme gotta wanna",
+        "'Tis the season; d'ye know what more'n half said?",
+    ]
+    rng = random.Random(7)
+    alphabet = "abc xyz <>/.:'-!?0123 httpswww.é\t"
+    texts += ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(300)]
+
+    expected = [reference_preprocess(offline_preprocessor, text) for text in texts]
+    for text, tokens in zip(texts, expected):
+        assert offline_preprocessor._preprocess_text(text) == tokens, text
+    assert preprocessing._lemmas
+
+    # Duplicates are processed once; repeated batches are served from the cache
+    batch = texts + texts[:50]
+    assert await offline_preprocessor.preprocess_batch(batch, chunk_size=64) == expected + expected[:50]
+    assert preprocessing.preprocess_cache.stats()["entries"] == len(set(texts))
+    assert await offline_preprocessor.preprocess_batch(texts[:3]) == expected[:3]
+    assert await offline_preprocessor.preprocess_text(texts[2]) == expected[2]
+
+
+class Origin:
+    """A fake origin server that honours conditional requests"""
+
+    def __init__(self):
+        self.requests = []
+        self.pages = {}
+
+    def handler(self, request):
+        self.requests.append(request)
+        status, headers, body = self.pages[request.url.path]
+        headers = httpx.Headers(headers)
+        etag = headers.get("etag")
+        if etag and request.headers.get("if-none-match") == etag:
+            return httpx.Response(304, headers={"ETag": etag, "Cache-Control": headers.get("cache-control", "")})
+        modified = headers.get("last-modified")
+        if modified and request.headers.get("if-modified-since") == modified and not etag:
+            return httpx.Response(304)
+        return httpx.Response(status, headers=headers, content=body)
+
+
+@pytest.mark.asyncio
+async def test_http_cache_freshness_revalidation_and_metrics(tmp_path):
+    """Test that the caching transport serves fresh hits, revalidates stale pages and skips no-store"""
+    origin = Origin()
+    article = b"<html>" + b"Officials confirmed the report. " * 200 + b"</html>"
+    origin.pages = {
+        "/fresh": (200, {"Cache-Control": "max-age=60"}, article),
+        "/etag": (200, {"Cache-Control": "no-cache", "ETag": '"v1"'}, b"etag body"),
+        "/modified": (200, {"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT", "Cache-Control": "max-age=0"}, b"old"),
+        "/private": (200, {"Cache-Control": "no-store"}, b"secret"),
+        "/vary": (200, {"Cache-Control": "max-age=60", "Vary": "Accept-Language"}, b"hello"),
+        "/gzip": (200, {"Cache-Control": "max-age=60", "Content-Encoding": "gzip"}, gzip.compress(b"zipped")),
+        "/missing": (500, {"Cache-Control": "max-age=60"}, b"error"),
+    }
+    cache = HTTPCache(str(tmp_path / "http.db"))
+    client = httpx.AsyncClient(transport=CachingTransport(httpx.MockTransport(origin.handler), cache))
+    # Cache reads and writes happen in worker threads, not on the event loop
+    threads = {}
+    for name in ("lookup", "store", "refresh"):
+        def traced(*args, _name=name, _method=getattr(cache, name)):
+            threads.setdefault(_name, set()).add(threading.get_ident())
+            return _method(*args)
+        setattr(cache, name, traced)
+
+    for _ in range(3):
+        assert (await client.get("http://news.example/fresh")).content == article
+    assert len(origin.requests) == 1
+
+    for _ in range(2):
+        response = await client.get("http://news.example/etag")
+        assert response.status_code == 200 and response.text == "etag body"
+    assert origin.requests[-1].headers["if-none-match"] == '"v1"'
+    assert set(threads) == {"lookup", "store", "refresh"}
+    assert all(threading.get_ident() not in idents for idents in threads.values())
+
+    await client.get("http://news.example/modified")
+    assert (await client.get("http://news.example/modified")).text == "old"
+    assert origin.requests[-1].headers["if-modified-since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+    for path in ("/private", "/private", "/missing", "/missing"):
+        await client.get(f"http://news.example{path}")
+    assert [r.url.path for r in origin.requests[-4:]] == ["/private", "/private", "/missing", "/missing"]
+
+    await client.get("http://news.example/vary", headers={"Accept-Language": "en"})
+    await client.get("http://news.example/vary", headers={"Accept-Language": "en"})
+    await client.get("http://news.example/vary", headers={"Accept-Language": "fr"})
+    assert [r.url.path for r in origin.requests].count("/vary") == 2
+
+    for _ in range(2):
+        assert (await client.get("http://news.example/gzip")).text == "zipped"
+    await client.get("http://news.example/fresh", headers={"Cache-Control": "no-cache"})
+
+    stats = cache.stats()
+    assert stats["hits"] == 4 and stats["revalidated"] == 2
+    assert stats["misses"] == 11 and stats["bypassed"] == 0
+    # Bodies are stored compressed
+    assert stats["bytes"] < len(article)
+    await client.aclose()
+    cache.close()
+
+    # The cache outlives the process; a fresh client is served from disk
+    reopened = HTTPCache(str(tmp_path / "http.db"))
+    client = httpx.AsyncClient(transport=CachingTransport(httpx.MockTransport(origin.handler), reopened))
+    seen = len(origin.requests)
+    assert (await client.get("http://news.example/fresh")).content == article
+    assert len(origin.requests) == seen and reopened.stats()["hits"] == 1
+    await client.aclose()
+    reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_http_cache_size_cap_and_large_bodies(tmp_path):
+    """Test LRU eviction under the size cap and pass-through of oversized bodies"""
+    origin = Origin()
+    rng = random.Random(3)
+    for i in range(20):
+        body = bytes(rng.getrandbits(8) for _ in range(2000))
+        origin.pages[f"/page/{i}"] = (200, {"Cache-Control": "max-age=600"}, body)
+    origin.pages["/huge"] = (200, {"Cache-Control": "max-age=600"}, b"x" * 50000)
+    cache = HTTPCache(str(tmp_path / "http.db"), max_bytes=20000, max_entry_bytes=10000)
+    client = httpx.AsyncClient(transport=CachingTransport(httpx.MockTransport(origin.handler), cache))
+
+    for i in range(20):
+        await client.get(f"http://news.example/page/{i}")
+    stats = cache.stats()
+    assert stats["bytes"] <= 20000 and stats["evictions"] > 0
+    # The most recent pages survive, the oldest were evicted
+    seen = len(origin.requests)
+    await client.get("http://news.example/page/19")
+    assert len(origin.requests) == seen
+    await client.get("http://news.example/page/0")
+    assert len(origin.requests) == seen + 1
+
+    for _ in range(2):
+        assert len((await client.get("http://news.example/huge")).content) == 50000
+    assert [r.url.path for r in origin.requests].count("/huge") == 2
+    await client.aclose()
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_traffic_control_limits_times_out_and_breaks_circuits(tmp_path):
+    """Test per-host rate limits, adaptive timeouts, circuit breaking and stale fallbacks"""
+    import time
+    origin = Origin()
+    origin.pages = {
+        "/article": (200, {"Cache-Control": "max-age=0", "ETag": '"a"'}, b"cached article"),
+        "/page": (200, {}, b"page"),
+    }
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        if request.url.host == "down.example" and origin.down:
+            return httpx.Response(503)
+        return origin.handler(request)
+
+    origin.down = False
+    controller = TrafficController(rate=50, burst=2, max_wait=0.5, failure_threshold=3, cooldown=0.2, min_samples=3)
+    cache = HTTPCache(str(tmp_path / "http.db"))
+    client = httpx.AsyncClient(
+        timeout=30,
+        transport=CachingTransport(TrafficControlTransport(httpx.MockTransport(handler), controller), cache),
+    )
+
+    # Bursts beyond the bucket are spaced out at the host's rate
+    started = time.perf_counter()
+    for _ in range(6):
+        assert (await client.get("http://news.example/page")).text == "page"
+    assert time.perf_counter() - started >= 0.07
+    assert controller.stats()["throttled"] == 4
+    # Once latency is known, timeouts shrink from the client's 30s
+    assert timeouts[0] == 30 and timeouts[-1] == controller.min_timeout
+
+    await client.get("http://down.example/article")
+    origin.down = True
+    # A failing origin is answered with the stale copy, flagged as such
+    response = await client.get("http://down.example/article")
+    assert response.text == "cached article" and response.headers["warning"].startswith("111")
+    for _ in range(2):
+        assert (await client.get("http://down.example/page")).status_code == 503
+    assert controller.stats()["open_circuits"] == 1
+
+    # Open: no requests reach the host, cached pages still serve
+    seen = len(timeouts)
+    assert (await client.get("http://down.example/article")).text == "cached article"
+    with pytest.raises(HostUnavailable):
+        await client.get("http://down.example/page")
+    assert len(timeouts) == seen
+    assert (await client.get("http://news.example/page")).status_code == 200
+    assert cache.stats()["stale"] == 2
+
+    # After the cooldown one probe gets through and closes the circuit
+    origin.down = False
+    await asyncio.sleep(0.25)
+    assert (await client.get("http://down.example/page")).text == "page"
+    assert controller.stats()["open_circuits"] == 0
+
+    # Retry-After opens the circuit for as long as the host asked
+    retry = httpx.AsyncClient(transport=TrafficControlTransport(
+        httpx.MockTransport(lambda request: httpx.Response(429, headers={"Retry-After": "60"})), controller
+    ))
+    assert (await retry.get("http://busy.example/")).status_code == 429
+    with pytest.raises(HostUnavailable):
+        await retry.get("http://busy.example/")
+    assert controller.host("busy.example").breaker.retry_after > 50
+    await retry.aclose()
+    await client.aclose()
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_shares_results_and_prevents_stampedes(tmp_path):
+    """Test the TTL cache tiers, stale-while-revalidate and single computation under concurrency"""
+    calls = []
+
+    def compute(value, delay=0.1, fail=False):
+        async def run():
+            calls.append(value)
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError("lookup failed")
+            return {"value": value}
+        return run
+
+    # Two workers sharing one file: a burst of misses computes once
+    path = str(tmp_path / "shared.db")
+    worker_a = TTLCache("test", ttl=0.3, stale_ttl=10, shared=SQLiteTier(path))
+    worker_b = TTLCache("test", ttl=0.3, stale_ttl=10, shared=SQLiteTier(path))
+    results = await asyncio.gather(*(
+        worker.get("https://news.example/a", compute("v1")) for worker in (worker_a, worker_b) * 10
+    ))
+    assert results == [{"value": "v1"}] * 20 and calls == ["v1"]
+    assert worker_a.stats()["peer_waits"] + worker_b.stats()["peer_waits"] == 1
+    results[0]["value"] = "mutated"
+    assert await worker_a.get("https://news.example/a", compute("unused")) == {"value": "v1"}
+
+    # Stale entries are served at once while a single refresh runs
+    await asyncio.sleep(0.35)
+    stale = await asyncio.gather(*(worker_a.get("https://news.example/a", compute("v2")) for _ in range(5)))
+    assert stale == [{"value": "v1"}] * 5
+    await asyncio.sleep(0.2)
+    assert calls == ["v1", "v2"]
+    assert await worker_a.get("https://news.example/a", compute("unused")) == {"value": "v2"}
+    # ...and reach the other worker through the shared tier
+    worker_b.clear()
+    assert await worker_b.get("https://news.example/a", compute("unused")) == {"value": "v2"}
+    assert worker_b.stats()["shared_hits"] == 1
+
+    # A failed refresh keeps the stale value; a failed miss is not cached
+    await asyncio.sleep(0.35)
+    assert await worker_a.get("https://news.example/a", compute("v3", fail=True)) == {"value": "v2"}
+    await asyncio.sleep(0.3)
+    assert worker_a.stats()["refresh_failures"] == 1
+    with pytest.raises(RuntimeError):
+        await worker_a.get("https://news.example/b", compute("b1", fail=True))
+    assert await worker_a.get("https://news.example/b", compute("b2", delay=0)) == {"value": "b2"}
+
+    # Rewriting a key replaces its size rather than adding to it
+    tier = SQLiteTier(str(tmp_path / "rewrite.db"), max_bytes=4096)
+    entry = CacheEntry({"value": "x" * 1000}, fresh_until=time.time() + 60, stale_until=time.time() + 60)
+    for _ in range(20):
+        await tier.set("https://news.example/c", entry)
+    assert tier._bytes == len(entry.encode()) + len("https://news.example/c") and tier.evictions == 0
+    await tier.close()
+
+    # The memory tier is bounded
+    small = TTLCache("small", max_entries=3)
+    for i in range(10):
+        await small.get(str(i), compute(i, delay=0))
+    assert len(small) == 3 and small.stats()["evictions"] == 7
+    for cache in (worker_a, worker_b, small):
+        await cache.close()
+
+    # SourceVerifier checks each URL once per TTL, however many ask at once
+    verifier = SourceVerifier(cache=TTLCache("verify", ttl=60))
+    checked = []
+    check = verifier._check_domain_reputation
+
+    async def counting_check(domain):
+        checked.append(domain)
+        await asyncio.sleep(0.05)
+        return await check(domain)
+
+    verifier._check_domain_reputation = counting_check
+    results = await asyncio.gather(*(verifier.verify_source("https://www.reuters.com/world") for _ in range(10)))
+    assert checked == ["www.reuters.com"] and all(result["is_trusted"] for result in results)
+
+
+@pytest.mark.asyncio
+async def test_verify_sources_dedupes_domains_and_bounds_fact_checks():
+    """Test batch verification checks each domain once and queries fact-checkers concurrently"""
+    verifier = SourceVerifier(cache=TTLCache("verify_batch", ttl=60))
+    verifier.fact_checking_apis = {"fast": "https://fast.example", "slow": "https://slow.example"}
+    verifier.api_deadlines = {"fast": 1, "slow": 1}
+    checked = []
+    queried = []
+    check = verifier._check_domain_reputation
+    delays = {"fast": 0.3, "slow": 0.3}
+
+    async def counting_check(domain):
+        checked.append(domain)
+        return await check(domain)
+
+    async def query(service, endpoint, domain):
+        queried.append((service, domain))
+        await asyncio.sleep(delays[service])
+        return [{"service": service, "domain": domain}]
+
+    verifier._check_domain_reputation = counting_check
+    verifier._query_fact_checking_api = query
+    urls = [
+        "https://www.reuters.com/world",
+        "https://unknown.example/a",
+        "https://www.reuters.com/markets",
+        "https:///no-host",
+        "https://unknown.example/b",
+    ]
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await verifier.verify_sources(urls)
+    # Backends and domains run side by side rather than one after another
+    assert loop.time() - started < 0.55
+    assert list(results) == urls
+    assert sorted(checked) == ["unknown.example", "www.reuters.com"]
+    assert len(queried) == 4
+    assert results["https://www.reuters.com/markets"]["is_trusted"]
+    assert results["https://www.reuters.com/markets"]["source_url"] == "https://www.reuters.com/markets"
+    assert not results["https://unknown.example/b"]["is_trusted"]
+    assert {check["service"] for check in results["https://unknown.example/a"]["fact_checks"]} == {"fast", "slow"}
+    assert "error" in results["https:///no-host"]
+
+    # Cached per domain: other paths on a verified domain cost nothing
+    assert (await verifier.verify_source("https://www.reuters.com/business"))["is_trusted"]
+    assert len(checked) == 2 and len(queried) == 4
+
+    # A backend past its deadline is reported missing and the rest still returned
+    delays["slow"] = 5
+    result = await verifier.verify_source("https://apnews.com/article")
+    assert result["unavailable_services"] == ["slow"]
+    assert [check["service"] for check in result["fact_checks"]] == ["fast"]
+    await verifier.cache.close()